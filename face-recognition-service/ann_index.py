@@ -0,0 +1,242 @@
+"""
+فهرس البحث التقريبي - Approximate nearest-neighbour index (IVF-PQ)
+تجميع خشن (k-means) للمتجهات في قوائم، ثم ترميز البواقي بالتكميم الجدائي (PQ)
+إلى بايت لكل جزء. البحث يفحص nprobe قائمة فقط بجداول مسافات مسبقة الحساب.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+def nearest_centroids(data: np.ndarray, centroids: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """أقرب مركز لكل متجه (مسافة إقليدية) على أجزاء لتقليل الذاكرة"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assign = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk):
+        block = data[start:start + chunk]
+        assign[start:start + chunk] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return assign
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """k-means بسيط (Lloyd) مع إعادة تهيئة المجموعات الفارغة"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = nearest_centroids(data, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind='stable')
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+
+    return centroids
+
+
+class IVFPQIndex:
+    """فهرس IVF-PQ لحاصل الضرب الداخلي على متجهات مطبّعة"""
+
+    def __init__(self, nlist: int = 256, m: int = 64, nprobe: int = 8, seed: int = 0):
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids = None   # nlist × dim
+        self.codebooks = None   # m × ksub × dsub
+        self._ids: List[List[str]] = []
+        self._codes: List[np.ndarray] = []
+        self._location: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._location)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def save(self, path: str) -> None:
+        """حفظ المراكز وقواميس PQ فقط (الرموز تُعاد من المتجهات في كل عملية)"""
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, centroids=self.centroids, codebooks=self.codebooks,
+                     params=np.array([self.nlist, self.m, self.nprobe, self.seed]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'IVFPQIndex':
+        """فهرس مدرب فارغ من ملف save"""
+        with np.load(path) as data:
+            nlist, m, nprobe, seed = (int(v) for v in data['params'])
+            ann = cls(nlist=nlist, m=m, nprobe=nprobe, seed=seed)
+            ann.centroids = data['centroids']
+            ann.codebooks = data['codebooks']
+        ann._ids = [[] for _ in range(ann.nlist)]
+        ann._codes = [np.empty((0, ann.m), dtype=np.uint8) for _ in range(ann.nlist)]
+        return ann
+
+    def train(self, vectors: np.ndarray, max_samples: int = 65536) -> None:
+        """تدريب المراكز الخشنة وقواميس PQ على عينة من المتجهات"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        if dim % self.m != 0:
+            raise ValueError(f'حجم الـ embedding {dim} لا يقبل القسمة على m={self.m}')
+
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > max_samples:
+            vectors = vectors[rng.choice(len(vectors), max_samples, replace=False)]
+
+        centroids = kmeans(vectors, self.nlist, seed=self.seed)
+        residuals = vectors - centroids[nearest_centroids(vectors, centroids)]
+
+        dsub = dim // self.m
+        ksub = min(256, len(vectors))
+        codebooks = np.empty((self.m, ksub, dsub), dtype=np.float32)
+        for j in range(self.m):
+            codebooks[j] = kmeans(residuals[:, j * dsub:(j + 1) * dsub], ksub, iterations=10, seed=self.seed + j)
+
+        with self._lock:
+            self.nlist = len(centroids)
+            self.centroids = centroids
+            self.codebooks = codebooks
+            self._ids = [[] for _ in range(self.nlist)]
+            self._codes = [np.empty((0, self.m), dtype=np.uint8) for _ in range(self.nlist)]
+            self._location = {}
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """تحديد القائمة لكل متجه وترميز باقيه إلى m بايت"""
+        lists = nearest_centroids(vectors, self.centroids)
+        residuals = vectors - self.centroids[lists]
+        dsub = vectors.shape[1] // self.m
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = nearest_centroids(residuals[:, j * dsub:(j + 1) * dsub], self.codebooks[j])
+        return lists, codes
+
+    def add_many(self, user_ids: Iterable[str], vectors: np.ndarray) -> None:
+        """إضافة متجهات (مطبّعة) إلى القوائم بعد التدريب"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        lists, codes = self._encode(np.asarray(vectors, dtype=np.float32).reshape(len(user_ids), -1))
+        with self._lock:
+            for user_id in user_ids:
+                self._remove_locked(user_id)
+            for list_no in np.unique(lists):
+                members = np.flatnonzero(lists == list_no)
+                start = len(self._ids[list_no])
+                self._ids[list_no].extend(user_ids[i] for i in members)
+                self._codes[list_no] = np.concatenate((self._codes[list_no], codes[members]))
+                for offset, i in enumerate(members):
+                    self._location[user_ids[i]] = (int(list_no), start + offset)
+
+    def add(self, user_id: str, vector: np.ndarray) -> None:
+        self.add_many([user_id], vector)
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def _remove_locked(self, user_id: str):
+        location = self._location.pop(user_id, None)
+        if location is None:
+            return
+        list_no, pos = location
+        ids, codes = self._ids[list_no], self._codes[list_no]
+        last = len(ids) - 1
+        if pos != last:
+            ids[pos] = ids[last]
+            codes[pos] = codes[last]
+            self._location[ids[pos]] = (list_no, pos)
+        ids.pop()
+        self._codes[list_no] = codes[:last]
+
+    def search(self, query: np.ndarray, top_k: int, nprobe: int = None) -> List[Tuple[str, float]]:
+        """بحث تقريبي: فحص أقرب nprobe قائمة وحساب الدرجة من جداول PQ"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        query = np.asarray(query, dtype=np.float32)
+
+        coarse = self.centroids @ query
+        if nprobe < self.nlist:
+            probe_lists = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        else:
+            probe_lists = np.arange(self.nlist)
+
+        # q·(c + r) = q·c + Σ q_j·r_j: جدول واحد للاستعلام يصلح لكل القوائم
+        dsub = len(query) // self.m
+        table = np.einsum('jkd,jd->jk', self.codebooks, query.reshape(self.m, dsub))
+        subspaces = np.arange(self.m)
+
+        ids, scores = [], []
+        with self._lock:
+            for list_no in probe_lists:
+                codes = self._codes[list_no]
+                if len(codes) == 0:
+                    continue
+                scores.append(coarse[list_no] + table[subspaces, codes].sum(axis=1))
+                ids.extend(self._ids[list_no])
+
+        if not ids:
+            return []
+        scores = np.concatenate(scores)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [(ids[i], float(scores[i])) for i in best]
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = [len(ids) for ids in self._ids]
+            return {
+                'trained': self.trained,
+                'size': len(self._location),
+                'nlist': self.nlist,
+                'm': self.m,
+                'nprobe': self.nprobe,
+                'code_bytes': sum(c.nbytes for c in self._codes),
+                'largest_list': max(sizes) if sizes else 0
+            }
+
+
+def evaluate_recall(index, queries: np.ndarray, top_k: int, nprobes: Iterable[int]) -> List[dict]:
+    """مقارنة نتائج البحث التقريبي بالبحث الدقيق لكل قيمة nprobe
+
+    recall: نسبة نتائج top_k الدقيقة الموجودة في النتائج التقريبية
+    recall_at_1: نسبة الاستعلامات التي وُجد فيها أفضل تطابق دقيق (ما يهم للتعرف)
+    """
+    exact = []
+    started = time.perf_counter()
+    for query in queries:
+        exact.append([user_id for user_id, _ in index.search(query, top_k, exact=True)])
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    report = []
+    for nprobe in nprobes:
+        hits, expected, best_hits = 0, 0, 0
+        started = time.perf_counter()
+        for query, truth in zip(queries, exact):
+            found = {user_id for user_id, _ in index.search(query, top_k, nprobe=nprobe)}
+            hits += len(found.intersection(truth))
+            expected += len(truth)
+            best_hits += bool(truth) and truth[0] in found
+        report.append({
+            'nprobe': nprobe,
+            'recall': hits / expected if expected else 1.0,
+            'recall_at_1': best_hits / len(queries),
+            'mean_ms': (time.perf_counter() - started) * 1000 / len(queries),
+            'exact_mean_ms': exact_ms
+        })
+    return report
@@ -5,43 +5,299 @@
 
 import os
 import base64
+import functools
+import hashlib
+import hmac
 import json
 from io import BytesIO
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, g, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
 import numpy as np
-from PIL import Image
-from dotenv import load_dotenv
+from PIL import Image, ImageOps
 
-load_dotenv()
+from config import (
+    MATCH_THRESHOLD, MODEL_NAME, DETECTOR_BACKEND, MAX_IMAGE_SIZE, PRELOAD_MODEL,
+    MAX_IMAGE_PIXELS, MAX_REQUEST_SIZE, DECODE_MAX_SIDE,
+    BATCH_ENABLED, BATCH_MAX_SIZE, BATCH_WINDOW_MS, BATCH_QUEUE_SIZE,
+    BATCH_MAX_IMAGES, DECODE_WORKERS, COMPARE_MAX_CANDIDATES, MULTI_FACE_MAX_FACES,
+    STREAM_IOU_THRESHOLD, STREAM_MAX_MISSES, STREAM_QUALITY_GAIN, STREAM_MAX_EMBEDDINGS,
+    ANN_NLIST, ANN_M, ANN_NPROBE, ANN_RERANK,
+    EMBEDDING_STORE_DIR, STORE_HEADROOM, STORE_CHECKPOINT_BYTES, STORE_FSYNC,
+    VERIFY_CACHE_SIZE, VERIFY_CACHE_TTL, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL,
+    INFERENCE_PROCESSES, INFERENCE_QUEUE_SIZE, INFERENCE_TIMEOUT, INFERENCE_PIN_CPUS,
+    ADMIN_TOKEN, PROFILE_DIR, INFERENCE_BACKEND,
+    REPLAY_CHECK, REPLAY_MAX_DISTANCE, REPLAY_WINDOW, REPLAY_GRACE_SECONDS, REPLAY_MAX_HASHES, REPLAY_MAX_USERS,
+    REPLAY_STORE_DIR,
+    TEMPLATE_MAX, TEMPLATE_UPDATE_THRESHOLD, TEMPLATE_MIN_QUALITY, TEMPLATE_DUPLICATE_THRESHOLD, TEMPLATE_STORE_DIR
+)
+import inference
+from inference import embed_faces, scale_area, start_warm_up
+from face_pipeline import (
+    align_face, detect_single_face, embedding_result, extract_embedding, extract_embeddings,
+    locate_frame_faces, processing_error, replay_rejection
+)
+from inference_pool import InferencePool, PoolBusy
+from batching import MicroBatcher
+from face_index import FaceIndexRegistry, normalize
+from ann_index import evaluate_recall
+from embedding_store import EmbeddingStore
+from caches import LRUCache, SingleFlight
+from embedding_codec import (
+    EmbeddingFormatError, check_format, decode_embedding, decode_matrix, encode_embedding
+)
+from timings import start_request, stage, collected
+from metrics import Registry
+from profiling import Profiler
+from tracking import FaceTracker, face_quality
+from replay import ReplayDetector
+from templates import TemplateBank
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_SIZE
 CORS(app)
 
-# تحميل DeepFace بشكل كسول لتسريع بدء التشغيل
-deepface = None
+# مُجدول الدفعات (اختياري) لتجميع الطلبات المتزامنة في تمريرة واحدة
+batcher = MicroBatcher(
+    embed_faces,
+    max_batch_size=BATCH_MAX_SIZE,
+    window_ms=BATCH_WINDOW_MS,
+    max_queue_size=BATCH_QUEUE_SIZE
+) if BATCH_ENABLED else None
 
-def get_deepface():
-    global deepface
-    if deepface is None:
-        from deepface import DeepFace
-        deepface = DeepFace
-    return deepface
+# مجمع عمليات الاستدلال (اختياري): طابور محدود ورفض فوري عند الامتلاء
+inference_pool = InferencePool(
+    INFERENCE_PROCESSES,
+    queue_size=INFERENCE_QUEUE_SIZE,
+    timeout=INFERENCE_TIMEOUT,
+    pin_cpus=INFERENCE_PIN_CPUS
+) if INFERENCE_PROCESSES else None
 
-# إعدادات
-MATCH_THRESHOLD = float(os.getenv('MATCH_THRESHOLD', '0.6'))
-MODEL_NAME = os.getenv('MODEL_NAME', 'Facenet512')  # نموذج دقيق
-DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'opencv')  # أسرع
-MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', '10485760'))
+# فهارس الوجوه لكل شركة للتعرف 1:N، محفوظة على القرص إذا حُدد EMBEDDING_STORE_DIR
+embedding_store = EmbeddingStore(
+    EMBEDDING_STORE_DIR,
+    headroom=STORE_HEADROOM,
+    checkpoint_bytes=STORE_CHECKPOINT_BYTES,
+    fsync=STORE_FSYNC
+) if EMBEDDING_STORE_DIR else None
+face_indexes = FaceIndexRegistry(embedding_store)
+face_indexes.load_all()
 
+# قوالب التحقق المتعلمة لكل مستخدم (مركز وأمثلة) في سجل منفصل بجانب فهارس الشركات
+template_indexes = FaceIndexRegistry(EmbeddingStore(
+    TEMPLATE_STORE_DIR,
+    headroom=STORE_HEADROOM,
+    checkpoint_bytes=STORE_CHECKPOINT_BYTES,
+    fsync=STORE_FSYNC
+) if TEMPLATE_STORE_DIR else None)
+template_indexes.load_all()
+template_bank = TemplateBank(
+    template_indexes,
+    max_templates=TEMPLATE_MAX,
+    update_threshold=TEMPLATE_UPDATE_THRESHOLD,
+    duplicate_threshold=TEMPLATE_DUPLICATE_THRESHOLD
+)
 
-def decode_base64_image(base64_string: str) -> np.ndarray:
-    """تحويل صورة Base64 إلى numpy array"""
-    if ',' in base64_string:
-        base64_string = base64_string.split(',')[1]
+# ذاكرة مؤقتة للـ embeddings المرجعية المحملة بـ cache/warm لوضع التحقق بـ user_id
+reference_cache = LRUCache(max_size=VERIFY_CACHE_SIZE, ttl=VERIFY_CACHE_TTL)
+
+# ذاكرة مؤقتة لنتائج الاستخراج بمفتاح بصمة الصورة، مع دمج الطلبات المتطابقة المتزامنة
+embedding_cache = LRUCache(max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL) if EMBEDDING_CACHE_SIZE else None
+embedding_flights = SingleFlight()
+
+# أخطاء تتكرر حتماً لنفس البكسلات فتُحفظ مثل النجاح
+CACHEABLE_ERRORS = ('NO_FACE_FOUND', 'MULTIPLE_FACES', 'FACE_TOO_SMALL', 'IMAGE_TOO_DARK',
+                    'IMAGE_TOO_BRIGHT', 'IMAGE_TOO_BLURRY')
+
+# بصمات صور التحقق الناجحة لكل مستخدم لكشف إعادة إرسال صورة محفوظة قبل الاستدلال
+replay_detector = ReplayDetector(
+    max_distance=REPLAY_MAX_DISTANCE,
+    window=REPLAY_WINDOW,
+    grace=REPLAY_GRACE_SECONDS,
+    max_hashes=REPLAY_MAX_HASHES,
+    max_users=REPLAY_MAX_USERS,
+    directory=REPLAY_STORE_DIR,
+    compact_bytes=STORE_CHECKPOINT_BYTES,
+    fsync=STORE_FSYNC
+) if REPLAY_CHECK else None
+
+# التحليل عند الطلب لنسبة من استدعاءات get_face_embedding (يُفعّل من واجهة الإدارة)
+profiler = Profiler(PROFILE_DIR)
+
+# فك ترميز واكتشاف صور الدفعات بالتوازي
+executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='face-batch')
+
+
+# مقاييس Prometheus على /metrics (لكل عملية)
+metrics = Registry()
+request_seconds = metrics.histogram(
+    'face_request_duration_seconds', 'Request latency', ('endpoint', 'method', 'status'))
+stage_seconds = metrics.histogram(
+    'face_stage_duration_seconds', 'Per-stage latency (decode, detect, align, embed, ...)',
+    ('endpoint', 'stage'))
+error_counter = metrics.counter(
+    'face_errors_total', 'Failed responses by error_code', ('endpoint', 'error_code'))
+in_flight = metrics.gauge('face_requests_in_flight', 'Requests being processed', ('endpoint',))
+metrics.gauge(
+    'face_model_load_seconds', 'Embedding model load time',
+    function=lambda: inference_pool.load_seconds if inference_pool is not None else inference.model_load_seconds)
+metrics.gauge(
+    'face_inference_pending', 'Inference pool requests queued or running',
+    function=lambda: inference_pool.pending if inference_pool is not None else None)
+metrics.gauge(
+    'face_batch_queue_depth', 'Micro-batcher queue depth',
+    function=lambda: batcher.queue_depth if batcher is not None else None)
+detector_seconds = metrics.histogram(
+    'face_detector_duration_seconds', 'Detection latency per cascade tier', ('detector', 'outcome'))
+escalation_counter = metrics.counter(
+    'face_detector_escalations_total', 'Detections escalated to DETECTOR_FALLBACK', ('reason',))
+embedding_cache_counter = metrics.counter(
+    'face_embedding_cache_requests_total', 'Embedding cache lookups (hit, miss, coalesced)', ('result',))
+replay_counter = metrics.counter(
+    'face_replay_detected_total', 'Verification images rejected as near-duplicates of an earlier check-in')
+metrics.gauge(
+    'face_embedding_cache_size', 'Embedding cache entries',
+    function=lambda: len(embedding_cache) if embedding_cache is not None else None)
+stream_frame_counter = metrics.counter(
+    'face_stream_frames_total', 'Check-in stream frames processed')
+stream_embedding_counter = metrics.counter(
+    'face_stream_embeddings_total', 'Embeddings computed for check-in stream tracks (new or better quality)')
+template_update_counter = metrics.counter(
+    'face_template_updates_total', 'Verification templates learned from accepted check-ins', ('kind',))
+
+
+def endpoint_label() -> str:
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def server_timing(timings: dict) -> str:
+    return ', '.join(f'{name};dur={ms}' for name, ms in timings.items())
+
+
+@app.before_request
+def begin_request():
+    start_request()
+    g.in_flight_endpoint = endpoint_label()
+    in_flight.inc(endpoint=g.in_flight_endpoint)
+
+
+@app.after_request
+def record_request(response):
+    """تسجيل زمن الطلب ومراحله ورمز الخطأ، وإرجاع المراحل في ترويسة Server-Timing"""
+    endpoint = endpoint_label()
+    timings = collected()
+    for name, ms in timings.items():
+        if name != 'total':
+            stage_seconds.observe(ms / 1000, endpoint=endpoint, stage=name)
+    request_seconds.observe(timings.get('total', 0) / 1000, endpoint=endpoint,
+                            method=request.method, status=response.status_code)
+    
+    if response.status_code >= 400 and response.is_json:
+        error_code = (response.get_json(silent=True) or {}).get('error_code')
+        error_counter.inc(endpoint=endpoint, error_code=error_code or str(response.status_code))
+    
+    if timings:
+        response.headers['Server-Timing'] = server_timing(timings)
+    return response
+
+
+@app.teardown_request
+def end_request(exc):
+    # مع stream_with_context يُستدعى مرة ثانية بعد انتهاء البث
+    endpoint = g.pop('in_flight_endpoint', None)
+    if endpoint is not None:
+        in_flight.dec(endpoint=endpoint)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """مقاييس Prometheus (بصيغة النص)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+class ImageError(Exception):
+    """صورة غير صالحة أو تتجاوز الحدود (تُرفض قبل فك ترميزها)"""
+
+    def __init__(self, message: str, error_code: str = 'INVALID_IMAGE', status: int = 400):
+        super().__init__(message)
+        self.error_code = error_code
+        self.status = status
+
+
+class ParameterError(Exception):
+    """معامل طلب بنوع أو قيمة غير صالحة (INVALID_INPUT)"""
+
+
+def int_param(data: dict, name: str, default=None, minimum: int = None):
+    """معامل عدد صحيح من JSON أو النموذج أو الرابط (نص أرقام)، أو default عند غيابه"""
+    if name not in data:
+        return default
+    value = data[name]
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value)
+    elif not isinstance(value, int) or isinstance(value, bool):
+        raise ParameterError(f'{name} يجب أن يكون عدداً صحيحاً')
+    if minimum is not None and value < minimum:
+        raise ParameterError(f'{name} يجب أن يكون {minimum} أو أكثر')
+    return value
+
+
+def float_param(data: dict, name: str, default: float, minimum: float, maximum: float) -> float:
+    """معامل عددي بين minimum و maximum، أو default عند غيابه"""
+    if name not in data:
+        return default
+    value = data[name]
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ParameterError(f'{name} يجب أن يكون رقماً')
+    if not minimum <= value <= maximum:
+        raise ParameterError(f'{name} يجب أن يكون بين {minimum} و {maximum}')
+    return value
+
+
+def check_image_size(size: int):
+    """رفض الصورة حسب حجمها بالبايت قبل قراءتها أو فك ترميزها"""
+    if size > MAX_IMAGE_SIZE:
+        raise ImageError(
+            f'حجم الصورة يتجاوز الحد الأقصى ({MAX_IMAGE_SIZE} بايت)',
+            'IMAGE_TOO_LARGE', 413
+        )
+
+
+def read_limited(stream) -> bytes:
+    """قراءة صورة من تدفق دون تجاوز MAX_IMAGE_SIZE"""
+    image_data = stream.read(MAX_IMAGE_SIZE + 1)
+    check_image_size(len(image_data))
+    return image_data
+
+
+def decode_image_bytes(image_data: bytes) -> np.ndarray:
+    """تحويل بايتات صورة (JPEG/PNG) إلى numpy array"""
+    try:
+        image = Image.open(BytesIO(image_data))
+    except Exception:
+        raise ImageError('تعذر قراءة الصورة (الصيغ المدعومة JPEG و PNG)')
+    
+    # Image.open يقرأ الترويسة فقط: فحص الأبعاد قبل فك ترميز البكسلات
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        raise ImageError(
+            f'أبعاد الصورة تتجاوز الحد الأقصى ({MAX_IMAGE_PIXELS} بكسل)',
+            'IMAGE_TOO_LARGE', 413
+        )
     
-    image_data = base64.b64decode(base64_string)
-    image = Image.open(BytesIO(image_data))
+    # JPEG: تصغير أثناء فك الترميز (DCT) بمعامل 2 أو 4 أو 8 مع إبقاء الأبعاد ≥ DECODE_MAX_SIDE
+    ratio = DECODE_MAX_SIDE / max(image.size) if DECODE_MAX_SIDE else 1
+    if image.format == 'JPEG' and ratio < 1:
+        image.draft('RGB', (int(image.width * ratio), int(image.height * ratio)))
+    
+    # صور الجوال تُحفظ غالباً مدوّرة مع وسم EXIF للاتجاه
+    ImageOps.exif_transpose(image, in_place=True)
     
     if image.mode != 'RGB':
         image = image.convert('RGB')
@@ -49,77 +305,196 @@ def decode_base64_image(base64_string: str) -> np.ndarray:
     return np.array(image)
 
 
-def save_temp_image(image_array: np.ndarray) -> str:
-    """حفظ الصورة مؤقتاً للمعالجة"""
-    import tempfile
-    img = Image.fromarray(image_array)
-    temp_file = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-    img.save(temp_file.name, 'JPEG', quality=95)
-    return temp_file.name
+def decode_base64_image(base64_string: str) -> np.ndarray:
+    """تحويل صورة Base64 إلى numpy array"""
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
+    
+    check_image_size(len(base64_string) * 3 // 4)
+    try:
+        data = base64.b64decode(base64_string)
+    except ValueError:
+        # binascii.Error (حشو خاطئ) أو محارف غير ASCII
+        raise ImageError('ترميز Base64 للصورة غير صالح')
+    return decode_image_bytes(data)
+
+
+def load_image(value) -> np.ndarray:
+    """صورة من حقل الطلب: نص Base64 أو ملف multipart أو بايتات جسم الطلب"""
+    with stage('decode'):
+        if isinstance(value, FileStorage):
+            return decode_image_bytes(read_limited(value.stream))
+        if isinstance(value, bytes):
+            return decode_image_bytes(value)
+        if not isinstance(value, str):
+            raise ImageError('صيغة حقل الصورة غير صالحة')
+        return decode_base64_image(value)
+
+
+RAW_IMAGE_TYPES = ('application/octet-stream', 'image/jpeg', 'image/png')
+
+
+def parse_form_value(value: str):
+    """تحويل قيم النماذج ومعاملات الرابط النصية إلى أنواعها"""
+    if value in ('true', 'false'):
+        return value == 'true'
+    if value[:1] in ('[', '{'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def request_too_large() -> ImageError:
+    return ImageError(f'حجم الطلب يتجاوز الحد الأقصى ({MAX_REQUEST_SIZE} بايت)', 'IMAGE_TOO_LARGE', 413)
 
 
-def get_face_embedding(image: np.ndarray) -> dict:
-    """استخراج embedding للوجه من الصورة"""
-    temp_path = None
+def request_json():
+    """JSON الطلب (أو None)؛ الجسم الأكبر من MAX_REQUEST_SIZE يُرفض بـ IMAGE_TOO_LARGE"""
     try:
-        DeepFace = get_deepface()
-        
-        # حفظ الصورة مؤقتاً
-        temp_path = save_temp_image(image)
-        
-        # استخراج الـ embedding
-        embeddings = DeepFace.represent(
-            img_path=temp_path,
-            model_name=MODEL_NAME,
-            detector_backend=DETECTOR_BACKEND,
-            enforce_detection=True,
-            align=True
-        )
-        
-        if not embeddings or len(embeddings) == 0:
-            return {
-                'success': False,
-                'error': 'لم يتم العثور على وجه في الصورة',
-                'error_code': 'NO_FACE_FOUND'
-            }
-        
-        if len(embeddings) > 1:
-            return {
-                'success': False,
-                'error': 'تم العثور على أكثر من وجه. يرجى التأكد من وجود وجه واحد فقط.',
-                'error_code': 'MULTIPLE_FACES'
-            }
-        
-        face_data = embeddings[0]
-        embedding = face_data['embedding']
-        
-        return {
-            'success': True,
-            'embedding': embedding,
-            'embedding_size': len(embedding),
-            'face_location': face_data.get('facial_area', {})
-        }
+        return request.get_json(silent=True)
+    except RequestEntityTooLarge:
+        raise request_too_large()
+
+
+@app.errorhandler(ImageError)
+def image_error(e):
+    """ImageError خارج try في الواجهة (مثل جسم JSON أكبر من MAX_REQUEST_SIZE)"""
+    return error_response(str(e), e.error_code, e.status)
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_entity_too_large(e):
+    return error_response(str(request_too_large()), 'IMAGE_TOO_LARGE', 413)
+
+
+def read_request_data():
+    """بيانات الطلب من JSON أو multipart/form-data أو جسم صورة خام
+    
+    multipart: الصور ملفات (image أو image1 و image2) وباقي الحقول نصية.
+    جسم خام (JPEG/PNG): الصورة هي image والحقول الأخرى من معاملات الرابط.
+    الحجم يُفحص قبل قراءة الصورة أو فك ترميزها.
+    """
+    try:
+        if request.mimetype == 'multipart/form-data':
+            data = {key: parse_form_value(value) for key, value in request.form.items()}
+            data.update(request.files.to_dict())
+            return data
         
-    except Exception as e:
-        error_msg = str(e)
-        if 'Face could not be detected' in error_msg:
-            return {
-                'success': False,
-                'error': 'لم يتم العثور على وجه واضح في الصورة. تأكد من الإضاءة الجيدة ووضوح الوجه.',
-                'error_code': 'NO_FACE_FOUND'
-            }
-        return {
-            'success': False,
-            'error': f'خطأ في معالجة الصورة: {error_msg}',
-            'error_code': 'PROCESSING_ERROR'
-        }
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
+        if request.mimetype in RAW_IMAGE_TYPES:
+            if request.content_length is not None:
+                check_image_size(request.content_length)
+            data = {key: parse_form_value(value) for key, value in request.args.items()}
+            data['image'] = read_limited(request.stream)
+            return data
+    except RequestEntityTooLarge:
+        raise request_too_large()
+    
+    return request_json()
+
+
+@profiler.profiled_call
+def get_face_embedding(image: np.ndarray, replay_key: tuple = None) -> dict:
+    """استخراج embedding للوجه من الصورة، من الذاكرة المؤقتة إن سبق استخراجه
+    
+    الطلبات المتزامنة لنفس الصورة تنتظر استخراجاً واحداً. يُرجع نسخة يمكن تعديلها.
+    مع replay_key (company_id, user_id) تُفحص بصمة الوجه بعد الاكتشاف وقبل الـ embedding
+    (REPLAY_DETECTED)، وتُرجع في face_hash لتسجيلها بعد التحقق الناجح.
+    """
+    replay_check = replay_checker(replay_key)
+    if embedding_cache is None:
+        return compute_face_embedding(image, replay_check)
+    
+    with stage('hash'):
+        key = image_key(image)
+    cached = embedding_cache.get(key)
+    if cached is not None and (replay_check is None or 'face_hash' in cached or not cached['success']):
+        embedding_cache_counter.inc(result='hit')
+        result = dict(cached)
+        face_hash = result.pop('face_hash', None)
+        if replay_check is not None and face_hash is not None:
+            replay = replay_check(face_hash)
+            if replay is not None:
+                return record_replay(replay_rejection(replay))
+            result['face_hash'] = face_hash
+        return result
+    
+    if replay_check is not None:
+        # الفحص خاص بالمستخدم فلا يُشارك استخراجاً متزامناً لطلب آخر
+        embedding_cache_counter.inc(result='miss')
+        return dict(cache_result(key, compute_face_embedding(image, replay_check)))
+    
+    result, shared = embedding_flights.do(key, lambda: cache_result(key, compute_face_embedding(image)))
+    embedding_cache_counter.inc(result='coalesced' if shared else 'miss')
+    return dict(result)
+
+
+def replay_checker(replay_key: tuple):
+    """فحص بصمة الوجه لمستخدم: شجرة BK مباشرة، أو نسخة من بصماته لمجمع العمليات"""
+    if replay_detector is None or replay_key is None:
+        return None
+    if inference_pool is not None:
+        return replay_detector.snapshot(replay_key)
+    return functools.partial(replay_detector.check, replay_key)
+
+
+def record_replay(result: dict) -> dict:
+    if result.get('error_code') == 'REPLAY_DETECTED':
+        replay_detector.count_detected()
+        replay_counter.inc()
+    return result
+
+
+def compute_face_embedding(image: np.ndarray, replay_check=None) -> dict:
+    """استخراج embedding للوجه من الصورة (في مجمع العمليات إن كان مفعلاً)"""
+    if inference_pool is not None:
+        result = inference_pool.run(image, replay_check=replay_check)
+    else:
+        result = extract_embedding(image, batcher.submit if batcher is not None else None, replay_check)
+    return record_replay(record_detection(result))
+
+
+def get_face_embeddings(image: np.ndarray, max_faces: int = MULTI_FACE_MAX_FACES) -> dict:
+    """استخراج embeddings لكل الوجوه في الصورة في تمريرة واحدة (وضع الكشك)"""
+    if inference_pool is not None:
+        result = inference_pool.run(image, max_faces)
+    else:
+        result = extract_embeddings(image, max_faces)
+    return record_detection(result)
+
+
+def image_key(image: np.ndarray) -> tuple:
+    """بصمة BLAKE2b لبكسلات الصورة بعد فك الترميز مع أبعادها"""
+    digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16).digest()
+    return image.shape + (digest,)
+
+
+def cache_result(key: tuple, result: dict) -> dict:
+    if result['success'] or result.get('error_code') in CACHEABLE_ERRORS:
+        embedding_cache.put(key, result)
+    return result
+
+
+def record_detection(result: dict) -> dict:
+    """تسجيل زمن كل مستوى اكتشاف والتصعيد في المقاييس وحذف التفاصيل من الرد"""
+    detection = result.pop('detection', None)
+    if detection is not None:
+        for tier in detection['tiers']:
+            detector_seconds.observe(tier['ms'] / 1000, detector=tier['detector'], outcome=tier['outcome'])
+        if detection['escalated']:
+            escalation_counter.inc(reason=detection['escalated'])
+    return result
 
 
 def compare_faces(embedding1: list, embedding2: list) -> dict:
     """مقارنة وجهين"""
+    with stage('compare'):
+        return compare_embeddings(embedding1, embedding2)
+
+
+def compare_embeddings(embedding1: list, embedding2: list) -> dict:
+    """التشابه بالكوساين والمسافة الإقليدية بين embedding-ين"""
     try:
         arr1 = np.array(embedding1)
         arr2 = np.array(embedding2)
@@ -148,7 +523,7 @@ def compare_faces(embedding1: list, embedding2: list) -> dict:
         
         return {
             'success': True,
-            'is_match': is_match,
+            'is_match': bool(is_match),
             'distance': float(distance),
             'similarity': float(similarity),
             'confidence': float(confidence),
@@ -163,6 +538,109 @@ def compare_faces(embedding1: list, embedding2: list) -> dict:
         }
 
 
+def busy_response(e: PoolBusy):
+    """رد فوري عند امتلاء طابور الاستدلال مع Retry-After"""
+    response, status = error_response(str(e), e.error_code, 503)
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, status
+
+
+def error_response(message: str, error_code: str, status: int = 400):
+    """رد خطأ بالشكل الموحد للخدمة"""
+    return jsonify({
+        'success': False,
+        'error': message,
+        'error_code': error_code
+    }), status
+
+
+def with_timings(result: dict, data: dict = None) -> dict:
+    """إضافة توقيتات المراحل (ملي ثانية) إلى الرد عند طلب include_timings"""
+    requested = (data or {}).get('include_timings', request.args.get('include_timings', False))
+    if requested in (True, 'true', '1'):
+        result['timings_ms'] = collected()
+    return result
+
+
+def embedding_format(data: dict = None) -> str:
+    """صيغة الـ embeddings في الطلب والرد (json أو f32b64 أو f16b64)"""
+    fmt = (data or {}).get('embedding_format') or request.args.get('embedding_format', 'json')
+    return check_format(fmt)
+
+
+def with_embedding_format(result: dict, fmt: str, field: str = 'embedding') -> dict:
+    """تحويل حقل الـ embedding في الرد إلى الصيغة المطلوبة"""
+    if fmt == 'json' or result.get(field) is None:
+        return result
+    return {**result, field: encode_embedding(result[field], fmt), 'embedding_format': fmt}
+
+
+def resolve_embedding(data: dict):
+    """الحصول على embedding من الطلب: مباشرة أو باستخراجه من الصورة"""
+    if 'embedding' in data:
+        return decode_embedding(data['embedding'], embedding_format(data)), None
+    
+    if 'image' in data:
+        result = get_face_embedding(load_image(data['image']))
+        if not result['success']:
+            return None, result
+        return result['embedding'], None
+    
+    return None, {
+        'success': False,
+        'error': 'الصورة أو الـ embedding مطلوب',
+        'error_code': 'MISSING_IMAGE'
+    }
+
+
+def compare_many(probe, candidates: np.ndarray):
+    """التشابه والمسافة بين embedding واحد ومصفوفة مرشحين بضرب مصفوفة × متجه واحد
+    
+    نفس مقاييس compare_embeddings: التشابه = (الكوساين + 1) / 2، والمسافة الإقليدية
+    من |a|² + |b|² - 2a·b بنفس حاصل الضرب بدل طرح كل صف.
+    """
+    probe = np.asarray(probe, dtype=np.float32)
+    if candidates.ndim != 2 or candidates.shape[1] != probe.shape[0]:
+        raise ValueError(f'حجم الـ embeddings المرشحة لا يطابق حجم الـ embedding ({probe.shape[0]})')
+    
+    dots = candidates @ probe
+    probe_sq = float(probe @ probe)
+    candidate_sq = np.einsum('ij,ij->i', candidates, candidates)
+    norms = np.sqrt(candidate_sq * probe_sq)
+    cosine = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+    similarities = (cosine + 1) / 2
+    distances = np.sqrt(np.maximum(candidate_sq + probe_sq - 2 * dots, 0))
+    return similarities, distances
+
+
+def compare_templates(templates: np.ndarray, embedding: np.ndarray) -> dict:
+    """مقارنة وجه بكل قوالب المستخدم وإرجاع أفضلها بنفس شكل compare_faces"""
+    with stage('compare'):
+        similarities, distances = compare_many(embedding, templates)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        is_match = similarity >= MATCH_THRESHOLD
+        return {
+            'is_match': is_match,
+            'similarity': similarity,
+            'distance': float(distances[best]),
+            'confidence': similarity if is_match else similarity * 0.5,
+            'threshold': MATCH_THRESHOLD
+        }
+
+
+def match_result(user_id: str, cosine_similarity: float) -> dict:
+    """نتيجة تطابق مرشح بنفس مقياس compare_faces"""
+    similarity = (cosine_similarity + 1) / 2
+    is_match = similarity >= MATCH_THRESHOLD
+    return {
+        'user_id': user_id,
+        'is_match': is_match,
+        'similarity': similarity,
+        'confidence': similarity if is_match else similarity * 0.5
+    }
+
+
 # ==================== API Endpoints ====================
 
 @app.route('/health', methods=['GET'])
@@ -172,15 +650,50 @@ def health_check():
         'status': 'healthy',
         'service': 'Face Recognition Service (DeepFace)',
         'version': '1.0.0',
-        'model': MODEL_NAME
+        'model': MODEL_NAME,
+        'batching': BATCH_ENABLED
     })
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """الجاهزية: 503 حتى ينتهي إحماء النموذج في هذه العملية (مع PRELOAD_MODEL)"""
+    if inference_pool is not None:
+        ready, error = inference_pool.ready, inference_pool.error
+    else:
+        ready, error = inference.ready.is_set() or not PRELOAD_MODEL, inference.warm_up_error
+    return jsonify({
+        'ready': ready,
+        'model': MODEL_NAME,
+        'detector': DETECTOR_BACKEND,
+        'backend': INFERENCE_BACKEND,
+        'model_loaded': inference.model is not None,
+        'model_load_seconds': inference.model_load_seconds,
+        'error': error
+    }), 200 if ready else 503
+
+
+@app.route('/api/face/batching/stats', methods=['GET'])
+def batching_stats():
+    """إحصاءات مُجدول الدفعات"""
+    if batcher is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **batcher.stats()})
+
+
+@app.route('/api/face/pool/stats', methods=['GET'])
+def pool_stats():
+    """إحصاءات مجمع عمليات الاستدلال: الطابور والرفض وزمن الانتظار مقابل المعالجة"""
+    if inference_pool is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **inference_pool.stats()})
+
+
 @app.route('/api/face/detect', methods=['POST'])
 def detect_face():
     """اكتشاف الوجه واستخراج الـ embedding"""
     try:
-        data = request.get_json()
+        data = read_request_data()
         
         if not data or 'image' not in data:
             return jsonify({
@@ -189,14 +702,157 @@ def detect_face():
                 'error_code': 'MISSING_IMAGE'
             }), 400
         
-        image = decode_base64_image(data['image'])
+        fmt = embedding_format(data)
+        image = load_image(data['image'])
         result = get_face_embedding(image)
         
         if result['success']:
-            return jsonify(result), 200
+            return jsonify(with_timings(with_embedding_format(result, fmt), data)), 200
         else:
-            return jsonify(result), 400
+            return jsonify(with_timings(result, data)), 400
             
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'خطأ في الخادم: {str(e)}',
+            'error_code': 'SERVER_ERROR'
+        }), 500
+
+
+def read_batch_images() -> list:
+    """قراءة صور الدفعة من JSON (images) أو من multipart (عدة ملفات images)"""
+    try:
+        if request.files:
+            return [read_limited(f.stream) for f in request.files.getlist('images')]
+    except RequestEntityTooLarge:
+        raise request_too_large()
+    
+    data = request_json() or {}
+    images = data.get('images')
+    return images if isinstance(images, list) else []
+
+
+def decode_batch_item(source) -> np.ndarray:
+    """فك ترميز عنصر دفعة: بايتات ملف أو Base64"""
+    return load_image(source)
+
+
+def invalid_image_error(index: int, e: Exception) -> dict:
+    return {
+        'index': index,
+        'success': False,
+        'error': f'تعذر قراءة الصورة: {str(e)}',
+        'error_code': e.error_code if isinstance(e, ImageError) else 'INVALID_IMAGE'
+    }
+
+
+def detect_batch_item(index: int, source) -> dict:
+    """فك الترميز واكتشاف الوجه لعنصر واحد في الدفعة"""
+    try:
+        image = decode_batch_item(source)
+    except Exception as e:
+        return invalid_image_error(index, e)
+    
+    detected = record_detection(detect_single_face(image))
+    detected['index'] = index
+    return detected
+
+
+def embed_batch_item(index: int, source) -> dict:
+    """معالجة عنصر دفعة كاملاً (للبث عند الانتهاء)"""
+    try:
+        image = decode_batch_item(source)
+    except Exception as e:
+        return invalid_image_error(index, e)
+    
+    try:
+        result = get_face_embedding(image)
+    except PoolBusy as e:
+        result = {'success': False, 'error': str(e), 'error_code': e.error_code}
+    result['index'] = index
+    return result
+
+
+def wants_ndjson() -> bool:
+    return (request.args.get('stream', 'false').lower() == 'true'
+            or 'application/x-ndjson' in request.headers.get('Accept', ''))
+
+
+@app.route('/api/face/detect/batch', methods=['POST'])
+def detect_face_batch():
+    """اكتشاف الوجوه واستخراج الـ embeddings لعدة صور في طلب واحد"""
+    try:
+        fmt = embedding_format(request_json())
+        sources = read_batch_images()
+        
+        if not sources:
+            return jsonify({
+                'success': False,
+                'error': 'الصور مطلوبة',
+                'error_code': 'MISSING_IMAGE'
+            }), 400
+        
+        if len(sources) > BATCH_MAX_IMAGES:
+            return jsonify({
+                'success': False,
+                'error': f'الحد الأقصى {BATCH_MAX_IMAGES} صورة في الطلب الواحد',
+                'error_code': 'TOO_MANY_IMAGES'
+            }), 400
+        
+        # بث النتائج NDJSON فور انتهاء كل صورة
+        if wants_ndjson():
+            def generate():
+                futures = [executor.submit(embed_batch_item, i, s) for i, s in enumerate(sources)]
+                for future in as_completed(futures):
+                    yield json.dumps(with_embedding_format(future.result(), fmt), ensure_ascii=False) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        # مع مجمع العمليات: كل صورة مهمة مستقلة في الطابور
+        if inference_pool is not None:
+            results = list(executor.map(embed_batch_item, range(len(sources)), sources))
+            return jsonify({
+                'success': True,
+                'count': len(results),
+                'succeeded': sum(1 for r in results if r['success']),
+                'results': [with_embedding_format(r, fmt) for r in results]
+            }), 200
+        
+        # فك الترميز والاكتشاف بالتوازي ثم الـ embedding في تمريرات مجمعة
+        results = list(executor.map(detect_batch_item, range(len(sources)), sources))
+        detected = [r for r in results if r['success']]
+        
+        for start in range(0, len(detected), BATCH_MAX_SIZE):
+            chunk = detected[start:start + BATCH_MAX_SIZE]
+            try:
+                embeddings = embed_faces([r['face']['face'] for r in chunk])
+            except Exception as e:
+                for r in chunk:
+                    results[r['index']] = {'index': r['index'], **processing_error(e)}
+                continue
+            
+            for r, embedding in zip(chunk, embeddings):
+                results[r['index']] = {'index': r['index'], **embedding_result(r['face'], embedding), **r['quality']}
+        
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'succeeded': sum(1 for r in results if r['success']),
+            'results': [with_embedding_format(r, fmt) for r in results]
+        }), 200
+        
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -209,7 +865,7 @@ def detect_face():
 def compare_faces_endpoint():
     """مقارنة وجهين"""
     try:
-        data = request.get_json()
+        data = read_request_data()
         
         if not data:
             return jsonify({
@@ -218,13 +874,14 @@ def compare_faces_endpoint():
                 'error_code': 'MISSING_DATA'
             }), 400
         
+        fmt = embedding_format(data)
         embedding1 = None
         embedding2 = None
         
         # مقارنة صورتين
         if 'image1' in data and 'image2' in data:
-            img1 = decode_base64_image(data['image1'])
-            img2 = decode_base64_image(data['image2'])
+            img1 = load_image(data['image1'])
+            img2 = load_image(data['image2'])
             
             result1 = get_face_embedding(img1)
             if not result1['success']:
@@ -247,9 +904,9 @@ def compare_faces_endpoint():
         
         # مقارنة embedding مع صورة
         elif 'embedding' in data and 'image' in data:
-            embedding1 = data['embedding']
+            embedding1 = decode_embedding(data['embedding'], fmt)
             
-            img = decode_base64_image(data['image'])
+            img = load_image(data['image'])
             result = get_face_embedding(img)
             if not result['success']:
                 return jsonify(result), 400
@@ -258,8 +915,8 @@ def compare_faces_endpoint():
         
         # مقارنة embedding-ين
         elif 'embedding1' in data and 'embedding2' in data:
-            embedding1 = data['embedding1']
-            embedding2 = data['embedding2']
+            embedding1 = decode_embedding(data['embedding1'], fmt)
+            embedding2 = decode_embedding(data['embedding2'], fmt)
         
         else:
             return jsonify({
@@ -271,10 +928,16 @@ def compare_faces_endpoint():
         result = compare_faces(embedding1, embedding2)
         
         if result['success']:
-            return jsonify(result), 200
+            return jsonify(with_timings(result, data)), 200
         else:
             return jsonify(result), 400
             
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -283,11 +946,88 @@ def compare_faces_endpoint():
         }), 500
 
 
+@app.route('/api/face/compare/many', methods=['POST'])
+def compare_many_endpoint():
+    """مقارنة صورة أو embedding واحد مع مصفوفة embeddings في عملية واحدة"""
+    try:
+        data = read_request_data()
+        
+        if not data:
+            return error_response('البيانات مطلوبة', 'MISSING_DATA')
+        
+        if not data.get('candidates'):
+            return error_response('الـ embeddings المرشحة مطلوبة', 'MISSING_EMBEDDING')
+        
+        top_k = int_param(data, 'top_k')
+        
+        probe, error = resolve_embedding(data)
+        if error:
+            return jsonify(error), 400
+        probe = np.asarray(probe, dtype=np.float32)
+        
+        with stage('decode_candidates'):
+            candidates = decode_matrix(data['candidates'], embedding_format(data), dim=len(probe))
+        if len(candidates) > COMPARE_MAX_CANDIDATES:
+            return error_response(f'الحد الأقصى {COMPARE_MAX_CANDIDATES} مرشح في الطلب الواحد',
+                                  'TOO_MANY_CANDIDATES')
+        
+        ids = data.get('ids')
+        if ids is not None and len(ids) != len(candidates):
+            return error_response('عدد ids لا يطابق عدد المرشحين', 'INVALID_INPUT')
+        
+        with stage('compare'):
+            similarities, distances = compare_many(probe, candidates)
+            matched = similarities >= MATCH_THRESHOLD
+            order = np.arange(len(candidates))
+            if top_k is not None:
+                top_k = min(max(1, top_k), len(candidates))
+                order = np.argpartition(-similarities, top_k - 1)[:top_k]
+                order = order[np.argsort(-similarities[order], kind='stable')]
+        
+        results = []
+        for i, similarity, distance, is_match in zip(
+                order.tolist(), similarities[order].tolist(), distances[order].tolist(), matched[order].tolist()):
+            row = {
+                'index': i,
+                'is_match': is_match,
+                'similarity': similarity,
+                'distance': distance,
+                'confidence': similarity if is_match else similarity * 0.5
+            }
+            if ids is not None:
+                row['id'] = ids[i]
+            results.append(row)
+        
+        best = int(np.argmax(similarities))
+        return jsonify(with_timings({
+            'success': True,
+            'count': len(candidates),
+            'matched': int(matched.sum()),
+            'best_index': best,
+            'best_similarity': float(similarities[best]),
+            'threshold': MATCH_THRESHOLD,
+            'results': results
+        }, data)), 200
+        
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
+    except ParameterError as e:
+        return error_response(str(e), 'INVALID_INPUT')
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
 @app.route('/api/face/register', methods=['POST'])
 def register_face():
     """تسجيل وجه جديد"""
     try:
-        data = request.get_json()
+        data = read_request_data()
         
         if not data or 'image' not in data:
             return jsonify({
@@ -296,7 +1036,8 @@ def register_face():
                 'error_code': 'MISSING_IMAGE'
             }), 400
         
-        image = decode_base64_image(data['image'])
+        fmt = embedding_format(data)
+        image = load_image(data['image'])
         result = get_face_embedding(image)
         
         if result['success']:
@@ -305,16 +1046,24 @@ def register_face():
                 'message': 'تم تسجيل الوجه بنجاح',
                 'embedding': result['embedding'],
                 'embedding_size': result['embedding_size'],
-                'face_location': result['face_location']
+                'face_location': result['face_location'],
+                'quality_score': result['quality_score'],
+                'quality': result['quality']
             }
             
             if 'user_id' in data:
                 response['user_id'] = data['user_id']
             
-            return jsonify(response), 200
+            return jsonify(with_timings(with_embedding_format(response, fmt), data)), 200
         else:
-            return jsonify(result), 400
+            return jsonify(with_timings(result, data)), 400
             
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -327,7 +1076,7 @@ def register_face():
 def verify_face():
     """التحقق من الوجه"""
     try:
-        data = request.get_json()
+        data = read_request_data()
         
         if not data:
             return jsonify({
@@ -343,31 +1092,79 @@ def verify_face():
                 'error_code': 'MISSING_IMAGE'
             }), 400
         
-        if 'stored_embedding' not in data:
+        # وضع user_id: الـ embedding المرجعي من الذاكرة المؤقتة أو فهرس الشركة
+        by_user = 'stored_embedding' not in data and 'user_id' in data
+        
+        if not by_user and 'stored_embedding' not in data:
             return jsonify({
                 'success': False,
                 'error': 'الـ embedding المُسجل مطلوب',
                 'error_code': 'MISSING_EMBEDDING'
             }), 400
         
-        image = decode_base64_image(data['image'])
-        result = get_face_embedding(image)
+        fmt = embedding_format(data)
+        if by_user:
+            stored_embedding = lookup_reference_embedding(data.get('company_id'), data['user_id'])
+            if stored_embedding is None:
+                return error_response('لا يوجد embedding مسجل لهذا المستخدم', 'EMBEDDING_NOT_FOUND', 404)
+        else:
+            stored_embedding = decode_embedding(data['stored_embedding'], fmt)
+        
+        image = load_image(data['image'])
+        # بعد الاكتشاف وقبل النموذج: هل أُرسل هذا الوجه (أو نسخة معاد ضغطها) في تحقق ناجح سابق؟
+        replay_key = (str(data.get('company_id', '')), str(data['user_id'])) if 'user_id' in data else None
+        result = get_face_embedding(image, replay_key)
+        image_hash = result.pop('face_hash', None)
         
+        if result.get('error_code') == 'REPLAY_DETECTED':
+            return jsonify(with_timings(result, data)), 400
         if not result['success']:
             return jsonify(result), 400
         
-        comparison = compare_faces(data['stored_embedding'], result['embedding'])
+        if by_user:
+            # كل قوالب المستخدم (التسجيل والمركز والأمثلة) بضرب مصفوفة واحد وأفضل تشابه
+            new_embedding = normalize(result['embedding'])
+            reference = template_bank.matrix(str(data['company_id']), str(data['user_id']), stored_embedding) \
+                if data.get('company_id') is not None else stored_embedding[np.newaxis]
+            comparison = compare_templates(reference, new_embedding)
+        else:
+            comparison = compare_faces(stored_embedding, result['embedding'])
         
-        return jsonify({
+        response = {
             'success': True,
             'verified': comparison['is_match'],
             'confidence': comparison['confidence'],
             'distance': comparison['distance'],
             'similarity': comparison['similarity'],
             'threshold': comparison['threshold'],
-            'new_embedding': result['embedding']
-        }), 200
+            'quality_score': result['quality_score']
+        }
         
+        if comparison['is_match'] and replay_detector is not None and image_hash is not None:
+            replay_detector.record(replay_key, image_hash)
+        
+        if by_user:
+            response['templates'] = len(reference)
+            if (comparison['is_match'] and data.get('company_id') is not None
+                    and result['quality_score'] >= TEMPLATE_MIN_QUALITY):
+                learned = template_bank.update(
+                    str(data['company_id']), str(data['user_id']), stored_embedding, new_embedding)
+                if learned:
+                    template_update_counter.inc(kind=learned)
+                response['template_updated'] = learned
+        
+        # في وضع user_id لا يُرسل الـ embedding إلا عند طلبه
+        if not by_user or data.get('return_embedding', False):
+            response['new_embedding'] = result['embedding']
+        
+        return jsonify(with_timings(with_embedding_format(response, fmt, 'new_embedding'), data)), 200
+        
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -376,6 +1173,626 @@ def verify_face():
         }), 500
 
 
+def admin_error():
+    """التحقق من ترويسة X-Admin-Token لواجهات الإدارة"""
+    if not ADMIN_TOKEN:
+        return error_response('واجهات الإدارة معطلة (ADMIN_TOKEN غير مُعد)', 'ADMIN_DISABLED', 403)
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return error_response('رمز الإدارة غير صحيح', 'UNAUTHORIZED', 401)
+    return None
+
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """حالة التحليل عند الطلب أو تفعيله/إيقافه لكل العمليات"""
+    error = admin_error()
+    if error:
+        return error
+    
+    if request.method == 'GET':
+        return jsonify({'success': True, **profiler.status()})
+    
+    data = request_json() or {}
+    try:
+        profiler.configure(
+            enabled=bool(data.get('enabled', True)),
+            sample_rate=float(data.get('sample_rate', 0.01)),
+            mode=data.get('mode', 'cprofile'),
+            interval_ms=float(data.get('interval_ms', 5))
+        )
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_INPUT')
+    return jsonify({'success': True, **profiler.status()})
+
+
+@app.route('/api/admin/profiling/download', methods=['GET'])
+def admin_profiling_download():
+    """تنزيل النتائج المجمعة: pstats (ملف cProfile) أو text أو folded (لـ flamegraph)"""
+    error = admin_error()
+    if error:
+        return error
+    
+    fmt = request.args.get('format', 'pstats')
+    if fmt == 'pstats':
+        body, mimetype, filename = profiler.aggregate_pstats(), 'application/octet-stream', 'face-service.prof'
+    elif fmt == 'text':
+        body, mimetype, filename = profiler.aggregate_text(), 'text/plain', 'face-service.txt'
+    elif fmt == 'folded':
+        body, mimetype, filename = profiler.aggregate_folded(), 'text/plain', 'face-service.folded'
+    else:
+        return error_response('format يجب أن يكون pstats أو text أو folded', 'INVALID_INPUT')
+    
+    if body is None:
+        return error_response('لا توجد نتائج تحليل بعد', 'NO_PROFILES', 404)
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@app.route('/api/admin/profiling/results', methods=['DELETE'])
+def admin_profiling_clear():
+    """حذف نتائج التحليل المحفوظة"""
+    error = admin_error()
+    if error:
+        return error
+    return jsonify({'success': True, 'removed': profiler.clear()})
+
+
+def cache_key(company_id, user_id) -> tuple:
+    return ('' if company_id is None else str(company_id), str(user_id))
+
+
+def lookup_reference_embedding(company_id, user_id):
+    """الـ embedding المرجعي (مطبّع) من فهرس الشركة ثم من الذاكرة المؤقتة
+    
+    الفهرس يُزامَن مع المخزن المشترك قبل كل قراءة فيرى تحديثات العمليات الأخرى. الذاكرة المؤقتة
+    تحمل ما أُرسل بـ cache/warm فقط، وإبطالها يصل للعملية المستقبلة وحدها فتنتهي بـ VERIFY_CACHE_TTL.
+    """
+    if company_id is not None:
+        index = face_indexes.get(str(company_id))
+        embedding = index.get(str(user_id)) if index is not None else None
+        if embedding is not None:
+            return embedding
+    return reference_cache.get(cache_key(company_id, user_id))
+
+
+@app.route('/api/face/cache/warm', methods=['POST'])
+def cache_warm():
+    """تحميل embeddings مرجعية مسبقاً لوضع التحقق بـ user_id"""
+    try:
+        data = request_json() or {}
+        entries = data.get('entries')
+        
+        if not isinstance(entries, list):
+            return error_response('قائمة entries مطلوبة', 'INVALID_INPUT')
+        
+        company_id = data.get('company_id')
+        fmt = embedding_format(data)
+        vectors = normalize([decode_embedding(entry['embedding'], fmt) for entry in entries]) if entries else []
+        for entry, vector in zip(entries, vectors):
+            reference_cache.put(cache_key(company_id, entry['user_id']), vector)
+            # مرجع جديد: القوالب المتعلمة من المرجع السابق لم تعد صالحة
+            if company_id is not None:
+                template_bank.reset(str(company_id), str(entry['user_id']))
+        
+        return jsonify({'success': True, 'loaded': len(entries), 'cache': reference_cache.stats()}), 200
+        
+    except (KeyError, TypeError):
+        return error_response('كل عنصر يجب أن يحتوي user_id و embedding', 'INVALID_INPUT')
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+@app.route('/api/face/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """إبطال embeddings مرجعية: مستخدم أو مستخدمون أو شركة كاملة أو الكل"""
+    data = request_json() or {}
+    company_id = data.get('company_id')
+    user_ids = data.get('user_ids') or ([data['user_id']] if 'user_id' in data else [])
+    
+    # المرجع تغير في قاعدة البيانات، فالقوالب المتعلمة منه تُحذف أيضاً (في المخزن المشترك لكل العمليات)
+    if user_ids:
+        removed = sum(reference_cache.pop(cache_key(company_id, u)) for u in user_ids)
+        if company_id is not None:
+            for user_id in user_ids:
+                template_bank.reset(str(company_id), str(user_id))
+    elif company_id is not None:
+        company = str(company_id)
+        removed = reference_cache.invalidate(lambda key: key[0] == company)
+        template_bank.reset_company(company)
+    else:
+        removed = reference_cache.invalidate()
+        template_bank.reset_all()
+    
+    return jsonify({'success': True, 'removed': removed}), 200
+
+
+@app.route('/api/face/cache/stats', methods=['GET'])
+def cache_stats():
+    """إحصاءات الذاكرة المؤقتة للـ embeddings المرجعية ولنتائج الاستخراج وبصمات التحقق"""
+    response = {'success': True, 'cache': reference_cache.stats()}
+    if embedding_cache is not None:
+        response['embedding_cache'] = {
+            **embedding_cache.stats(),
+            'coalesced': embedding_flights.coalesced,
+            'in_flight': len(embedding_flights)
+        }
+    if replay_detector is not None:
+        response['replay'] = replay_detector.stats()
+    if template_bank.enabled:
+        response['templates'] = template_bank.stats()
+    return jsonify(response)
+
+
+@app.route('/api/face/identify', methods=['POST'])
+def identify_face():
+    """التعرف 1:N: أقرب المستخدمين في فهرس الشركة لصورة واحدة"""
+    try:
+        data = read_request_data()
+        
+        if not data:
+            return error_response('البيانات مطلوبة', 'MISSING_DATA')
+        
+        if 'company_id' not in data:
+            return error_response('معرف الشركة مطلوب', 'MISSING_COMPANY')
+        
+        index = face_indexes.get(str(data['company_id']))
+        if index is None or len(index) == 0:
+            return error_response('لا توجد وجوه مسجلة لهذه الشركة', 'INDEX_EMPTY', 404)
+        
+        top_k = max(1, int_param(data, 'top_k', 5))
+        nprobe = int_param(data, 'nprobe', minimum=1)
+        
+        if data.get('multi_face') in (True, 'true', '1'):
+            return identify_faces(index, data, top_k, nprobe)
+        
+        embedding, error = resolve_embedding(data)
+        if error:
+            return jsonify(error), 400
+        
+        with stage('search'):
+            hits = index.search(embedding, top_k, nprobe=nprobe, exact=bool(data.get('exact', False)))
+        matches = [match_result(user_id, score) for user_id, score in hits]
+        identified = bool(matches) and matches[0]['is_match']
+        
+        return jsonify(with_timings({
+            'success': True,
+            'identified': identified,
+            'user_id': matches[0]['user_id'] if identified else None,
+            'matches': matches,
+            'threshold': MATCH_THRESHOLD
+        }, data)), 200
+        
+    except ParameterError as e:
+        return error_response(str(e), 'INVALID_INPUT')
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+def identify_faces(index, data: dict, top_k: int, nprobe):
+    """وضع الكشك: التعرف على كل الوجوه في الصورة، مع embeddings الوجوه في تمريرة واحدة"""
+    if 'image' not in data:
+        return error_response('الصورة مطلوبة', 'MISSING_IMAGE')
+    
+    max_faces = min(MULTI_FACE_MAX_FACES, max(1, int_param(data, 'max_faces', MULTI_FACE_MAX_FACES)))
+    result = get_face_embeddings(load_image(data['image']), max_faces)
+    if not result['success']:
+        return jsonify(with_timings(result, data)), 400
+    
+    faces = []
+    with stage('search'):
+        for face in result['faces']:
+            hits = index.search(face['embedding'], top_k, nprobe=nprobe, exact=bool(data.get('exact', False)))
+            matches = [match_result(user_id, score) for user_id, score in hits]
+            identified = bool(matches) and matches[0]['is_match']
+            faces.append({
+                'face_location': face['face_location'],
+                'identified': identified,
+                'user_id': matches[0]['user_id'] if identified else None,
+                'matches': matches
+            })
+    
+    return jsonify(with_timings({
+        'success': True,
+        'count': len(faces),
+        'identified_count': sum(1 for face in faces if face['identified']),
+        'skipped': result['skipped'],
+        'faces': faces,
+        'threshold': MATCH_THRESHOLD
+    }, data)), 200
+
+
+def read_frames(stream):
+    """أسطر NDJSON من جسم الطلب فور وصولها، كل سطر إطار بحد MAX_IMAGE_SIZE (بعد Base64)"""
+    limit = MAX_IMAGE_SIZE * 4 // 3 + 4096
+    while True:
+        line = stream.readline(limit + 1)
+        if not line:
+            return
+        if len(line) > limit:
+            raise ImageError(f'حجم الإطار يتجاوز الحد الأقصى ({MAX_IMAGE_SIZE} بايت)', 'IMAGE_TOO_LARGE', 413)
+        line = line.strip()
+        if line:
+            yield line
+
+
+def track_event(event: str, track, **fields) -> dict:
+    return {
+        'event': event,
+        'track_id': track.track_id,
+        'user_id': track.user_id,
+        'similarity': track.similarity,
+        **fields
+    }
+
+
+def checkin_frame(tracker: FaceTracker, index, image: np.ndarray, frame: int) -> list:
+    """إطار واحد: اكتشاف ثم تتبع، والـ embedding (تمريرة واحدة) للمسارات الجديدة أو الأوضح فقط"""
+    located = record_detection(locate_frame_faces(image))
+    if not located['success'] and located['error_code'] != 'NO_FACE_FOUND':
+        return [{'event': 'error', 'frame': frame, 'error': located['error'],
+                 'error_code': located['error_code']}]
+    
+    faces = located.get('faces', [])
+    scale = located.get('scale', 1.0)
+    boxes = [scale_area(face['facial_area'], scale) for face in faces]
+    qualities = [face_quality(box, face.get('confidence')) for box, face in zip(boxes, faces)]
+    pending, ended = tracker.update(boxes, qualities)
+    events = [track_event('track_ended', track, frames=track.frames, embeddings=track.embeddings)
+              for track in ended]
+    if not pending:
+        return events
+    
+    try:
+        aligned = [align_face(image, faces[b], scale)['face'] for _, b in pending]
+        with stage('embed'):
+            embeddings = embed_faces(aligned)
+    except Exception as e:
+        return events + [{'event': 'error', 'frame': frame, **processing_error(e)}]
+    stream_embedding_counter.inc(len(embeddings))
+    
+    with stage('search'):
+        for (track, b), embedding in zip(pending, embeddings):
+            hits = index.search(embedding, 1)
+            user_id, score = hits[0] if hits else (None, -1.0)
+            match = match_result(user_id, score)
+            if tracker.embedded(track, qualities[b], user_id if match['is_match'] else None,
+                                match['similarity']):
+                events.append(track_event('identified', track, frame=frame, face_location=boxes[b],
+                                          confidence=match['confidence']))
+    return events
+
+
+@app.route('/api/face/checkin/stream', methods=['POST'])
+def checkin_stream():
+    """بث إطارات الكشك (NDJSON مجزأ) مع تتبع الوجوه وإرسال الهوية مرة واحدة لكل مسار"""
+    index, error = company_index_or_error(request.args)
+    if error:
+        return error
+    
+    # جسم الطلب مفتوح المدة: الحد لكل إطار في read_frames بدل MAX_REQUEST_SIZE للطلب كاملاً
+    stream = get_input_stream(request.environ, max_content_length=None)
+    tracker = FaceTracker(STREAM_IOU_THRESHOLD, STREAM_MAX_MISSES, STREAM_QUALITY_GAIN, STREAM_MAX_EMBEDDINGS)
+    
+    def generate():
+        frames = 0
+        events = []
+        try:
+            for line in read_frames(stream):
+                frames += 1
+                try:
+                    image = load_image(json.loads(line)['image'])
+                except Exception as e:
+                    events = [{'event': 'error', 'frame': frames - 1, 'error': f'تعذر قراءة الإطار: {str(e)}',
+                               'error_code': e.error_code if isinstance(e, ImageError) else 'INVALID_IMAGE'}]
+                else:
+                    stream_frame_counter.inc()
+                    events = checkin_frame(tracker, index, image, frames - 1)
+                for event in events:
+                    yield json.dumps(event, ensure_ascii=False) + '\n'
+        except ImageError as e:
+            yield json.dumps({'event': 'error', 'error': str(e), 'error_code': e.error_code},
+                             ensure_ascii=False) + '\n'
+        
+        for track in tracker.finish():
+            yield json.dumps(track_event('track_ended', track, frames=track.frames,
+                                         embeddings=track.embeddings), ensure_ascii=False) + '\n'
+        yield json.dumps({
+            'event': 'summary',
+            'frames': frames,
+            'tracks': tracker.started,
+            'identified': tracker.identified,
+            'embeddings': tracker.embeddings,
+            'timings_ms': collected()
+        }, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def index_request(bulk: bool = False):
+    """قراءة طلب إدارة الفهرس والتحقق من الشركة والمستخدم"""
+    data = read_request_data() or request.args.to_dict()
+    
+    if 'company_id' not in data:
+        return data, error_response('معرف الشركة مطلوب', 'MISSING_COMPANY')
+    
+    if bulk and not isinstance(data.get('entries'), list):
+        return data, error_response('قائمة entries مطلوبة', 'INVALID_INPUT')
+    
+    if not bulk and 'user_id' not in data:
+        return data, error_response('معرف المستخدم مطلوب', 'MISSING_USER')
+    
+    return data, None
+
+
+@app.route('/api/face/index/add', methods=['POST'])
+def index_add():
+    """إضافة مستخدم إلى فهرس الشركة (embedding أو صورة)"""
+    try:
+        data, error = index_request()
+        if error:
+            return error
+        
+        embedding, failure = resolve_embedding(data)
+        if failure:
+            return jsonify(failure), 400
+        
+        index = face_indexes.add(str(data['company_id']), str(data['user_id']), embedding)
+        reference_cache.pop(cache_key(data['company_id'], data['user_id']))
+        
+        return jsonify({'success': True, 'user_id': data['user_id'], 'index_size': len(index)}), 200
+        
+    except KeyError:
+        return error_response('المستخدم مسجل مسبقاً في الفهرس', 'USER_EXISTS', 409)
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+@app.route('/api/face/index/update', methods=['PUT'])
+def index_update():
+    """تحديث embedding مستخدم في فهرس الشركة"""
+    try:
+        data, error = index_request()
+        if error:
+            return error
+        
+        index = face_indexes.get(str(data['company_id']))
+        if index is None or str(data['user_id']) not in index:
+            return error_response('المستخدم غير موجود في الفهرس', 'USER_NOT_FOUND', 404)
+        
+        embedding, failure = resolve_embedding(data)
+        if failure:
+            return jsonify(failure), 400
+        
+        index = face_indexes.update(str(data['company_id']), str(data['user_id']), embedding)
+        reference_cache.pop(cache_key(data['company_id'], data['user_id']))
+        template_bank.reset(str(data['company_id']), str(data['user_id']))
+        
+        return jsonify({'success': True, 'user_id': data['user_id'], 'index_size': len(index)}), 200
+        
+    except KeyError:
+        return error_response('المستخدم غير موجود في الفهرس', 'USER_NOT_FOUND', 404)
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+@app.route('/api/face/index/remove', methods=['DELETE'])
+def index_remove():
+    """حذف مستخدم من فهرس الشركة"""
+    try:
+        data, error = index_request()
+        if error:
+            return error
+        
+        index = face_indexes.get(str(data['company_id']))
+        if index is None:
+            return error_response('المستخدم غير موجود في الفهرس', 'USER_NOT_FOUND', 404)
+        
+        index = face_indexes.remove(str(data['company_id']), str(data['user_id']))
+        reference_cache.pop(cache_key(data['company_id'], data['user_id']))
+        template_bank.reset(str(data['company_id']), str(data['user_id']))
+        
+        return jsonify({'success': True, 'user_id': data['user_id'], 'index_size': len(index)}), 200
+        
+    except KeyError:
+        return error_response('المستخدم غير موجود في الفهرس', 'USER_NOT_FOUND', 404)
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+@app.route('/api/face/index/load', methods=['POST'])
+def index_load():
+    """تحميل مجمّع لفهرس الشركة من قاعدة البيانات (إضافة أو تحديث)"""
+    try:
+        data, error = index_request(bulk=True)
+        if error:
+            return error
+        
+        entries = data['entries']
+        index, added = face_indexes.upsert_many(
+            str(data['company_id']),
+            [str(entry['user_id']) for entry in entries],
+            [decode_embedding(entry['embedding'], embedding_format(data)) for entry in entries]
+        )
+        for entry in entries:
+            reference_cache.pop(cache_key(data['company_id'], entry['user_id']))
+            template_bank.reset(str(data['company_id']), str(entry['user_id']))
+        
+        return jsonify({
+            'success': True,
+            'added': added,
+            'updated': len(entries) - added,
+            'index_size': len(index)
+        }), 200
+        
+    except (KeyError, TypeError):
+        return error_response('كل عنصر يجب أن يحتوي user_id و embedding', 'INVALID_INPUT')
+    except PoolBusy as e:
+        return busy_response(e)
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except EmbeddingFormatError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING_FORMAT')
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_EMBEDDING')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+def company_index_or_error(data: dict):
+    """فهرس الشركة من الطلب أو رد خطأ"""
+    if 'company_id' not in data:
+        return None, error_response('معرف الشركة مطلوب', 'MISSING_COMPANY')
+    
+    index = face_indexes.get(str(data['company_id']))
+    if index is None or len(index) == 0:
+        return None, error_response('لا توجد وجوه مسجلة لهذه الشركة', 'INDEX_EMPTY', 404)
+    
+    return index, None
+
+
+@app.route('/api/face/index/ann/train', methods=['POST'])
+def index_ann_train():
+    """تدريب فهرس IVF-PQ التقريبي لشركة كبيرة"""
+    try:
+        data = request_json() or {}
+        index, error = company_index_or_error(data)
+        if error:
+            return error
+        
+        stats = face_indexes.train_ann(
+            str(data['company_id']),
+            nlist=int_param(data, 'nlist', ANN_NLIST, minimum=1),
+            m=int_param(data, 'm', ANN_M, minimum=1),
+            nprobe=int_param(data, 'nprobe', ANN_NPROBE, minimum=1),
+            rerank=int_param(data, 'rerank', ANN_RERANK, minimum=1)
+        )
+        return jsonify({'success': True, 'ann': stats}), 200
+    
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except ParameterError as e:
+        return error_response(str(e), 'INVALID_INPUT')
+    except ValueError as e:
+        return error_response(str(e), 'INVALID_INPUT')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+@app.route('/api/face/index/ann', methods=['DELETE'])
+def index_ann_drop():
+    """إلغاء الفهرس التقريبي والعودة للبحث الدقيق"""
+    data = request_json() or request.args.to_dict()
+    index, error = company_index_or_error(data)
+    if error:
+        return error
+    
+    face_indexes.drop_ann(str(data['company_id']))
+    return jsonify({'success': True}), 200
+
+
+@app.route('/api/face/index/ann/evaluate', methods=['POST'])
+def index_ann_evaluate():
+    """قياس الاستدعاء والزمن مقابل البحث الدقيق لقيم nprobe مختلفة"""
+    try:
+        data = request_json() or {}
+        index, error = company_index_or_error(data)
+        if error:
+            return error
+        
+        count = int_param(data, 'queries', 100, minimum=1)
+        noise = float_param(data, 'noise', 0.3, 0, 10)
+        top_k = int_param(data, 'top_k', 5, minimum=1)
+        nprobes = data.get('nprobe', [1, 2, 4, 8, 16, 32])
+        if not isinstance(nprobes, list):
+            nprobes = [nprobes]
+        if not nprobes:
+            raise ParameterError('nprobe يجب أن يكون قائمة أعداد صحيحة')
+        nprobes = [int_param({'nprobe': value}, 'nprobe', minimum=1) for value in nprobes]
+        
+        if index.ensure_ann() is None:
+            return error_response('الفهرس التقريبي غير مدرب لهذه الشركة', 'ANN_NOT_TRAINED')
+        
+        # استعلامات من وجوه مسجلة مع ضوضاء تحاكي صورة جديدة لنفس الشخص
+        queries = index.sample(count)
+        rng = np.random.default_rng(0)
+        queries = normalize(queries + rng.normal(0, noise, queries.shape).astype(np.float32) / np.sqrt(queries.shape[1]))
+        
+        report = evaluate_recall(index, queries, top_k=top_k, nprobes=nprobes)
+        return jsonify({'success': True, 'size': len(index), 'report': report}), 200
+    
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except ParameterError as e:
+        return error_response(str(e), 'INVALID_INPUT')
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
+@app.route('/api/face/index/stats', methods=['GET'])
+def index_stats():
+    """حجم فهارس الشركات"""
+    company_id = request.args.get('company_id')
+    companies = [company_id] if company_id else face_indexes.companies()
+    indexes = {c: face_indexes.stats(c) for c in companies}
+    return jsonify({
+        'success': True,
+        'indexes': {c: stats for c, stats in indexes.items() if stats is not None}
+    })
+
+
+@app.route('/api/face/index/checkpoint', methods=['POST'])
+def index_checkpoint():
+    """كتابة لقطة جديدة لمخزن الشركة وتفريغ سجل WAL"""
+    try:
+        data = request_json() or {}
+        index, error = company_index_or_error(data)
+        if error:
+            return error
+        
+        if face_indexes.store is None:
+            return error_response('المخزن المحلي غير مفعل (EMBEDDING_STORE_DIR)', 'STORE_DISABLED')
+        
+        manifest = face_indexes.checkpoint(str(data['company_id']))
+        return jsonify({'success': True, 'store': manifest}), 200
+    
+    except ImageError as e:
+        return error_response(str(e), e.error_code, e.status)
+    except Exception as e:
+        return error_response(f'خطأ في الخادم: {str(e)}', 'SERVER_ERROR', 500)
+
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('DEBUG', 'false').lower() == 'true'
@@ -392,4 +1809,9 @@ if __name__ == '__main__':
     ╚═══════════════════════════════════════════════════╝
     """)
     
+    if inference_pool is not None:
+        inference_pool.start()
+    elif PRELOAD_MODEL:
+        start_warm_up()
+    
     app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,119 @@
+"""
+مُجدول الدفعات الصغيرة - Micro-batching scheduler
+يجمع الطلبات المتزامنة خلال نافذة زمنية قصيرة أو حتى حد أقصى للدفعة،
+ثم يمررها للنموذج دفعة واحدة ويعيد لكل طلب نتيجته فقط.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+import numpy as np
+
+
+class _Pending:
+    __slots__ = ('item', 'future', 'enqueued_at')
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """تجميع العناصر وتمريرها إلى process_batch في خيط واحد مخصص"""
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 16, window_ms: float = 10,
+                 max_queue_size: int = 256):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # إحصاءات للضبط بين الإنتاجية وزمن الاستجابة
+        self._batch_sizes = Counter()
+        self._waits = deque(maxlen=1000)
+        self._items_total = 0
+        self._max_queue_depth = 0
+
+    def submit(self, item: Any) -> Any:
+        """إضافة عنصر وانتظار نتيجته"""
+        self._ensure_started()
+        pending = _Pending(item)
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='micro-batcher', daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = first.enqueued_at + self.window
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[_Pending]):
+        started = time.monotonic()
+        with self._lock:
+            self._batch_sizes[len(batch)] += 1
+            self._items_total += len(batch)
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize() + len(batch))
+            self._waits.extend(started - p.enqueued_at for p in batch)
+
+        try:
+            results = self.process_batch([p.item for p in batch])
+        except Exception as e:
+            for p in batch:
+                p.future.set_exception(e)
+            return
+
+        for p, result in zip(batch, results):
+            p.future.set_result(result)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """إحصاءات حجم الدفعة وعمق الطابور وزمن الانتظار"""
+        with self._lock:
+            waits = np.array(self._waits) * 1000 if self._waits else np.zeros(1)
+            batches = sum(self._batch_sizes.values())
+            return {
+                'max_batch_size': self.max_batch_size,
+                'window_ms': self.window * 1000,
+                'batches_total': batches,
+                'items_total': self._items_total,
+                'mean_batch_size': self._items_total / batches if batches else 0,
+                'batch_size_counts': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'wait_ms': {
+                    'mean': float(waits.mean()),
+                    'p50': float(np.percentile(waits, 50)),
+                    'p99': float(np.percentile(waits, 99)),
+                }
+            }
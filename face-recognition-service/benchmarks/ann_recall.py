@@ -0,0 +1,72 @@
+"""
+قياس الاستدعاء مقابل الزمن للفهرس التقريبي - IVF-PQ recall vs latency benchmark
+
+يبني فهرساً من embeddings اصطناعية متجمعة (تشبه توزيع الوجوه أكثر من الضوضاء
+العشوائية) ويقارن البحث التقريبي بالبحث الدقيق لعدة قيم nprobe، لاختيار
+الإعدادات المناسبة لحجم كل شركة.
+
+    python benchmarks/ann_recall.py --sizes 100000 1000000 --nprobe 1 4 8 16 32
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from face_index import FaceIndex, normalize  # noqa: E402
+from ann_index import evaluate_recall  # noqa: E402
+
+
+def synthetic_embeddings(size: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """متجهات حول مراكز عشوائية بتشتت يقارب embeddings الوجوه"""
+    centers = normalize(rng.standard_normal((clusters, dim), dtype=np.float32))
+    assign = rng.integers(0, clusters, size)
+    spread = rng.standard_normal((size, dim), dtype=np.float32) / np.sqrt(dim)
+    return normalize(centers[assign] + 1.5 * spread)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--nlist', type=int, default=0, help='0 = 4*sqrt(N)')
+    parser.add_argument('--m', type=int, default=64)
+    parser.add_argument('--rerank', type=int, default=4)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--noise', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    for size in args.sizes:
+        vectors = synthetic_embeddings(size, args.dim, max(16, size // 1000), rng)
+        index = FaceIndex(dim=args.dim, capacity=size)
+        index.upsert_many((f'user-{i}' for i in range(size)), vectors)
+
+        nlist = args.nlist or int(4 * np.sqrt(size))
+        t0 = time.perf_counter()
+        ann = index.train_ann(nlist=nlist, m=args.m, nprobe=args.nprobe[0], rerank=args.rerank)
+        train_s = time.perf_counter() - t0
+
+        queries = vectors[rng.choice(size, args.queries, replace=False)]
+        queries = normalize(queries + rng.normal(0, args.noise, queries.shape).astype(np.float32) / np.sqrt(args.dim))
+        report = evaluate_recall(index, queries, args.top_k, args.nprobe)
+
+        print(f'\nfaces={size} nlist={nlist} m={args.m} train={train_s:.1f}s '
+              f'codes={ann["code_bytes"] / 2**20:.1f}MB exact={report[0]["exact_mean_ms"]:.2f}ms')
+        print(f'{"nprobe":>8}{f"recall@{args.top_k}":>12}{"best hit":>10}{"mean ms":>10}{"speedup":>10}')
+        for row in report:
+            print(f'{row["nprobe"]:>8}{row["recall"]:>12.3f}{row["recall_at_1"]:>10.3f}{row["mean_ms"]:>10.2f}'
+                  f'{row["exact_mean_ms"] / row["mean_ms"]:>10.1f}x')
+        del index, vectors
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+قياس زمن إعادة بناء الفهرس بعد إعادة التشغيل - Embedding store restart benchmark
+
+يقارن تحميل فهرس الشركة من المخزن المحلي (memmap + WAL) بإعادة تحليل
+الـ embeddings من نص JSON كما هي مخزنة في عمود face_data.face_embedding.
+
+    python benchmarks/embedding_store_restart.py --sizes 10000 100000 --wal 1000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from embedding_store import EmbeddingStore  # noqa: E402
+from face_index import FaceIndex, FaceIndexRegistry  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--wal', type=int, default=1000, help='عمليات في السجل بعد آخر لقطة')
+    parser.add_argument('--dim', type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"faces":>10}{"JSON parse s":>14}{"store load ms":>15}{"WAL records":>13}')
+
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+        user_ids = [f'user-{i}' for i in range(size)]
+        root = tempfile.mkdtemp(prefix='face-store-')
+        try:
+            registry = FaceIndexRegistry(EmbeddingStore(root, checkpoint_bytes=2**62))
+            registry.upsert_many('bench', user_ids, vectors)
+            registry.checkpoint('bench')
+            for i in range(args.wal):
+                registry.update('bench', user_ids[i % size], vectors[(i + 1) % size])
+
+            # المسار الحالي: JSON نصي لكل مستخدم من قاعدة البيانات
+            rows = [json.dumps(v.tolist()) for v in vectors]
+            t0 = time.perf_counter()
+            index = FaceIndex()
+            index.upsert_many(user_ids, np.array([json.loads(r) for r in rows], dtype=np.float32))
+            json_s = time.perf_counter() - t0
+            del rows, index
+
+            t0 = time.perf_counter()
+            restored = FaceIndexRegistry(EmbeddingStore(root)).get('bench')
+            load_ms = (time.perf_counter() - t0) * 1000
+            assert len(restored) == size
+
+            print(f'{size:>10}{json_s:>14.2f}{load_ms:>15.1f}{args.wal:>13}')
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
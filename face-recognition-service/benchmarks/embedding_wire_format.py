@@ -0,0 +1,58 @@
+"""
+قياس صيغ نقل الـ embeddings - Embedding wire format benchmark
+
+يقارن حجم الحمولة وزمن الترميز وفك الترميز لـ embedding واحد بصيغة JSON
+(قائمة أرقام كما يرسلها jsonify) مع f32b64 و f16b64، وخطأ float16 في التشابه.
+
+    python benchmarks/embedding_wire_format.py --dim 512 --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from embedding_codec import decode_embedding, encode_embedding  # noqa: E402
+
+
+def timed(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # DeepFace تُرجع قائمة أرقام Python (float64)
+    embedding = (rng.standard_normal(args.dim) * 0.1).tolist()
+    reference = np.asarray(embedding)
+
+    print(f'{"format":<10}{"bytes":>10}{"encode us":>12}{"decode us":>12}{"cos error":>12}')
+    for fmt in ('json', 'f32b64', 'f16b64'):
+        def encode():
+            return json.dumps({'embedding': encode_embedding(embedding, fmt)})
+
+        payload = encode()
+
+        def decode():
+            return np.asarray(decode_embedding(json.loads(payload)['embedding'], fmt), dtype=np.float32)
+
+        decoded = decode()
+        cosine = float(decoded @ reference / (np.linalg.norm(decoded) * np.linalg.norm(reference)))
+        print(f'{fmt:<10}{len(payload):>10}{timed(encode, args.iterations):>12.1f}'
+              f'{timed(decode, args.iterations):>12.1f}{1 - cosine:>12.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""
+حمل ثابت على نقاط النهاية - Reproducible endpoint load benchmark
+
+يشغّل الخدمة عبر gunicorn (أو يستخدم خادماً قائماً بـ --url) ويرسل طلبات
+/detect و /register و /verify و /compare (صورتان، embedding مع صورة، embedding-ان)
+بمستويات تزامن محددة، ويقيس الإنتاجية و p50/p95/p99 وأقصى RSS لعمليات الخادم.
+مجموعة الصور ثابتة: نسخ محددة الأبعاد من صورة مرجعية، أو ملفات مجلد --images.
+النتائج تُحفظ JSON مع الـ commit و MODEL_NAME و DETECTOR_BACKEND للمقارنة لاحقاً.
+
+    python benchmarks/endpoint_load.py --concurrency 1 4 16 --requests 200
+    MODEL_NAME=ArcFace DETECTOR_BACKEND=ssd python benchmarks/endpoint_load.py
+    python benchmarks/endpoint_load.py --compare results/a.json results/b.json
+"""
+
+import argparse
+import base64
+import glob
+import io
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+DEFAULT_IMAGE = os.path.join(ROOT, '..', 'test_face.jpg')
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# أطوال الضلع الأطول للنسخ المولدة (صور كاميرا الجوال حتى صور الأكشاك الصغيرة)
+IMAGE_SIDES = (480, 720, 1080, 1600, 3000)
+
+# الإعدادات المؤثرة على الأداء وتُحفظ مع كل نتيجة
+ENV_KEYS = ('MODEL_NAME', 'DETECTOR_BACKEND', 'BATCH_ENABLED', 'BATCH_MAX_SIZE', 'BATCH_WINDOW_MS',
+            'DECODE_MAX_SIDE', 'DETECT_MAX_SIDE', 'INFERENCE_PROCESSES', 'WEB_CONCURRENCY',
+            'GUNICORN_THREADS', 'PRELOAD_MODEL')
+
+SCENARIOS = ('detect', 'register', 'verify', 'compare_images', 'compare_embedding_image',
+             'compare_embeddings')
+
+
+def load_images(args) -> list:
+    """مجموعة صور JPEG ثابتة: ملفات المجلد مرتبة بالاسم، أو نسخ مولدة من الصورة المرجعية"""
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, '*.jp*g')) +
+                       glob.glob(os.path.join(args.images, '*.png')))
+        if not paths:
+            raise SystemExit(f'لا توجد صور في {args.images}')
+        images = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                images.append(f.read())
+        return images
+
+    with Image.open(args.image) as source:
+        source = ImageOps.exif_transpose(source).convert('RGB')
+        images = []
+        for side in IMAGE_SIDES:
+            scale = side / max(source.size)
+            variant = source.resize((round(source.width * scale), round(source.height * scale)),
+                                    Image.BICUBIC)
+            for mirrored in (False, True):
+                buffer = io.BytesIO()
+                (ImageOps.mirror(variant) if mirrored else variant).save(buffer, 'JPEG', quality=90)
+                images.append(buffer.getvalue())
+    return images
+
+
+def data_uri(body: bytes) -> str:
+    return 'data:image/jpeg;base64,' + base64.b64encode(body).decode('ascii')
+
+
+def post(url: str, payload: dict, timeout: float):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def build_payloads(scenario: str, images: list, embedding: list) -> list:
+    """طلب لكل صورة في المجموعة (تُعاد بالترتيب نفسه في كل تشغيل)"""
+    uris = [data_uri(body) for body in images]
+    if scenario in ('detect', 'register'):
+        return [{'image': uri, 'user_id': 'bench'} for uri in uris]
+    if scenario == 'verify':
+        return [{'image': uri, 'stored_embedding': embedding} for uri in uris]
+    if scenario == 'compare_images':
+        return [{'image1': uri, 'image2': uris[(i + 1) % len(uris)]} for i, uri in enumerate(uris)]
+    if scenario == 'compare_embedding_image':
+        return [{'embedding': embedding, 'image': uri} for uri in uris]
+    return [{'embedding1': embedding, 'embedding2': embedding}]
+
+
+def endpoint(scenario: str) -> str:
+    return '/api/face/' + scenario.split('_')[0]
+
+
+class RssSampler:
+    """أخذ عيّنة من مجموع RSS لعملية الخادم وأبنائها كل 100ms (Linux)"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _tree(self) -> list:
+        pids = [self.pid]
+        for pid in pids:
+            try:
+                for task in os.listdir(f'/proc/{pid}/task'):
+                    with open(f'/proc/{pid}/task/{task}/children') as f:
+                        pids.extend(int(p) for p in f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def sample(self) -> int:
+        total = 0
+        for pid in self._tree():
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1])
+            except OSError:
+                pass
+        return total
+
+    def _run(self):
+        while not self._stop.wait(0.1):
+            self.peak_kb = max(self.peak_kb, self.sample())
+
+    def __enter__(self):
+        if self.pid and os.path.exists(f'/proc/{self.pid}'):
+            self.peak_kb = self.sample()
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            self.peak_kb = max(self.peak_kb, self.sample())
+
+
+def run_scenario(url: str, scenario: str, payloads: list, concurrency: int, requests: int,
+                 timeout: float, pid) -> dict:
+    """إرسال requests طلباً بتزامن concurrency (كل خيط يأخذ الطلب التالي من عداد مشترك)"""
+    target = url + endpoint(scenario)
+    latencies = np.zeros(requests)
+    statuses = {}
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            t0 = time.perf_counter()
+            try:
+                status, body = post(target, payloads[i % len(payloads)], timeout)
+                key = str(status) if status == 200 else f'{status}:{body.get("error_code")}'
+            except (urllib.error.URLError, OSError) as e:
+                key = type(e).__name__
+            latencies[i] = time.perf_counter() - t0
+            with lock:
+                statuses[key] = statuses.get(key, 0) + 1
+
+    with RssSampler(pid) as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        elapsed = time.perf_counter() - started
+
+    ms = latencies * 1000
+    return {
+        'scenario': scenario,
+        'endpoint': endpoint(scenario),
+        'concurrency': concurrency,
+        'requests': requests,
+        'elapsed_s': elapsed,
+        'throughput_rps': requests / elapsed,
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+        'statuses': statuses,
+        'error_rate': 1 - statuses.get('200', 0) / requests,
+        'peak_rss_mb': rss.peak_kb / 1024 if rss.peak_kb else None
+    }
+
+
+def wait_ready(url: str, timeout: float) -> None:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url + '/ready', timeout=5):
+                return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.25)
+    raise TimeoutError('الخدمة لم تصبح جاهزة')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def benchmark(args) -> dict:
+    images = load_images(args)
+    server = None
+    url, pid = args.url, args.pid
+    if url is None:
+        url = f'http://127.0.0.1:{args.port}'
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+            cwd=ROOT, env=dict(os.environ, PORT=str(args.port)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        pid = server.pid
+
+    try:
+        wait_ready(url, args.timeout)
+        # embedding مرجعي من أول صورة، ثم إحماء كل مسار قبل القياس
+        status, reference = post(url + '/api/face/detect', {'image': data_uri(images[0])}, args.timeout)
+        if status != 200:
+            raise SystemExit(f'فشل استخراج embedding من الصورة المرجعية: {reference.get("error_code")}')
+        embedding = reference['embedding']
+
+        health = json.loads(urllib.request.urlopen(url + '/ready', timeout=5).read())
+        results = []
+        for scenario in args.scenarios:
+            payloads = build_payloads(scenario, images, embedding)
+            run_scenario(url, scenario, payloads, 1, min(args.warmup, len(payloads)), args.timeout, None)
+            for concurrency in args.concurrency:
+                result = run_scenario(url, scenario, payloads, concurrency, args.requests,
+                                      args.timeout, pid)
+                results.append(result)
+                print(format_row(result), flush=True)
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+    env = {key: os.environ[key] for key in ENV_KEYS if key in os.environ}
+    env['MODEL_NAME'] = health.get('model')
+    env['DETECTOR_BACKEND'] = health.get('detector')
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'url': url if args.url else None,
+            'env': env,
+            'images': len(images),
+            'image_bytes': sum(len(body) for body in images),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'model_load_seconds': health.get('model_load_seconds')
+        },
+        'results': results
+    }
+
+
+HEADER = (f'{"scenario":<26}{"conc":>5}{"rps":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+          f'{"errors":>8}{"peak RSS MB":>13}')
+
+
+def format_row(result: dict) -> str:
+    rss = f'{result["peak_rss_mb"]:.0f}' if result['peak_rss_mb'] else '-'
+    return (f'{result["scenario"]:<26}{result["concurrency"]:>5}{result["throughput_rps"]:>9.1f}'
+            f'{result["p50_ms"]:>9.1f}{result["p95_ms"]:>9.1f}{result["p99_ms"]:>9.1f}'
+            f'{result["error_rate"]:>8.1%}{rss:>13}')
+
+
+def compare(base_path: str, new_path: str) -> None:
+    """مقارنة ملفي نتائج: التغير النسبي في الإنتاجية و p50/p99 لكل سيناريو وتزامن"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for label, run in (('base', base), ('new', new)):
+        meta = run['meta']
+        print(f'{label}: {meta["commit"]} {meta["env"].get("MODEL_NAME")}/{meta["env"].get("DETECTOR_BACKEND")}'
+              f' {meta["timestamp"]}')
+
+    before = {(r['scenario'], r['concurrency']): r for r in base['results']}
+    print(f'{"scenario":<26}{"conc":>5}{"rps":>10}{"p50":>10}{"p99":>10}')
+    for result in new['results']:
+        old = before.get((result['scenario'], result['concurrency']))
+        if old is None:
+            continue
+        change = lambda key: (result[key] / old[key] - 1) if old[key] else 0.0  # noqa: E731
+        print(f'{result["scenario"]:<26}{result["concurrency"]:>5}{change("throughput_rps"):>+10.1%}'
+              f'{change("p50_ms"):>+10.1%}{change("p99_ms"):>+10.1%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='خادم قائم بدل تشغيل gunicorn (مثل http://127.0.0.1:5001)')
+    parser.add_argument('--pid', type=int, help='PID الخادم القائم لقياس RSS')
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--image', default=DEFAULT_IMAGE, help='الصورة المرجعية للنسخ المولدة')
+    parser.add_argument('--images', help='مجلد صور بدل النسخ المولدة')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help='طلبات لكل سيناريو وتزامن')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', help='ملف النتائج (الافتراضي results/<commit>-<model>-<detector>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='مقارنة ملفي نتائج')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    print(HEADER)
+    run = benchmark(args)
+    env = run['meta']['env']
+    output = args.output or os.path.join(
+        DEFAULT_OUTPUT_DIR, f'{run["meta"]["commit"]}-{env["MODEL_NAME"]}-{env["DETECTOR_BACKEND"]}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2, ensure_ascii=False)
+    print(f'saved {output}')
+
+
+if __name__ == '__main__':
+    main()
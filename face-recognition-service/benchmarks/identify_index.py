@@ -0,0 +1,69 @@
+"""
+قياس البحث 1:N في فهرس الشركة - Face index search benchmark
+
+يبني فهرساً من embeddings عشوائية (512 بُعد) بأحجام مختلفة ويقيس زمن
+التحميل وزمن البحث top-k والذاكرة المستخدمة.
+
+    python benchmarks/identify_index.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from face_index import FaceIndex  # noqa: E402
+
+
+def build_index(size: int, dim: int, rng: np.random.Generator) -> tuple:
+    """بناء فهرس بحجم معين على دفعات لتقليل الذاكرة المؤقتة"""
+    index = FaceIndex(dim=dim, capacity=size)
+    chunk = 100_000
+    started = time.perf_counter()
+    for start in range(0, size, chunk):
+        count = min(chunk, size - start)
+        vectors = rng.standard_normal((count, dim), dtype=np.float32)
+        index.upsert_many((f'user-{i}' for i in range(start, start + count)), vectors)
+    return index, time.perf_counter() - started
+
+
+def bench_search(index: FaceIndex, dim: int, queries: int, top_k: int,
+                 rng: np.random.Generator) -> np.ndarray:
+    probes = rng.standard_normal((queries, dim), dtype=np.float32)
+    index.search(probes[0], top_k)  # تسخين
+    latencies = np.empty(queries)
+    for i, probe in enumerate(probes):
+        t0 = time.perf_counter()
+        index.search(probe, top_k)
+        latencies[i] = time.perf_counter() - t0
+    return latencies * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print(f'{"faces":>10}{"build s":>10}{"MB":>10}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}{"QPS":>10}')
+    for size in args.sizes:
+        index, build_s = build_index(size, args.dim, rng)
+        latencies = bench_search(index, args.dim, args.queries, args.top_k, rng)
+        memory_mb = index.stats()['memory_bytes'] / 2**20
+        print(f'{size:>10}{build_s:>10.2f}{memory_mb:>10.1f}{latencies.mean():>10.2f}'
+              f'{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 99):>10.2f}'
+              f'{1000 / latencies.mean():>10.0f}')
+        del index
+
+
+if __name__ == '__main__':
+    main()
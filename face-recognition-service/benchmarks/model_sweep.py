@@ -0,0 +1,260 @@
+"""
+مسح النماذج والكواشف: الزمن مقابل الدقة - Model/detector latency vs accuracy sweep
+
+يشغّل كل تركيبة MODEL_NAME × DETECTOR_BACKEND في عملية منفصلة (نفس خط المعالجة
+في الخدمة: فك الترميز ثم الاكتشاف والمحاذاة ثم الـ embedding) على مجلد صور معنون،
+ويقيس زمن الاكتشاف والـ embedding لكل صورة ونسبة NO_FACE_FOUND ودقة التحقق
+لمجموعة من العتبات (نفس مقياس التشابه في /api/face/compare). الناتج جدول مرتب
+بالزمن مع تحديد تركيبات حد باريتو وأسرع تركيبة تحقق --accuracy-floor.
+
+المجلد المعنون بإحدى صيغتين:
+  - ملف pairs.txt: سطر لكل زوج "image1 image2 1|0" (1 = نفس الشخص) بمسارات نسبية
+  - مجلد لكل شخص <person>/<image>.jpg، وتُولد الأزواج بترتيب ثابت (--seed)
+
+    python benchmarks/model_sweep.py --dataset ./data/pairs --accuracy-floor 0.97
+    python benchmarks/model_sweep.py --dataset ./data/pairs --models Facenet512 ArcFace --detectors opencv ssd
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import combinations
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# النماذج والكواشف المدعومة في DeepFace 0.0.89
+MODELS = ('VGG-Face', 'Facenet', 'Facenet512', 'OpenFace', 'DeepFace', 'DeepID', 'ArcFace', 'Dlib',
+          'SFace', 'GhostFaceNet')
+DETECTORS = ('opencv', 'ssd', 'dlib', 'mtcnn', 'fastmtcnn', 'retinaface', 'mediapipe', 'yolov8', 'yunet')
+
+# عتبات التشابه (0-1) كما في MATCH_THRESHOLD
+THRESHOLDS = tuple(round(t, 3) for t in np.arange(0.5, 0.951, 0.025))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_pairs(dataset: str, max_pairs: int, seed: int) -> list:
+    """قائمة الأزواج (image1, image2, same) بمسارات كاملة"""
+    pairs_file = os.path.join(dataset, 'pairs.txt')
+    if os.path.exists(pairs_file):
+        pairs = []
+        with open(pairs_file) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and not line.startswith('#'):
+                    pairs.append((os.path.join(dataset, parts[0]), os.path.join(dataset, parts[1]),
+                                  parts[2] == '1'))
+        return pairs[:max_pairs] if max_pairs else pairs
+
+    people = {}
+    for person in sorted(os.listdir(dataset)):
+        folder = os.path.join(dataset, person)
+        if os.path.isdir(folder):
+            images = sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+            if images:
+                people[person] = images
+    if len(people) < 2:
+        raise SystemExit(f'لا يوجد pairs.txt ولا مجلدان لشخصين على الأقل في {dataset}')
+
+    rng = random.Random(seed)
+    genuine = [(a, b, True) for images in people.values() for a, b in combinations(images, 2)]
+    rng.shuffle(genuine)
+    if max_pairs:
+        genuine = genuine[:max_pairs // 2]
+    # أزواج مختلفة بنفس العدد
+    names = list(people)
+    impostor = []
+    while len(impostor) < len(genuine):
+        first, second = rng.sample(names, 2)
+        impostor.append((rng.choice(people[first]), rng.choice(people[second]), False))
+    return genuine + impostor
+
+
+def run_worker(paths_file: str, output_file: str) -> None:
+    """داخل العملية الفرعية: MODEL_NAME و DETECTOR_BACKEND من البيئة كما في الخدمة"""
+    sys.path.insert(0, ROOT)
+    import inference
+    from app import ImageError, decode_image_bytes
+    from face_pipeline import extract_embedding, processing_error
+    from timings import capture
+
+    with open(paths_file) as f:
+        paths = json.load(f)
+
+    started = time.perf_counter()
+    inference.warm_up()
+    load_seconds = time.perf_counter() - started
+    if inference.warm_up_error:
+        with open(output_file, 'w') as f:
+            json.dump({'error': inference.warm_up_error}, f)
+        return
+
+    images = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            body = f.read()
+        with capture() as stages:
+            try:
+                result = extract_embedding(decode_image_bytes(body))
+            except ImageError as e:
+                result = {'success': False, 'error_code': e.error_code}
+            except Exception as e:
+                result = processing_error(e)
+        images[path] = {
+            'success': result['success'],
+            'error_code': result.get('error_code'),
+            'detect_ms': sum(stages.get(name, 0) for name in ('detect', 'detect_fallback', 'align')),
+            'embed_ms': stages.get('embed'),
+            'embedding': result.get('embedding')
+        }
+
+    with open(output_file, 'w') as f:
+        json.dump({'load_seconds': load_seconds, 'images': images}, f)
+
+
+def similarity(a: list, b: list) -> float:
+    """نفس التشابه في compare_embeddings: الكوساين محولاً إلى 0-1"""
+    a, b = np.asarray(a), np.asarray(b)
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    cosine = float(a @ b / norm) if norm else 0.0
+    return (cosine + 1) / 2
+
+
+def evaluate(model: str, detector: str, pairs: list, paths: list, args) -> dict:
+    """تشغيل تركيبة واحدة في عملية منفصلة وحساب الزمن والدقة"""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths_file = os.path.join(tmp, 'paths.json')
+        output_file = os.path.join(tmp, 'output.json')
+        with open(paths_file, 'w') as f:
+            json.dump(paths, f)
+        env = dict(os.environ, MODEL_NAME=model, DETECTOR_BACKEND=detector)
+        process = subprocess.run(
+            [sys.executable, __file__, '--worker', paths_file, output_file],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            text=True, timeout=args.timeout
+        )
+        if not os.path.exists(output_file):
+            return {'model': model, 'detector': detector,
+                    'error': (process.stderr.strip().splitlines() or ['exit %d' % process.returncode])[-1]}
+        with open(output_file) as f:
+            output = json.load(f)
+
+    if 'error' in output:
+        return {'model': model, 'detector': detector, 'error': output['error']}
+
+    images = output['images']
+    detect_ms = np.array([image['detect_ms'] for image in images.values()])
+    embed_ms = np.array([image['embed_ms'] for image in images.values() if image['embed_ms'] is not None])
+    failures = {}
+    for image in images.values():
+        if not image['success']:
+            failures[image['error_code']] = failures.get(image['error_code'], 0) + 1
+
+    # زوج فيه صورة فاشلة يُحسب رفضاً (خطأ للأزواج المتطابقة، صحيح للمختلفة) كما في الخدمة
+    scores = []
+    for first, second, same in pairs:
+        a, b = images[first]['embedding'], images[second]['embedding']
+        scores.append((similarity(a, b) if a is not None and b is not None else None, same))
+    accuracy = {}
+    for threshold in THRESHOLDS:
+        correct = sum((score is not None and score >= threshold) == same for score, same in scores)
+        accuracy[str(threshold)] = correct / len(scores)
+    best_threshold = max(accuracy, key=accuracy.get)
+
+    total_ms = np.array([image['detect_ms'] + (image['embed_ms'] or 0) for image in images.values()])
+    return {
+        'model': model,
+        'detector': detector,
+        'load_seconds': output['load_seconds'],
+        'images': len(images),
+        'detect_p50_ms': float(np.percentile(detect_ms, 50)),
+        'detect_p95_ms': float(np.percentile(detect_ms, 95)),
+        'embed_p50_ms': float(np.percentile(embed_ms, 50)) if len(embed_ms) else None,
+        'total_p50_ms': float(np.percentile(total_ms, 50)),
+        'failure_rate': sum(failures.values()) / len(images),
+        'no_face_rate': failures.get('NO_FACE_FOUND', 0) / len(images),
+        'failures': failures,
+        'accuracy': accuracy,
+        'best_threshold': float(best_threshold),
+        'best_accuracy': accuracy[best_threshold]
+    }
+
+
+def pareto(results: list) -> None:
+    """تعليم التركيبات التي لا توجد تركيبة أسرع وأدق منها معاً"""
+    for result in results:
+        result['pareto'] = not any(
+            other is not result
+            and other['total_p50_ms'] <= result['total_p50_ms']
+            and other['best_accuracy'] >= result['best_accuracy']
+            and (other['total_p50_ms'] < result['total_p50_ms'] or other['best_accuracy'] > result['best_accuracy'])
+            for other in results
+        )
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        run_worker(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dataset', required=True, help='مجلد pairs.txt أو مجلد لكل شخص')
+    parser.add_argument('--models', nargs='+', default=list(MODELS))
+    parser.add_argument('--detectors', nargs='+', default=list(DETECTORS))
+    parser.add_argument('--max-pairs', type=int, default=0, help='0 = كل الأزواج')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--accuracy-floor', type=float, default=0.95)
+    parser.add_argument('--timeout', type=float, default=3600, help='ثوانٍ لكل تركيبة')
+    parser.add_argument('--output', help='حفظ كل النتائج (مع الدقة لكل عتبة) في ملف JSON')
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.dataset, args.max_pairs, args.seed)
+    paths = sorted({path for first, second, _ in pairs for path in (first, second)})
+    print(f'{len(pairs)} pairs ({sum(same for *_, same in pairs)} same), {len(paths)} images')
+
+    results, failed = [], []
+    for model in args.models:
+        for detector in args.detectors:
+            result = evaluate(model, detector, pairs, paths, args)
+            (failed if 'error' in result else results).append(result)
+            status = result.get('error') or f'{result["total_p50_ms"]:.0f} ms, {result["best_accuracy"]:.3f}'
+            print(f'  {model}/{detector}: {status}', flush=True)
+
+    pareto(results)
+    results.sort(key=lambda r: r['total_p50_ms'])
+    eligible = [r for r in results if r['best_accuracy'] >= args.accuracy_floor]
+
+    print(f'\n{"":2}{"model":<14}{"detector":<12}{"detect p50":>11}{"embed p50":>10}{"total p50":>10}'
+          f'{"no face":>9}{"accuracy":>10}{"threshold":>10}{"load s":>8}')
+    for r in results:
+        mark = '*' if r['pareto'] else ' '
+        embed = f'{r["embed_p50_ms"]:.1f}' if r['embed_p50_ms'] is not None else '-'
+        print(f'{mark:<2}{r["model"]:<14}{r["detector"]:<12}{r["detect_p50_ms"]:>11.1f}{embed:>10}'
+              f'{r["total_p50_ms"]:>10.1f}{r["no_face_rate"]:>9.1%}{r["best_accuracy"]:>10.3f}'
+              f'{r["best_threshold"]:>10.3f}{r["load_seconds"]:>8.1f}')
+    print('* = حد باريتو (لا توجد تركيبة أسرع وأدق منها)')
+    if eligible:
+        best = eligible[0]
+        print(f'أسرع تركيبة بدقة >= {args.accuracy_floor}: MODEL_NAME={best["model"]} '
+              f'DETECTOR_BACKEND={best["detector"]} MATCH_THRESHOLD={best["best_threshold"]}')
+    else:
+        print(f'لا توجد تركيبة بدقة >= {args.accuracy_floor}')
+    for r in failed:
+        print(f'تعذر تشغيل {r["model"]}/{r["detector"]}: {r["error"]}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'pairs': len(pairs), 'images': len(paths), 'thresholds': THRESHOLDS,
+                       'results': results, 'failed': failed}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+تطابق ومكاسب محرك ONNX - ONNX Runtime parity and performance benchmark
+
+يشغّل عمليتين منفصلتين (INFERENCE_BACKEND=tensorflow ثم onnx) على نفس مجموعة
+الصور الثابتة، ويقارن:
+  - تطابق النموذج: الكوساين بين embeddings المحركين لنفس مدخلات الوجه بالضبط
+  - تطابق الخط كاملاً: الكوساين لنتيجة extract_embedding (يشمل اختلاف الكاشف)
+  - زمن البدء (الاستيراد وتحميل الأوزان والإحماء) وذاكرة العملية (RSS وذروتها)
+  - زمن النموذج وحده (دفعة 1 و 16) وزمن الخط كاملاً لكل صورة
+ويخرج برمز 1 إذا كان أدنى تطابق للنموذج أقل من --min-cosine.
+
+يتطلب تصدير الأوزان أولاً: python onnx_backend.py export
+
+    python benchmarks/onnx_parity.py --min-cosine 0.999
+    DETECTOR_BACKEND=yunet python benchmarks/onnx_parity.py --repeat 50
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+DEFAULT_IMAGE = os.path.join(ROOT, '..', 'test_face.jpg')
+
+BACKENDS = ('tensorflow', 'onnx')
+
+
+def fixed_images(args) -> list:
+    """صور RGB ثابتة: ملفات المجلد، أو نسخ من الصورة المرجعية بأحجام وزوايا وإضاءة مختلفة"""
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, '*.jp*g')) +
+                       glob.glob(os.path.join(args.images, '*.png')))
+        return [np.asarray(ImageOps.exif_transpose(Image.open(p)).convert('RGB')) for p in paths]
+
+    with Image.open(args.image) as source:
+        source = ImageOps.exif_transpose(source).convert('RGB')
+        images = []
+        for side in (320, 640, 1280):
+            scale = side / max(source.size)
+            resized = source.resize((round(source.width * scale), round(source.height * scale)),
+                                    Image.BICUBIC)
+            for angle in (0, 8, -8):
+                for brightness in (0.6, 1.0, 1.4):
+                    variant = ImageEnhance.Brightness(resized.rotate(angle, Image.BILINEAR)).enhance(brightness)
+                    images.append(np.asarray(variant))
+    return images
+
+
+def face_inputs(images: list) -> np.ndarray:
+    """مدخلات وجه متطابقة للمحركين: مربع المنتصف بحجم 224 (RGB بين 0 و 1)"""
+    crops = []
+    for image in images:
+        height, width = image.shape[:2]
+        side = min(height, width)
+        top, left = (height - side) // 2, (width - side) // 2
+        crop = Image.fromarray(image[top:top + side, left:left + side]).resize((224, 224), Image.BILINEAR)
+        crops.append(np.asarray(crop, dtype=np.float32) / 255.0)
+    return np.stack(crops)
+
+
+def rss_kb() -> dict:
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(('VmRSS:', 'VmHWM:')):
+                key, value = line.split(':')
+                values[key] = int(value.split()[0])
+    return values
+
+
+def run_worker(input_file: str, output_file: str, repeat: int) -> None:
+    """داخل العملية الفرعية: المحرك من INFERENCE_BACKEND"""
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import inference
+    from face_pipeline import extract_embedding
+
+    inference.warm_up()
+    if inference.warm_up_error:
+        with open(output_file, 'w') as f:
+            json.dump({'error': inference.warm_up_error}, f)
+        return
+    startup_seconds = time.perf_counter() - started
+    memory = rss_kb()
+
+    data = np.load(input_file, allow_pickle=True)
+    faces, images = data['faces'], list(data['images'])
+
+    model_embeddings = inference.embed_faces(list(faces))
+
+    def timed(fn, *fn_args) -> list:
+        latencies = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(*fn_args)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        return latencies
+
+    single_ms = timed(inference.embed_faces, [faces[0]])
+    batch_ms = timed(inference.embed_faces, list(faces[:16]))
+
+    pipeline, pipeline_ms = [], []
+    for image in images:
+        t0 = time.perf_counter()
+        result = extract_embedding(image)
+        pipeline_ms.append((time.perf_counter() - t0) * 1000)
+        pipeline.append(result.get('embedding') if result['success'] else None)
+
+    with open(output_file, 'w') as f:
+        json.dump({
+            'startup_seconds': startup_seconds,
+            'model_load_seconds': inference.model_load_seconds,
+            'rss_mb': memory['VmRSS'] / 1024,
+            'peak_rss_mb': rss_kb()['VmHWM'] / 1024,
+            'single_ms': single_ms,
+            'batch16_ms': batch_ms,
+            'pipeline_ms': pipeline_ms,
+            'model_embeddings': model_embeddings,
+            'pipeline_embeddings': pipeline
+        }, f)
+
+
+def cosine(a, b) -> float:
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def run_backend(backend: str, input_file: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        output_file = os.path.join(tmp, 'output.json')
+        process = subprocess.run(
+            [sys.executable, __file__, '--worker', input_file, output_file, str(args.repeat)],
+            cwd=ROOT, env=dict(os.environ, INFERENCE_BACKEND=backend),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        if not os.path.exists(output_file):
+            raise SystemExit(f'{backend}: {(process.stderr.strip().splitlines() or ["فشل"])[-1]}')
+        with open(output_file) as f:
+            output = json.load(f)
+    if 'error' in output:
+        raise SystemExit(f'{backend}: {output["error"]}')
+    return output
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--worker':
+        run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default=DEFAULT_IMAGE)
+    parser.add_argument('--images', help='مجلد صور بدل النسخ المولدة')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--min-cosine', type=float, default=0.999)
+    parser.add_argument('--output', help='حفظ الملخص في ملف JSON')
+    args = parser.parse_args()
+
+    images = fixed_images(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, 'input.npz')
+        holder = np.empty(len(images), dtype=object)
+        holder[:] = images
+        np.savez(input_file, faces=face_inputs(images), images=holder)
+        results = {backend: run_backend(backend, input_file, args) for backend in BACKENDS}
+
+    tf, onnx = results['tensorflow'], results['onnx']
+    model_cos = [cosine(a, b) for a, b in zip(tf['model_embeddings'], onnx['model_embeddings'])]
+    pipeline_cos = [cosine(a, b) for a, b in zip(tf['pipeline_embeddings'], onnx['pipeline_embeddings'])
+                    if a is not None and b is not None]
+    both_failed = sum(a is None and b is None for a, b in zip(tf['pipeline_embeddings'], onnx['pipeline_embeddings']))
+    one_failed = sum((a is None) != (b is None) for a, b in zip(tf['pipeline_embeddings'], onnx['pipeline_embeddings']))
+
+    print(f'{len(images)} images')
+    print(f'model parity:    min cosine {min(model_cos):.6f}, mean {np.mean(model_cos):.6f}')
+    if pipeline_cos:
+        print(f'pipeline parity: min cosine {min(pipeline_cos):.6f}, mean {np.mean(pipeline_cos):.6f}'
+              f' ({one_failed} detected by one backend only, {both_failed} by neither)')
+
+    print(f'\n{"backend":<12}{"startup s":>10}{"load s":>8}{"RSS MB":>8}{"peak MB":>9}'
+          f'{"embed x1 ms":>12}{"embed x16 ms":>13}{"pipeline ms":>12}')
+    for backend in BACKENDS:
+        r = results[backend]
+        print(f'{backend:<12}{r["startup_seconds"]:>10.2f}{r["model_load_seconds"]:>8.2f}{r["rss_mb"]:>8.0f}'
+              f'{r["peak_rss_mb"]:>9.0f}{np.median(r["single_ms"]):>12.2f}{np.median(r["batch16_ms"]):>13.2f}'
+              f'{np.median(r["pipeline_ms"]):>12.2f}')
+
+    if args.output:
+        summary = {
+            'images': len(images),
+            'model_cosine': {'min': min(model_cos), 'mean': float(np.mean(model_cos))},
+            'pipeline_cosine': {'min': min(pipeline_cos), 'mean': float(np.mean(pipeline_cos))}
+            if pipeline_cos else None,
+            'backends': {
+                backend: {key: value for key, value in r.items() if not key.endswith('embeddings')}
+                for backend, r in results.items()
+            }
+        }
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    if min(model_cos) < args.min_cosine:
+        print(f'FAIL: model cosine {min(model_cos):.6f} < {args.min_cosine}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+قياس تكلفة الملف المؤقت قبل الاستدلال - Temp JPEG round-trip benchmark
+
+يقارن المسار القديم (ترميز JPEG بجودة 95 ثم الكتابة على القرص ثم فك الترميز
+مرة ثانية ثم الحذف) بالمسار الحالي الذي يمرر المصفوفة مباشرة إلى DeepFace.
+لا يحتاج إلى DeepFace، فهو يقيس فقط ما يسبق الاستدلال.
+
+    python benchmarks/temp_image_roundtrip.py --image ../test_face.jpg --requests 500
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from face_pipeline import to_bgr  # noqa: E402
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(__file__), '..', '..', 'test_face.jpg')
+
+
+def read_io_counters() -> dict:
+    """قراءة عدادات استدعاءات النظام للقراءة والكتابة (لينكس فقط)"""
+    counters = {}
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, value = line.split(':')
+                counters[key.strip()] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def legacy_path(image: np.ndarray) -> np.ndarray:
+    """المسار القديم: save_temp_image ثم قراءة الملف كما تفعل DeepFace"""
+    img = Image.fromarray(image)
+    temp_file = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+    try:
+        img.save(temp_file.name, 'JPEG', quality=95)
+        temp_file.close()
+        with Image.open(temp_file.name) as reloaded:
+            return to_bgr(np.asarray(reloaded.convert('RGB')))
+    finally:
+        os.remove(temp_file.name)
+
+
+def in_memory_path(image: np.ndarray) -> np.ndarray:
+    """المسار الحالي: تحويل القنوات فقط"""
+    return to_bgr(image)
+
+
+def run(fn, image: np.ndarray, requests: int) -> dict:
+    """تشغيل المسار عدداً من المرات وجمع الإحصاءات"""
+    latencies = np.empty(requests)
+    before = read_io_counters()
+    started = time.perf_counter()
+    for i in range(requests):
+        t0 = time.perf_counter()
+        fn(image)
+        latencies[i] = time.perf_counter() - t0
+    total = time.perf_counter() - started
+    after = read_io_counters()
+
+    result = {
+        'total_s': total,
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+    }
+    for key in ('syscr', 'syscw', 'wchar'):
+        if key in before and key in after:
+            result[f'{key}_per_request'] = (after[key] - before[key]) / requests
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default=DEFAULT_IMAGE)
+    parser.add_argument('--requests', type=int, default=500,
+                        help='عدد عمليات الحضور المحاكاة (ذروة بداية الوردية)')
+    args = parser.parse_args()
+
+    with Image.open(args.image) as img:
+        image = np.asarray(img.convert('RGB'))
+
+    print(f'image: {image.shape[1]}x{image.shape[0]}, requests: {args.requests}')
+
+    # تسخين لتجنب احتساب تكلفة التحميل الأول
+    legacy_path(image)
+    in_memory_path(image)
+
+    legacy = run(legacy_path, image, args.requests)
+    current = run(in_memory_path, image, args.requests)
+
+    print(f'{"":<22}{"temp JPEG":>14}{"in-memory":>14}')
+    for key in legacy:
+        print(f'{key:<22}{legacy[key]:>14.3f}{current.get(key, 0):>14.3f}')
+
+    saved_ms = legacy['mean_ms'] - current['mean_ms']
+    print(f'\nsaved per request: {saved_ms:.3f} ms, '
+          f'per {args.requests} check-ins: {saved_ms * args.requests / 1000:.2f} s of worker time')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+ذاكرة عمليات gunicorn مع التحميل المسبق وبدونه - Worker memory (RSS/PSS) benchmark
+
+يشغّل الخدمة عبر gunicorn مرتين (PRELOAD_MODEL=false ثم true)، وينتظر جاهزية
+كل العمليات، ثم يقرأ /proc/<pid>/smaps_rollup للعملية الرئيسية والعمليات الابنة.
+PSS يقسم الصفحات المشتركة على العمليات التي تتشاركها، فمجموعه هو الذاكرة الفعلية.
+النموذج يُبنى بعد التفرع في الحالتين، فالأوزان نسخة خاصة في كل عملية: الفرق المتوقع في
+زمن الجاهزية، بينما RSS لكل عملية ومجموع PSS متقاربان (shared MB للمكتبات فقط).
+(Linux فقط)
+
+    python benchmarks/worker_memory.py --workers 4
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def memory_kb(pid: int) -> dict:
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, rest = line.partition(':')
+            if name in FIELDS:
+                values[name] = int(rest.split()[0])
+    return values
+
+
+def children(pid: int) -> list:
+    pids = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            pids.extend(int(p) for p in f.read().split())
+    return pids
+
+
+def wait_ready(port: int, workers: int, timeout: float) -> float:
+    """انتظار ردود 200 متتالية من /ready (يوزعها gunicorn على العمليات)"""
+    started = time.perf_counter()
+    streak = 0
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/ready', timeout=5):
+                streak += 1
+        except (urllib.error.URLError, ConnectionError, OSError):
+            streak = 0
+        if streak >= workers * 4:
+            return time.perf_counter() - started
+        time.sleep(0.25)
+    raise TimeoutError('الخدمة لم تصبح جاهزة')
+
+
+def measure(preload: bool, args) -> dict:
+    env = dict(os.environ, PRELOAD_MODEL='true' if preload else 'false',
+               PORT=str(args.port), WEB_CONCURRENCY=str(args.workers))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ready_seconds = wait_ready(args.port, args.workers, args.timeout)
+        if not preload:
+            # بدون إحماء تُحمّل الأوزان مع أول طلب: طلب detect لكل عملية
+            with open(args.image, 'rb') as f:
+                body = f.read()
+            for _ in range(args.workers * 4):
+                request = urllib.request.Request(
+                    f'http://127.0.0.1:{args.port}/api/face/detect', data=body,
+                    headers={'Content-Type': 'image/jpeg'}
+                )
+                try:
+                    urllib.request.urlopen(request, timeout=args.timeout).read()
+                except urllib.error.HTTPError:
+                    pass
+            ready_seconds = None
+
+        workers = [memory_kb(pid) for pid in children(server.pid)]
+        master = memory_kb(server.pid)
+        return {
+            'preload': preload,
+            'ready_seconds': ready_seconds,
+            'master': master,
+            'workers': workers,
+            'total_pss_kb': master['Pss'] + sum(w['Pss'] for w in workers),
+            'total_rss_kb': master['Rss'] + sum(w['Rss'] for w in workers)
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--image', default=os.path.join(ROOT, '..', 'test_face.jpg'),
+                        help='صورة لتحميل النموذج في كل عملية عند عدم الإحماء')
+    args = parser.parse_args()
+
+    print(f'{"preload":>8}{"ready s":>9}{"worker RSS MB":>15}{"worker PSS MB":>15}'
+          f'{"shared MB":>11}{"total RSS MB":>14}{"total PSS MB":>14}')
+    for preload in (False, True):
+        result = measure(preload, args)
+        workers = result['workers']
+        per_worker = lambda key: sum(w[key] for w in workers) / len(workers) / 1024  # noqa: E731
+        shared = sum(w['Shared_Clean'] + w['Shared_Dirty'] for w in workers) / len(workers) / 1024
+        ready = f'{result["ready_seconds"]:.1f}' if result['ready_seconds'] is not None else '-'
+        print(f'{str(preload):>8}{ready:>9}{per_worker("Rss"):>15.0f}{per_worker("Pss"):>15.0f}'
+              f'{shared:>11.0f}{result["total_rss_kb"] / 1024:>14.0f}{result["total_pss_kb"] / 1024:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
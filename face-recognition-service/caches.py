@@ -0,0 +1,114 @@
+"""
+ذاكرة مؤقتة LRU - LRU cache
+محدودة بعدد العناصر ومدة صلاحية اختيارية، مع عدادات الإصابة والإخفاق،
+ودمج الاستدعاءات المتزامنة لنفس المفتاح (single-flight)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """ذاكرة مؤقتة آمنة بين الخيوط تُخرج الأقدم استخداماً عند الامتلاء"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if not expires_at or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """حذف كل العناصر أو ما يطابق الشرط، وإرجاع عدد المحذوف"""
+        with self._lock:
+            if predicate is None:
+                count = len(self._data)
+                self._data.clear()
+                return count
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0
+            }
+
+
+class SingleFlight:
+    """الاستدعاءات المتزامنة لنفس المفتاح تنتظر نتيجة (أو استثناء) الاستدعاء الأول"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """تنفيذ fn مرة واحدة لكل مفتاح قيد التنفيذ؛ يُرجع (النتيجة، هل كانت مشتركة)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            return future.result(), True
+        
+        try:
+            value = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+        future.set_result(value)
+        return value, False
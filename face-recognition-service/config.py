@@ -0,0 +1,125 @@
+"""
+إعدادات خدمة التعرف على الوجه - Face Recognition Service settings
+تُقرأ من متغيرات البيئة (أو ملف .env)
+"""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# إعدادات
+MATCH_THRESHOLD = float(os.getenv('MATCH_THRESHOLD', '0.6'))
+MODEL_NAME = os.getenv('MODEL_NAME', 'Facenet512')  # نموذج دقيق
+DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'opencv')  # أسرع
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', '10485760'))
+
+# محرك الاستدلال: tensorflow (DeepFace) أو onnx (ONNX Runtime بأوزان مُصدّرة في ONNX_MODEL_DIR،
+# والكاشف yunet عبر OpenCV دون استيراد TensorFlow)؛ ONNX_THREADS = 0 يعني الافتراضي
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'tensorflow').lower()
+ONNX_MODEL_DIR = os.getenv('ONNX_MODEL_DIR', './data/onnx')
+ONNX_THREADS = int(os.getenv('ONNX_THREADS', '0'))
+
+# الاكتشاف المتدرج: كاشف أدق (مثل retinaface) يعمل فقط عند فشل DETECTOR_BACKEND أو انخفاض
+# ثقته عن DETECTOR_MIN_CONFIDENCE (مقياس الثقة يختلف بين الكواشف؛ 0 = عند الفشل فقط)
+DETECTOR_FALLBACK = os.getenv('DETECTOR_FALLBACK', '')
+DETECTOR_MIN_CONFIDENCE = float(os.getenv('DETECTOR_MIN_CONFIDENCE', '0'))
+
+# فحص الجودة قبل الـ embedding (quality.py): أدنى حدة (تباين Laplacian للوجه بحجم 112)، ومدى
+# متوسط إضاءة الوجه (0-255)، وأدنى نسبة لمساحة الوجه من الإطار؛ QUALITY_GATE=false يُرجع الدرجة دون رفض
+QUALITY_GATE = os.getenv('QUALITY_GATE', 'true').lower() == 'true'
+QUALITY_MIN_SHARPNESS = float(os.getenv('QUALITY_MIN_SHARPNESS', '15'))
+QUALITY_MIN_BRIGHTNESS = float(os.getenv('QUALITY_MIN_BRIGHTNESS', '40'))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv('QUALITY_MAX_BRIGHTNESS', '225'))
+QUALITY_MIN_FACE_RATIO = float(os.getenv('QUALITY_MIN_FACE_RATIO', '0.01'))
+
+# حدود الرفع قبل فك الترميز: عدد البكسلات لكل صورة والحجم الكلي للطلب (للدفعات)
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', '50000000'))
+MAX_REQUEST_SIZE = int(os.getenv('MAX_REQUEST_SIZE', str(64 * 2**20)))
+
+# فك ترميز JPEG بدقة مخفضة (أطول ضلع ≥ DECODE_MAX_SIDE) والاكتشاف على نسخة مصغرة
+# (DETECT_MAX_SIDE) ثم القص من الصورة المفكوكة؛ 0 = تعطيل
+DECODE_MAX_SIDE = int(os.getenv('DECODE_MAX_SIDE', '1600'))
+DETECT_MAX_SIDE = int(os.getenv('DETECT_MAX_SIDE', '640'))
+
+# تحميل النموذج والكاشف في عملية gunicorn الرئيسية قبل التفرع ثم الإحماء في كل عملية
+PRELOAD_MODEL = os.getenv('PRELOAD_MODEL', 'false').lower() == 'true'
+
+# مجمع عمليات الاستدلال: عدد العمليات (0 = الاستدلال داخل خيط الطلب)، أقصى طلبات
+# منتظرة قبل الرفض بـ 503، ومهلة الطلب بالثواني، وتثبيت كل عملية على نصيبها من الأنوية
+INFERENCE_PROCESSES = int(os.getenv('INFERENCE_PROCESSES', '0'))
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '64'))
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', '30'))
+INFERENCE_PIN_CPUS = os.getenv('INFERENCE_PIN_CPUS', 'true').lower() == 'true'
+
+# تجميع الطلبات المتزامنة في دفعة واحدة للنموذج
+BATCH_ENABLED = os.getenv('BATCH_ENABLED', 'false').lower() == 'true'
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '10'))
+BATCH_QUEUE_SIZE = int(os.getenv('BATCH_QUEUE_SIZE', '256'))
+
+# نقطة الدفعات /api/face/detect/batch
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '100'))
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', str(os.cpu_count() or 4)))
+
+# أقصى عدد embeddings مرشحة في /api/face/compare/many
+COMPARE_MAX_CANDIDATES = int(os.getenv('COMPARE_MAX_CANDIDATES', '100000'))
+
+# وضع الكشك (multi_face في /api/face/identify): أقصى عدد وجوه تُعالج في الصورة، الأكبر أولاً
+MULTI_FACE_MAX_FACES = int(os.getenv('MULTI_FACE_MAX_FACES', '10'))
+
+# بث الإطارات /api/face/checkin/stream: أدنى تداخل IoU لنفس المسار، عدد الإطارات بدون الوجه
+# قبل إنهاء المسار، ونسبة تحسن الجودة التي تستدعي embedding جديداً لمسار لم يُتعرف عليه
+STREAM_IOU_THRESHOLD = float(os.getenv('STREAM_IOU_THRESHOLD', '0.3'))
+STREAM_MAX_MISSES = int(os.getenv('STREAM_MAX_MISSES', '10'))
+STREAM_QUALITY_GAIN = float(os.getenv('STREAM_QUALITY_GAIN', '1.2'))
+STREAM_MAX_EMBEDDINGS = int(os.getenv('STREAM_MAX_EMBEDDINGS', '5'))
+
+# البحث التقريبي IVF-PQ للشركات الكبيرة
+ANN_NLIST = int(os.getenv('ANN_NLIST', '256'))
+ANN_M = int(os.getenv('ANN_M', '64'))
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', '8'))
+ANN_RERANK = int(os.getenv('ANN_RERANK', '4'))
+
+# مخزن الـ embeddings المحلي (memmap + WAL)، فارغ = بدون حفظ على القرص
+EMBEDDING_STORE_DIR = os.getenv('EMBEDDING_STORE_DIR', '')
+STORE_HEADROOM = int(os.getenv('STORE_HEADROOM', '1024'))
+STORE_CHECKPOINT_BYTES = int(os.getenv('STORE_CHECKPOINT_BYTES', str(64 * 2**20)))
+STORE_FSYNC = os.getenv('STORE_FSYNC', 'false').lower() == 'true'
+
+# قوالب التحقق المتعددة لكل مستخدم (التحقق بـ user_id): العدد الكلي بما فيه التسجيل (1 = التسجيل فقط)،
+# وأدنى تشابه مع التسجيل وأدنى quality_score لتحديث القوالب، وتشابه مثال جديد مع قالب موجود يُعتبر عنده
+# مكرراً (يُحدَّث المركز فقط). تُحفظ بجانب مخزن الفهارس إذا حُدد EMBEDDING_STORE_DIR
+TEMPLATE_MAX = int(os.getenv('TEMPLATE_MAX', '5'))
+TEMPLATE_UPDATE_THRESHOLD = float(os.getenv('TEMPLATE_UPDATE_THRESHOLD', '0.85'))
+TEMPLATE_MIN_QUALITY = float(os.getenv('TEMPLATE_MIN_QUALITY', '0.5'))
+TEMPLATE_DUPLICATE_THRESHOLD = float(os.getenv('TEMPLATE_DUPLICATE_THRESHOLD', '0.975'))
+TEMPLATE_STORE_DIR = os.getenv(
+    'TEMPLATE_STORE_DIR', EMBEDDING_STORE_DIR.rstrip('/') + '-templates' if EMBEDDING_STORE_DIR else '')
+
+# ذاكرة مؤقتة للـ embeddings المرجعية (التحقق بـ user_id)، TTL بالثواني (0 = بدون انتهاء)؛
+# الإبطال يصل للعملية المستقبلة فقط، فالـ TTL يحد مدة بقاء embedding قديم في بقية العمليات
+VERIFY_CACHE_SIZE = int(os.getenv('VERIFY_CACHE_SIZE', '10000'))
+VERIFY_CACHE_TTL = float(os.getenv('VERIFY_CACHE_TTL', '300'))
+
+# ذاكرة مؤقتة لنتائج الاستخراج بمفتاح بصمة BLAKE2b لبكسلات الصورة بعد فك الترميز
+# (إعادة إرسال نفس الصورة)؛ EMBEDDING_CACHE_SIZE = 0 يعطلها، والمدة بالثواني (0 = بدون انتهاء)
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '1000'))
+EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', '300'))
+
+# كشف إعادة استخدام صور التحقق (pHash للوجه المحاذى لكل مستخدم)، معطل افتراضياً لأنه قد يرفض حضوراً حقيقياً
+# متكرراً أمام كاميرا ثابتة: أقصى مسافة Hamming من 64 بت تُعتبر نفس الصورة، ونافذة البصمات بالثواني، ومهلة
+# تُتجاهل فيها إعادة الإرسال الفورية (إعادة محاولة العميل).
+# تُحفظ البصمات في سجل مشترك بين العمليات بجانب مخزن الفهارس إذا حُدد EMBEDDING_STORE_DIR (فارغ = ذاكرة فقط)
+REPLAY_CHECK = os.getenv('REPLAY_CHECK', 'false').lower() == 'true'
+REPLAY_MAX_DISTANCE = int(os.getenv('REPLAY_MAX_DISTANCE', '4'))
+REPLAY_WINDOW = float(os.getenv('REPLAY_WINDOW', str(30 * 86400)))
+REPLAY_GRACE_SECONDS = float(os.getenv('REPLAY_GRACE_SECONDS', '10'))
+REPLAY_MAX_HASHES = int(os.getenv('REPLAY_MAX_HASHES', '500'))
+REPLAY_MAX_USERS = int(os.getenv('REPLAY_MAX_USERS', '100000'))
+REPLAY_STORE_DIR = os.getenv(
+    'REPLAY_STORE_DIR', EMBEDDING_STORE_DIR.rstrip('/') + '-replay' if EMBEDDING_STORE_DIR else '')
+
+# واجهات الإدارة (مثل التحليل عند الطلب) تتطلب الترويسة X-Admin-Token؛ فارغ = معطلة
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', './data/profiles')
@@ -0,0 +1,67 @@
+"""
+صيغ نقل الـ embeddings - Embedding wire formats
+json: قائمة أرقام (الافتراضي)
+f32b64 / f16b64: بايتات float32 / float16 (little-endian) بترميز Base64
+"""
+
+import base64
+from typing import Union
+
+import numpy as np
+
+EMBEDDING_FORMATS = {
+    'json': None,
+    'f32b64': np.dtype('<f4'),
+    'f16b64': np.dtype('<f2'),
+}
+
+
+class EmbeddingFormatError(ValueError):
+    """صيغة embedding غير مدعومة أو بيانات غير صالحة"""
+
+
+def check_format(fmt: str) -> str:
+    if fmt not in EMBEDDING_FORMATS:
+        raise EmbeddingFormatError(
+            f'صيغة embedding غير مدعومة: {fmt} (المدعوم: {", ".join(EMBEDDING_FORMATS)})'
+        )
+    return fmt
+
+
+def decode_embedding(value, fmt: str = 'json') -> Union[list, np.ndarray]:
+    """قراءة embedding من الطلب؛ الصيغ الثنائية تُقرأ بـ np.frombuffer دون نسخ"""
+    dtype = EMBEDDING_FORMATS[check_format(fmt)]
+    if dtype is None:
+        if isinstance(value, str):
+            raise EmbeddingFormatError('الـ embedding نصي بينما embedding_format هي json')
+        return value
+
+    if not isinstance(value, str):
+        # السماح بالقوائم حتى مع الصيغ الثنائية لتسهيل الانتقال
+        return value
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except (ValueError, TypeError):
+        raise EmbeddingFormatError('ترميز Base64 غير صالح للـ embedding')
+    if len(raw) % dtype.itemsize:
+        raise EmbeddingFormatError('طول بيانات الـ embedding لا يطابق الصيغة')
+    vector = np.frombuffer(raw, dtype=dtype)
+    return vector if dtype.itemsize == 4 else vector.astype(np.float32)
+
+
+def decode_matrix(value, fmt: str = 'json', dim: int = None) -> np.ndarray:
+    """قراءة مصفوفة embeddings: قائمة قوائم أو قائمة نصوص أو نص واحد لكل الصفوف"""
+    if isinstance(value, str):
+        flat = decode_embedding(value, fmt)
+        if dim is None or len(flat) % dim:
+            raise EmbeddingFormatError('حجم المصفوفة لا يقبل القسمة على حجم الـ embedding')
+        return np.asarray(flat, dtype=np.float32).reshape(-1, dim)
+    return np.asarray([decode_embedding(row, fmt) for row in value], dtype=np.float32)
+
+
+def encode_embedding(vector, fmt: str = 'json'):
+    """كتابة embedding في الرد بالصيغة المطلوبة"""
+    dtype = EMBEDDING_FORMATS[check_format(fmt)]
+    if dtype is None:
+        return vector.tolist() if isinstance(vector, np.ndarray) else vector
+    return base64.b64encode(np.asarray(vector, dtype=dtype).tobytes()).decode('ascii')
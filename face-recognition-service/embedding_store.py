@@ -0,0 +1,354 @@
+"""
+مخزن الـ embeddings المحلي - Memory-mapped embedding store
+لكل شركة لقطة float32 مقروءة عبر np.memmap (تتشاركها عمليات gunicorn عبر
+ذاكرة نظام التشغيل) مع سجل WAL إلحاقي لعمليات الإضافة والتحديث والحذف.
+
+المجلد لكل شركة:
+    MANIFEST           الجيل الحالي والأبعاد وعدد الصفوف (وملف الفهرس التقريبي إن وُجد)
+    shard-<gen>.f32    مصفوفة الصفوف (مع سعة إضافية للإلحاق)
+    shard-<gen>.ids    معرفات المستخدمين، سطر لكل صف
+    wal-<gen>.log      العمليات منذ آخر لقطة
+    ann-<n>.npz        مراكز وقواميس IVF-PQ المدربة (اختياري)
+"""
+
+import fcntl
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ann_index import IVFPQIndex
+from face_index import FaceIndex
+
+# نوع العملية، طول المعرف، طول المتجه بالبايت، CRC32 للمحتوى
+RECORD = struct.Struct('<BHII')
+OP_UPSERT = 1
+OP_DELETE = 2
+
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_.-]{1,128}$')
+
+
+def company_dirname(company_id: str) -> str:
+    """اسم مجلد آمن للشركة"""
+    if _SAFE_NAME.match(company_id) and company_id not in ('.', '..'):
+        return company_id
+    return 'h-' + format(zlib.crc32(company_id.encode('utf-8')), '08x')
+
+
+def encode_record(op: int, user_id: str, vector: Optional[np.ndarray] = None) -> bytes:
+    uid = user_id.encode('utf-8')
+    vec = b'' if vector is None else np.asarray(vector, dtype='<f4').tobytes()
+    return RECORD.pack(op, len(uid), len(vec), zlib.crc32(uid + vec)) + uid + vec
+
+
+def decode_records(buffer: bytes) -> Tuple[List[tuple], int]:
+    """قراءة السجلات الكاملة من المخزن المؤقت وإرجاعها مع عدد البايتات المقروءة"""
+    records, pos = [], 0
+    while pos + RECORD.size <= len(buffer):
+        op, uid_len, vec_len, crc = RECORD.unpack_from(buffer, pos)
+        end = pos + RECORD.size + uid_len + vec_len
+        if end > len(buffer):
+            break  # سجل غير مكتمل (كتابة جارية)
+        payload = buffer[pos + RECORD.size:end]
+        if zlib.crc32(payload) != crc:
+            break  # سجل تالف: التوقف عند آخر سجل سليم
+        user_id = payload[:uid_len].decode('utf-8')
+        vector = np.frombuffer(payload, dtype='<f4', offset=uid_len) if vec_len else None
+        records.append((op, user_id, vector))
+        pos = end
+    return records, pos
+
+
+def apply_records(index: FaceIndex, records: List[tuple]) -> None:
+    """تطبيق سجلات WAL على الفهرس مع تجميع الإضافات المتتالية"""
+    pending_ids, pending_vectors = [], []
+
+    def flush():
+        if pending_ids:
+            index.upsert_many(pending_ids, np.stack(pending_vectors))
+            pending_ids.clear()
+            pending_vectors.clear()
+
+    for op, user_id, vector in records:
+        if op == OP_UPSERT:
+            pending_ids.append(user_id)
+            pending_vectors.append(vector)
+        elif op == OP_DELETE:
+            flush()
+            if user_id in index:
+                index.remove(user_id)
+    flush()
+
+
+class CompanyShard:
+    """ملفات شركة واحدة: لقطة memmap وسجل WAL"""
+
+    def __init__(self, company_id: str, directory: str, headroom: int = 1024, fsync: bool = False):
+        self.company_id = company_id
+        self.directory = directory
+        self.headroom = headroom
+        self.fsync = fsync
+        self.generation = 0
+        self.offset = 0
+        self.ann = None  # مدخل MANIFEST للفهرس التقريبي: {'file', 'version', 'rerank'}
+        self._manifest_inode = None
+        self._exclusive_depth = 0
+        self.lock = threading.RLock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def wal_path(self) -> str:
+        return self._path(f'wal-{self.generation}.log')
+
+    def exists(self) -> bool:
+        return os.path.exists(self._path('MANIFEST')) or os.path.exists(self._path('wal-0.log'))
+
+    @contextmanager
+    def exclusive(self):
+        """قفل بين الخيوط وبين عمليات gunicorn للكتابة على السجل (قابل للتداخل في نفس الخيط)"""
+        with self.lock:
+            if self._exclusive_depth:
+                # flock على واصف ملف جديد يتعارض مع قفل نفس العملية
+                self._exclusive_depth += 1
+                try:
+                    yield
+                finally:
+                    self._exclusive_depth -= 1
+                return
+            if not os.path.exists(self._path('COMPANY')):
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._path('COMPANY'), 'w', encoding='utf-8') as f:
+                    f.write(self.company_id)
+            with open(self._path('LOCK'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._exclusive_depth = 1
+                try:
+                    yield
+                finally:
+                    self._exclusive_depth = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _manifest_stat(self):
+        try:
+            return os.stat(self._path('MANIFEST')).st_ino
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> FaceIndex:
+        """ربط اللقطة بالذاكرة ثم إعادة تشغيل السجل"""
+        with self.lock:
+            index = FaceIndex()
+            self._manifest_inode = self._manifest_stat()
+            try:
+                with open(self._path('MANIFEST')) as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                manifest = None
+
+            self.generation = manifest['generation'] if manifest else 0
+            self.ann = manifest.get('ann') if manifest else None
+            if self.ann:
+                index.ann_source = (self._path(self.ann['file']), self.ann['rerank'])
+            if manifest and manifest['dim']:
+                with open(self._path(f'shard-{self.generation}.ids'), encoding='utf-8') as f:
+                    content = f.read()
+                ids = content.split('\n') if content else []
+                # copy-on-write: الصفحات مشتركة حتى يُكتب عليها
+                matrix = np.memmap(
+                    self._path(f'shard-{self.generation}.f32'), dtype=np.float32, mode='c',
+                    shape=(manifest['capacity'], manifest['dim'])
+                )
+                index.attach(ids, matrix)
+
+            self.offset = 0
+            self.replay(index)
+            if self._wal_size() > self.offset:
+                # بقية غير مقروءة: كتابة جارية أو سجل ممزق من عملية تعطلت
+                with self.exclusive():
+                    self.replay(index)
+                    self.truncate_tail()
+            return index
+
+    def _wal_size(self) -> int:
+        try:
+            return os.path.getsize(self.wal_path)
+        except FileNotFoundError:
+            return 0
+
+    def truncate_tail(self) -> None:
+        """قص ما بعد آخر سجل سليم (داخل exclusive وبعد replay)
+        
+        مع القفل لا توجد كتابة جارية، فالبقية سجل ممزق من عملية تعطلت أثناء الكتابة؛
+        بدون القص تُلحق السجلات التالية بعده فلا تقرؤها بقية العمليات ولا إعادة التشغيل.
+        """
+        if self._wal_size() > self.offset:
+            os.truncate(self.wal_path, self.offset)
+
+    def stale(self) -> bool:
+        """هل كتبت عملية أخرى سجلات أو لقطة جديدة؟"""
+        if self._manifest_stat() != self._manifest_inode:
+            return True
+        try:
+            return os.path.getsize(self.wal_path) > self.offset
+        except FileNotFoundError:
+            return False
+
+    def generation_changed(self) -> bool:
+        return self._manifest_stat() != self._manifest_inode
+
+    def replay(self, index: FaceIndex) -> int:
+        """تطبيق سجلات WAL الجديدة منذ آخر إزاحة"""
+        try:
+            with open(self.wal_path, 'rb') as f:
+                f.seek(self.offset)
+                buffer = f.read()
+        except FileNotFoundError:
+            return 0
+        records, consumed = decode_records(buffer)
+        apply_records(index, records)
+        self.offset += consumed
+        return len(records)
+
+    def append(self, records: List[bytes]) -> None:
+        """إلحاق سجلات بالـ WAL (داخل exclusive، والفهرس مُزامن حتى self.offset)"""
+        self.truncate_tail()
+        with open(self.wal_path, 'ab') as f:
+            f.write(b''.join(records))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self.offset = f.tell()
+
+    def log_upsert(self, user_ids: List[str], vectors: np.ndarray) -> None:
+        self.append([encode_record(OP_UPSERT, u, v) for u, v in zip(user_ids, vectors)])
+
+    def log_delete(self, user_id: str) -> None:
+        self.append([encode_record(OP_DELETE, user_id)])
+
+    def checkpoint(self, index: FaceIndex) -> dict:
+        """كتابة لقطة جديدة من الفهرس وبدء سجل فارغ (داخل exclusive)"""
+        ids, vectors = index.snapshot()
+        generation = self.generation + 1
+        dim = vectors.shape[1] if len(ids) else (index.dim or 0)
+        capacity = len(ids) + self.headroom
+
+        if dim:
+            shard = np.memmap(self._path(f'shard-{generation}.f32'), dtype=np.float32,
+                              mode='w+', shape=(capacity, dim))
+            shard[:len(ids)] = vectors
+            shard.flush()
+            del shard
+        with open(self._path(f'shard-{generation}.ids'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(ids))
+        open(self._path(f'wal-{generation}.log'), 'wb').close()
+
+        manifest = {'generation': generation, 'dim': dim, 'count': len(ids), 'capacity': capacity}
+        if self.ann:
+            manifest['ann'] = self.ann
+        self._write_manifest(manifest)
+
+        previous = self.generation
+        self.generation = generation
+        self.offset = 0
+
+        # العمليات الأخرى تبقى قادرة على قراءة الملفات القديمة المربوطة حتى تعيد التحميل
+        for name in (f'shard-{previous}.f32', f'shard-{previous}.ids', f'wal-{previous}.log'):
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+
+        if dim:
+            index.attach(ids, np.memmap(self._path(f'shard-{generation}.f32'), dtype=np.float32,
+                                        mode='c', shape=(capacity, dim)))
+        return manifest
+
+    def _write_manifest(self, manifest: dict) -> None:
+        """استبدال MANIFEST ذرياً؛ تغير الـ inode يجعل بقية العمليات تعيد التحميل"""
+        tmp = self._path('MANIFEST.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path('MANIFEST'))
+        self._manifest_inode = self._manifest_stat()
+
+    def save_ann(self, ann: Optional[IVFPQIndex], rerank: int) -> Optional[Tuple[str, int]]:
+        """حفظ فهرس IVF-PQ مدرب (أو حذفه مع None) وتسجيله في MANIFEST (داخل exclusive)
+        
+        يُرجع (المسار، rerank) لـ FaceIndex.ann_source. الجيل والسجل لا يتغيران، لكن
+        بقية العمليات ترى MANIFEST جديداً فتعيد التحميل وترمّز الصفوف عند أول بحث.
+        """
+        try:
+            with open(self._path('MANIFEST')) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {'generation': self.generation, 'dim': 0, 'count': 0, 'capacity': 0}
+        
+        previous = manifest.pop('ann', None)
+        if ann is not None:
+            version = (previous or self.ann or {}).get('version', 0) + 1
+            self.ann = {'file': f'ann-{version}.npz', 'version': version, 'rerank': rerank}
+            ann.save(self._path(self.ann['file']))
+            manifest['ann'] = self.ann
+        else:
+            self.ann = None
+        self._write_manifest(manifest)
+        
+        if previous and previous['file'] != (self.ann or {}).get('file'):
+            try:
+                os.remove(self._path(previous['file']))
+            except FileNotFoundError:
+                pass
+        return (self._path(self.ann['file']), rerank) if self.ann else None
+
+    def stats(self) -> dict:
+        try:
+            wal_bytes = os.path.getsize(self.wal_path)
+        except FileNotFoundError:
+            wal_bytes = 0
+        return {'generation': self.generation, 'wal_bytes': wal_bytes}
+
+
+class EmbeddingStore:
+    """مخزن الشركات على القرص"""
+
+    def __init__(self, root: str, headroom: int = 1024,
+                 checkpoint_bytes: int = 64 * 2**20, fsync: bool = False):
+        self.root = root
+        self.headroom = headroom
+        self.checkpoint_bytes = checkpoint_bytes
+        self.fsync = fsync
+        self._shards: Dict[str, CompanyShard] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def shard(self, company_id: str) -> CompanyShard:
+        shard = self._shards.get(company_id)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(company_id, CompanyShard(
+                    company_id,
+                    os.path.join(self.root, company_dirname(company_id)),
+                    headroom=self.headroom, fsync=self.fsync
+                ))
+        return shard
+
+    def companies(self) -> List[str]:
+        """معرفات الشركات المخزنة على القرص"""
+        companies = []
+        for name in sorted(os.listdir(self.root)):
+            try:
+                with open(os.path.join(self.root, name, 'COMPANY'), encoding='utf-8') as f:
+                    companies.append(f.read())
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+        return companies
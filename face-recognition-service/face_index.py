@@ -0,0 +1,411 @@
+"""
+فهرس الوجوه لكل شركة - Per-company face index
+مصفوفة float32 من الـ embeddings المطبّعة (L2) بحيث يكون البحث ضرب مصفوفة في متجه واحد
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ann_index import IVFPQIndex
+
+
+def normalize(vectors) -> np.ndarray:
+    """تطبيع متجه أو مصفوفة متجهات (L2) بصيغة float32"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class FaceIndex:
+    """فهرس embeddings لشركة واحدة مع إضافة وتحديث وحذف وبحث top-k"""
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 1024):
+        self.dim = dim
+        self._capacity = capacity
+        self._matrix = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # فهرس تقريبي اختياري للشركات الكبيرة، مع إعادة ترتيب دقيقة للمرشحين
+        self.ann: Optional[IVFPQIndex] = None
+        self.rerank = 4
+        self._version = 0
+        # فهرس تقريبي محفوظ في المخزن (المسار، rerank) يُرمَّز عند أول بحث في كل عملية
+        self.ann_source: Optional[Tuple[str, int]] = None
+        self._ann_loading = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._rows
+
+    def _check_dim(self, dim: int):
+        if self.dim is None:
+            self.dim = dim
+        elif dim != self.dim:
+            raise ValueError(f'حجم الـ embedding {dim} لا يطابق حجم الفهرس {self.dim}')
+
+    def attach(self, user_ids: List[str], matrix: np.ndarray) -> None:
+        """ربط الفهرس بمصفوفة موجودة (مثل np.memmap) دون نسخ"""
+        with self._lock:
+            self.dim = matrix.shape[1]
+            self._matrix = matrix
+            self._ids = list(user_ids)
+            self._rows = {user_id: row for row, user_id in enumerate(self._ids)}
+            self._version += 1
+
+    def user_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._ids)
+
+    def snapshot(self) -> Tuple[List[str], np.ndarray]:
+        """نسخة من المعرفات والصفوف الحالية"""
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return [], np.empty((0, self.dim or 0), dtype=np.float32)
+            return list(self._ids), np.array(self._matrix[:count])
+
+    def adopt_ann(self, ann: IVFPQIndex, rerank: int) -> None:
+        """نقل فهرس تقريبي مدرب من نسخة سابقة ومزامنته مع الصفوف الحالية"""
+        with self._lock:
+            current = set(self._ids)
+            for user_id in list(ann._location):
+                if user_id not in current:
+                    ann.remove(user_id)
+            if self._ids:
+                ann.add_many(self._ids, self._matrix[:len(self._ids)])
+            self.ann = ann
+            self.rerank = rerank
+
+    def _reserve(self, rows: int):
+        """حجز سعة كافية للمصفوفة مع مضاعفة الحجم عند الحاجة"""
+        if self._matrix is None:
+            self._matrix = np.empty((max(self._capacity, rows), self.dim), dtype=np.float32)
+        elif rows > len(self._matrix):
+            grown = np.empty((max(rows, 2 * len(self._matrix)), self.dim), dtype=np.float32)
+            grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+            self._matrix = grown
+
+    def add(self, user_id: str, embedding) -> None:
+        """إضافة مستخدم جديد"""
+        vector = normalize(embedding)
+        with self._lock:
+            if user_id in self._rows:
+                raise KeyError(user_id)
+            self._check_dim(vector.shape[-1])
+            self._append(user_id, vector)
+
+    def update(self, user_id: str, embedding) -> None:
+        """تحديث embedding مستخدم موجود"""
+        vector = normalize(embedding)
+        with self._lock:
+            if user_id not in self._rows:
+                raise KeyError(user_id)
+            self._check_dim(vector.shape[-1])
+            self._matrix[self._rows[user_id]] = vector
+            self._version += 1
+            if self.ann is not None:
+                self.ann.add(user_id, vector)
+
+    def upsert_many(self, user_ids: Iterable[str], embeddings) -> int:
+        """إضافة أو تحديث عدة مستخدمين دفعة واحدة، وإرجاع عدد المضافين الجدد"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        vectors = normalize(embeddings).reshape(len(user_ids), -1)
+        with self._lock:
+            self._check_dim(vectors.shape[-1])
+            added = 0
+            self._reserve(len(self._ids) + len(user_ids))
+            for user_id, vector in zip(user_ids, vectors):
+                row = self._rows.get(user_id)
+                if row is None:
+                    self._append(user_id, vector, update_ann=False)
+                    added += 1
+                else:
+                    self._matrix[row] = vector
+            self._version += 1
+            if self.ann is not None:
+                self.ann.add_many(user_ids, vectors)
+            return added
+
+    def _append(self, user_id: str, vector: np.ndarray, update_ann: bool = True):
+        row = len(self._ids)
+        self._reserve(row + 1)
+        self._matrix[row] = vector
+        self._ids.append(user_id)
+        self._rows[user_id] = row
+        self._version += 1
+        if update_ann and self.ann is not None:
+            self.ann.add(user_id, vector)
+
+    def remove(self, user_id: str) -> None:
+        """حذف مستخدم بنقل آخر صف مكانه"""
+        with self._lock:
+            row = self._rows.pop(user_id)
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._ids.pop()
+            self._version += 1
+            if self.ann is not None:
+                self.ann.remove(user_id)
+
+    def get(self, user_id: str) -> Optional[np.ndarray]:
+        """إرجاع نسخة من الـ embedding المطبّع للمستخدم"""
+        with self._lock:
+            row = self._rows.get(user_id)
+            return None if row is None else self._matrix[row].copy()
+
+    def train_ann(self, nlist: int, m: int, nprobe: int, rerank: int = 4) -> dict:
+        """تدريب فهرس IVF-PQ على المتجهات الحالية وتفعيله للبحث"""
+        with self._lock:
+            count = len(self._ids)
+            if count < nlist * 4:
+                raise ValueError(f'عدد الوجوه {count} قليل جداً لـ nlist={nlist}')
+            vectors = self._matrix[:count].copy()
+        
+        ann = IVFPQIndex(nlist=nlist, m=m, nprobe=nprobe)
+        ann.train(vectors)
+        self._fill_ann(ann, rerank)
+        return ann.stats()
+
+    def _fill_ann(self, ann: IVFPQIndex, rerank: int) -> None:
+        """ترميز الصفوف الحالية في فهرس مدرب خارج القفل ثم تفعيله للبحث"""
+        with self._lock:
+            version = self._version
+            user_ids = list(self._ids)
+            vectors = self._matrix[:len(user_ids)].copy()
+        ann.add_many(user_ids, vectors)
+        
+        with self._lock:
+            if self._version != version:
+                # إعادة ترميز ما تغير أثناء الترميز
+                for user_id in set(user_ids) - set(self._rows):
+                    ann.remove(user_id)
+                ann.add_many(self._ids, self._matrix[:len(self._ids)])
+            self.ann = ann
+            self.rerank = max(1, rerank)
+
+    def ensure_ann(self) -> Optional[IVFPQIndex]:
+        """الفهرس التقريبي، مع تحميل المحفوظ في المخزن عند أول حاجة إليه"""
+        source = self.ann_source
+        if self.ann is not None or source is None:
+            return self.ann
+        with self._ann_loading:
+            if self.ann is None and self.ann_source is source:
+                try:
+                    ann = IVFPQIndex.load(source[0])
+                except FileNotFoundError:
+                    # أُعيد التدريب أو أُلغي في عملية أخرى؛ المزامنة التالية تجلب MANIFEST الجديد
+                    self.ann_source = None
+                    return None
+                self._fill_ann(ann, source[1])
+        return self.ann
+
+    def sample(self, count: int, seed: int = 0) -> np.ndarray:
+        """عينة عشوائية من المتجهات المسجلة (لقياس الاستدعاء)"""
+        with self._lock:
+            rng = np.random.default_rng(seed)
+            rows = rng.choice(len(self._ids), min(count, len(self._ids)), replace=False)
+            return self._matrix[rows].copy()
+
+    def drop_ann(self) -> None:
+        with self._lock:
+            self.ann = None
+            self.ann_source = None
+
+    def search(self, probe, top_k: int = 5, nprobe: Optional[int] = None,
+               exact: bool = False) -> List[Tuple[str, float]]:
+        """أقرب top_k مستخدمين للمتجه بالتشابه بالكوساين"""
+        query = normalize(probe)
+        if not exact:
+            self.ensure_ann()
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return []
+            if query.shape[-1] != self.dim:
+                raise ValueError(f'حجم الـ embedding {query.shape[-1]} لا يطابق حجم الفهرس {self.dim}')
+
+            if self.ann is not None and not exact:
+                # مرشحون تقريبيون ثم إعادة ترتيب بالمتجهات الدقيقة
+                candidates = self.ann.search(query, top_k * self.rerank, nprobe)
+                rows = np.array([self._rows[u] for u, _ in candidates if u in self._rows], dtype=np.int64)
+                if len(rows) == 0:
+                    return []
+                scores = self._matrix[rows] @ query
+            else:
+                rows = np.arange(count)
+                scores = self._matrix[:count] @ query
+
+            k = min(top_k, len(rows))
+            if k < len(rows):
+                best = np.argpartition(-scores, k - 1)[:k]
+            else:
+                best = np.arange(len(rows))
+            best = best[np.argsort(-scores[best])]
+            return [(self._ids[rows[i]], float(scores[i])) for i in best]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._ids),
+                'dim': self.dim,
+                'capacity': 0 if self._matrix is None else len(self._matrix),
+                'memory_bytes': 0 if self._matrix is None else self._matrix.nbytes,
+                'ann': self.ann.stats() if self.ann is not None
+                else {'trained': True, 'loaded': False} if self.ann_source is not None else None
+            }
+
+
+class FaceIndexRegistry:
+    """فهارس الشركات في الذاكرة، مع مخزن اختياري على القرص (EmbeddingStore)"""
+
+    def __init__(self, store=None):
+        self.store = store
+        self._indexes: Dict[str, FaceIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, company_id: str, create: bool = False) -> Optional[FaceIndex]:
+        index = self._indexes.get(company_id)
+        if self.store is not None:
+            return self._sync(company_id, index, create)
+        if index is None and create:
+            with self._lock:
+                index = self._indexes.setdefault(company_id, FaceIndex())
+        return index
+
+    def _sync(self, company_id: str, index: Optional[FaceIndex], create: bool) -> Optional[FaceIndex]:
+        """تحميل الفهرس من المخزن أو تطبيق ما كتبته العمليات الأخرى"""
+        shard = self.store.shard(company_id)
+        if index is not None and not shard.stale():
+            return index
+
+        with shard.lock:
+            index = self._indexes.get(company_id)
+            if index is None:
+                if not create and not shard.exists():
+                    return None
+                index = shard.load()
+            elif shard.generation_changed():
+                fresh = shard.load()
+                # نفس الفهرس التقريبي المحفوظ (أو غير محفوظ): نقله بدل إعادة الترميز
+                if index.ann is not None and index.ann_source == fresh.ann_source:
+                    fresh.adopt_ann(index.ann, index.rerank)
+                index = fresh
+            else:
+                shard.replay(index)
+            self._indexes[company_id] = index
+            return index
+
+    @contextmanager
+    def _writing(self, company_id: str):
+        """فهرس الشركة للكتابة، مع قفل السجل عند وجود مخزن"""
+        if self.store is None:
+            yield self.get(company_id, create=True), None
+            return
+
+        shard = self.store.shard(company_id)
+        with shard.exclusive():
+            yield self.get(company_id, create=True), shard
+            if shard.offset > self.store.checkpoint_bytes:
+                shard.checkpoint(self._indexes[company_id])
+
+    @staticmethod
+    def _check_user_id(user_id: str):
+        if not user_id or '\n' in user_id:
+            raise ValueError('معرف المستخدم غير صالح')
+
+    def add(self, company_id: str, user_id: str, embedding) -> FaceIndex:
+        self._check_user_id(user_id)
+        with self._writing(company_id) as (index, shard):
+            index.add(user_id, embedding)
+            if shard is not None:
+                shard.log_upsert([user_id], [index.get(user_id)])
+        return index
+
+    def update(self, company_id: str, user_id: str, embedding) -> FaceIndex:
+        with self._writing(company_id) as (index, shard):
+            index.update(user_id, embedding)
+            if shard is not None:
+                shard.log_upsert([user_id], [index.get(user_id)])
+        return index
+
+    def upsert_many(self, company_id: str, user_ids: List[str], embeddings) -> Tuple[FaceIndex, int]:
+        for user_id in user_ids:
+            self._check_user_id(user_id)
+        with self._writing(company_id) as (index, shard):
+            added = index.upsert_many(user_ids, embeddings)
+            if shard is not None and user_ids:
+                shard.log_upsert(user_ids, normalize(embeddings).reshape(len(user_ids), -1))
+        return index, added
+
+    def remove(self, company_id: str, user_id: str) -> FaceIndex:
+        with self._writing(company_id) as (index, shard):
+            index.remove(user_id)
+            if shard is not None:
+                shard.log_delete(user_id)
+        return index
+
+    def train_ann(self, company_id: str, nlist: int, m: int, nprobe: int, rerank: int = 4) -> dict:
+        """تدريب فهرس IVF-PQ للشركة وحفظ قواميسه في المخزن لتحمّله كل العمليات"""
+        index = self.get(company_id)
+        if index is None:
+            raise KeyError(company_id)
+        stats = index.train_ann(nlist, m, nprobe, rerank)
+        if self.store is not None:
+            with self._writing(company_id) as (index, shard):
+                index.ann_source = shard.save_ann(index.ann, index.rerank)
+        return stats
+
+    def drop_ann(self, company_id: str) -> None:
+        """إلغاء الفهرس التقريبي للشركة من الذاكرة والمخزن"""
+        if self.store is None:
+            index = self.get(company_id)
+            if index is not None:
+                index.drop_ann()
+            return
+        with self._writing(company_id) as (index, shard):
+            index.drop_ann()
+            shard.save_ann(None, 0)
+
+    def checkpoint(self, company_id: str) -> Optional[dict]:
+        """كتابة لقطة جديدة للشركة وتفريغ السجل"""
+        if self.store is None:
+            return None
+        with self._writing(company_id) as (index, shard):
+            return shard.checkpoint(index)
+
+    def load_all(self) -> int:
+        """تحميل كل الشركات المخزنة (مثلاً قبل تفرع عمليات gunicorn)"""
+        if self.store is None:
+            return 0
+        companies = self.store.companies()
+        for company_id in companies:
+            self.get(company_id)
+        return len(companies)
+
+    def companies(self) -> List[str]:
+        if self.store is not None:
+            return sorted(set(self._indexes) | set(self.store.companies()))
+        return list(self._indexes)
+
+    def stats(self, company_id: str) -> Optional[dict]:
+        index = self.get(company_id)
+        if index is None:
+            return None
+        stats = index.stats()
+        if self.store is not None:
+            stats['store'] = self.store.shard(company_id).stats()
+        return stats
@@ -0,0 +1,275 @@
+"""
+خط معالجة الوجه - Face pipeline
+الاكتشاف (على نسخة مصغرة للصور الكبيرة) ثم القص والمحاذاة ثم الـ embedding.
+يُستخدم في عملية الخادم وفي عمليات مجمع الاستدلال.
+"""
+
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from config import DETECT_MAX_SIDE, DETECTOR_BACKEND, DETECTOR_FALLBACK, DETECTOR_MIN_CONFIDENCE
+from inference import (
+    detect_faces, locate_faces, downscale, scale_area, crop_aligned_face, embed_faces
+)
+from quality import check_quality
+from replay import face_hash
+from timings import stage
+
+
+def to_bgr(image: np.ndarray) -> np.ndarray:
+    """تحويل الصورة من RGB إلى BGR كما تتوقعها DeepFace و OpenCV"""
+    return np.ascontiguousarray(image[:, :, ::-1])
+
+
+def is_no_face(e: Exception) -> bool:
+    return 'Face could not be detected' in str(e)
+
+
+def processing_error(e: Exception) -> dict:
+    """تحويل استثناء المعالجة إلى رد خطأ"""
+    error_msg = str(e)
+    if is_no_face(e):
+        return {
+            'success': False,
+            'error': 'لم يتم العثور على وجه واضح في الصورة. تأكد من الإضاءة الجيدة ووضوح الوجه.',
+            'error_code': 'NO_FACE_FOUND'
+        }
+    return {
+        'success': False,
+        'error': f'خطأ في معالجة الصورة: {error_msg}',
+        'error_code': 'PROCESSING_ERROR'
+    }
+
+
+# مستويات الاكتشاف: الكاشف السريع ثم الأدق عند الفشل (مع اسم مرحلة التوقيت لكل مستوى)
+DETECTOR_TIERS = [(DETECTOR_BACKEND, 'detect')]
+if DETECTOR_FALLBACK:
+    DETECTOR_TIERS.append((DETECTOR_FALLBACK, 'detect_fallback'))
+
+
+def detection_outcome(faces: list) -> str:
+    """نتيجة مستوى الاكتشاف: found أو no_face أو low_confidence (تستدعي التصعيد)"""
+    if not faces:
+        return 'no_face'
+    if (len(faces) == 1 and DETECTOR_MIN_CONFIDENCE
+            and (faces[0].get('confidence') or 0) < DETECTOR_MIN_CONFIDENCE):
+        return 'low_confidence'
+    return 'found'
+
+
+def detect_single_face(image: np.ndarray) -> dict:
+    """اكتشاف وجه واحد فقط في الصورة
+    
+    الصور الكبيرة: الاكتشاف على نسخة مصغرة (DETECT_MAX_SIDE)، ثم قص الوجه
+    ومحاذاته من الصورة الكاملة. مع DETECTOR_FALLBACK يعمل الكاشف الأدق فقط عند
+    فشل الكاشف السريع أو انخفاض ثقته؛ تفاصيل المستويات في الحقل detection.
+    بعدها فحص الجودة (quality.py) قبل أي embedding، ونتيجته في الحقل quality.
+    """
+    detection = {'detector': None, 'escalated': None, 'tiers': []}
+    result = locate_single_face(image, detection)
+    if result['success']:
+        with stage('quality'):
+            quality = check_quality(image, result['face']['facial_area'])
+        if quality.pop('success'):
+            result['quality'] = quality
+        else:
+            result = {'success': False, **quality, 'face_location': result['face']['facial_area']}
+    result['detection'] = detection
+    return result
+
+
+def locate_single_face(image: np.ndarray, detection: dict) -> dict:
+    """تشغيل مستويات الاكتشاف بالترتيب حتى يُعثر على وجه بثقة كافية"""
+    located = locate_all_faces(image, detection)
+    if not located['success']:
+        return located
+    
+    faces = located['faces']
+    if len(faces) > 1:
+        return {
+            'success': False,
+            'error': 'تم العثور على أكثر من وجه. يرجى التأكد من وجود وجه واحد فقط.',
+            'error_code': 'MULTIPLE_FACES'
+        }
+    
+    try:
+        face = align_face(image, faces[0], located['scale'])
+    except Exception as e:
+        return processing_error(e)
+    
+    return {'success': True, 'face': face}
+
+
+def locate_all_faces(image: np.ndarray, detection: dict) -> dict:
+    """كل الوجوه التي وجدها أول مستوى اكتشاف ناجح (على النسخة المصغرة مع معامل التكبير)"""
+    with stage('detect'):
+        small, scale = downscale(image, DETECT_MAX_SIDE)
+    
+    faces = []
+    no_face_error = None
+    for tier, (detector, stage_name) in enumerate(DETECTOR_TIERS):
+        started = time.perf_counter()
+        try:
+            with stage(stage_name):
+                # تمرير المصفوفة مباشرة بدون ملف مؤقت
+                if scale != 1:
+                    found = locate_faces(to_bgr(small), detector)
+                else:
+                    found = detect_faces(to_bgr(image), detector)
+        except Exception as e:
+            if not is_no_face(e):
+                return processing_error(e)
+            no_face_error = e
+            found = []
+        
+        outcome = detection_outcome(found)
+        detection['tiers'].append({
+            'detector': detector,
+            'outcome': outcome,
+            'ms': (time.perf_counter() - started) * 1000
+        })
+        # نتيجة المستوى الأدق تحل محل السابقة إلا إذا لم يجد شيئاً
+        if found and (not faces or outcome == 'found'):
+            faces = found
+            detection['detector'] = detector
+        if outcome == 'found':
+            break
+        if tier + 1 < len(DETECTOR_TIERS):
+            detection['escalated'] = outcome
+    
+    if not faces and no_face_error is not None:
+        return processing_error(no_face_error)
+    
+    if not faces or len(faces) == 0:
+        return {
+            'success': False,
+            'error': 'لم يتم العثور على وجه في الصورة',
+            'error_code': 'NO_FACE_FOUND'
+        }
+    
+    return {'success': True, 'faces': faces, 'scale': scale}
+
+
+def align_face(image: np.ndarray, face: dict, scale: float) -> dict:
+    """قص الوجه المكتشف على النسخة المصغرة ومحاذاته من الصورة الكاملة"""
+    if scale == 1:
+        return face
+    with stage('align'):
+        area = scale_area(face['facial_area'], scale)
+        return {**face, 'face': crop_aligned_face(image, area), 'facial_area': area}
+
+
+def locate_frame_faces(image: np.ndarray) -> dict:
+    """مواقع كل الوجوه في إطار فيديو دون محاذاتها (للتتبع)
+    
+    يُرجع الوجوه على نسخة الاكتشاف مع scale؛ المحاذاة لاحقاً بـ align_face للوجوه
+    التي تحتاج embedding فقط.
+    """
+    detection = {'detector': None, 'escalated': None, 'tiers': []}
+    return {**locate_all_faces(image, detection), 'detection': detection}
+
+
+def detect_all_faces(image: np.ndarray, max_faces: int) -> dict:
+    """اكتشاف كل الوجوه في الصورة (وضع الكشك)، الأكبر مساحة أولاً حتى max_faces
+    
+    الوجوه الزائدة (الأصغر، غالباً في الخلفية) تُحسب في skipped ولا تُعالج.
+    """
+    detection = {'detector': None, 'escalated': None, 'tiers': []}
+    located = locate_all_faces(image, detection)
+    if not located['success']:
+        return {**located, 'detection': detection}
+    
+    faces = sorted(located['faces'], key=lambda f: f['facial_area']['w'] * f['facial_area']['h'], reverse=True)
+    try:
+        aligned = [align_face(image, face, located['scale']) for face in faces[:max_faces]]
+    except Exception as e:
+        return {**processing_error(e), 'detection': detection}
+    
+    return {
+        'success': True,
+        'faces': aligned,
+        'skipped': max(0, len(faces) - max_faces),
+        'detection': detection
+    }
+
+
+def embedding_result(face_data: dict, embedding: list) -> dict:
+    """بناء رد الـ embedding الناجح"""
+    return {
+        'success': True,
+        'embedding': embedding,
+        'embedding_size': len(embedding),
+        'face_location': face_data.get('facial_area', {})
+    }
+
+
+def replay_rejection(replay: dict) -> dict:
+    return {
+        'success': False,
+        'error': 'تم استخدام هذه الصورة في تسجيل سابق. يرجى التقاط صورة جديدة.',
+        'error_code': 'REPLAY_DETECTED',
+        'replay': replay
+    }
+
+
+def extract_embedding(image: np.ndarray,
+                      embed_one: Optional[Callable[[np.ndarray], List[float]]] = None,
+                      replay_check: Optional[Callable[[int], Optional[dict]]] = None) -> dict:
+    """استخراج embedding لوجه واحد من الصورة (embed_one اختياري، مثل مُجدول الدفعات)
+    
+    replay_check اختياري: تُحسب بصمة pHash للوجه المحاذى بعد الاكتشاف وتُفحص به، فإن طابقت
+    صورة سابقة يُرجع REPLAY_DETECTED دون تشغيل نموذج الـ embedding، وإلا تُضاف face_hash للنتيجة.
+    """
+    detected = detect_single_face(image)
+    if not detected['success']:
+        return detected
+    
+    face_data = detected['face']
+    extra = {}
+    if replay_check is not None:
+        with stage('phash'):
+            extra['face_hash'] = face_hash(face_data['face'])
+            replay = replay_check(extra['face_hash'])
+        if replay is not None:
+            return {**replay_rejection(replay), 'detection': detected['detection']}
+    try:
+        with stage('embed'):
+            if embed_one is not None:
+                embedding = embed_one(face_data['face'])
+            else:
+                embedding = embed_faces([face_data['face']])[0]
+    except Exception as e:
+        return {**processing_error(e), 'detection': detected['detection']}
+    
+    return {**embedding_result(face_data, embedding), **detected['quality'], **extra,
+            'detection': detected['detection']}
+
+
+def extract_embeddings(image: np.ndarray, max_faces: int) -> dict:
+    """استخراج embeddings لكل الوجوه في الصورة في تمريرة أمامية واحدة"""
+    detected = detect_all_faces(image, max_faces)
+    if not detected['success']:
+        return detected
+    
+    faces = detected['faces']
+    try:
+        with stage('embed'):
+            embeddings = embed_faces([face['face'] for face in faces])
+    except Exception as e:
+        return {**processing_error(e), 'detection': detected['detection']}
+    
+    return {
+        'success': True,
+        'faces': [
+            {
+                'embedding': embedding,
+                'face_location': face.get('facial_area', {}),
+                'confidence': float(face['confidence']) if face.get('confidence') is not None else None
+            }
+            for face, embedding in zip(faces, embeddings)
+        ],
+        'skipped': detected['skipped'],
+        'detection': detected['detection']
+    }
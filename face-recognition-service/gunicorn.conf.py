@@ -0,0 +1,49 @@
+"""
+إعدادات gunicorn - Gunicorn configuration
+
+    gunicorn -c gunicorn.conf.py app:app
+
+مع PRELOAD_MODEL=true تُحمّل التطبيق في العملية الرئيسية وتُقرأ ملفات الأوزان إلى ذاكرة
+نظام التشغيل المؤقتة قبل التفرع، ثم تبني كل عملية النموذج وتجري تمريرة تجريبية بعد التفرع.
+لا يُبنى TensorFlow ولا جلسة ONNX Runtime في العملية الرئيسية: خيوطهما الداخلية لا تنتقل
+إلى العملية الابنة فيتوقف أول استدلال فيها. لذلك لا تتشارك العمليات الأوزان: كل عملية تنسخها
+إلى ذاكرتها الخاصة، والتحميل المسبق يوفر قراءة القرص وزمن الجاهزية فقط، لا الذاكرة.
+"""
+
+import time
+
+import os
+
+from config import PRELOAD_MODEL, INFERENCE_PROCESSES
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+# مع مجمع الاستدلال عملية gunicorn واحدة: المجمع هو مصدر التوازي، وعدة عمليات تعني عدة مجامع
+# بنسخ نموذج مكررة على نفس الأنوية وطوابير منفصلة فلا يكون حد الطابور (503) عاماً
+workers = 1 if INFERENCE_PROCESSES else int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = PRELOAD_MODEL
+
+
+def on_starting(server):
+    if INFERENCE_PROCESSES and int(os.getenv('WEB_CONCURRENCY', '1')) > 1:
+        server.log.warning('INFERENCE_PROCESSES is set: ignoring WEB_CONCURRENCY and running one worker')
+    if PRELOAD_MODEL and not INFERENCE_PROCESSES:
+        import inference
+        started = time.perf_counter()
+        files, size = inference.preload_weights()
+        server.log.info('Model weights read into page cache in master: %d files, %.0f MB (%.1fs)',
+                        files, size / 2**20, time.perf_counter() - started)
+
+
+def post_fork(server, worker):
+    if PRELOAD_MODEL and not INFERENCE_PROCESSES:
+        import inference
+        inference.start_warm_up()
+
+
+def post_worker_init(worker):
+    # مجمع الاستدلال يُشغّل في كل عملية gunicorn بعد تحميل التطبيق (عمليات spawn مستقلة)
+    if INFERENCE_PROCESSES:
+        import app
+        app.inference_pool.start()
@@ -0,0 +1,245 @@
+"""
+محرك الاستدلال - Inference engine
+اكتشاف الوجوه واستخراج الـ embeddings عبر DeepFace (أو ONNX Runtime) مع دعم التمرير الأمامي المجمّع
+"""
+
+import math
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import MODEL_NAME, DETECTOR_BACKEND, DETECTOR_FALLBACK, INFERENCE_BACKEND, ONNX_MODEL_DIR
+
+# تحميل DeepFace بشكل كسول لتسريع بدء التشغيل (أو مسبقاً مع PRELOAD_MODEL)
+deepface = None
+model = None
+model_load_seconds = None
+_model_lock = threading.Lock()
+
+# حالة الإحماء: تُضبط بعد أول تمريرة تجريبية ناجحة في العملية الحالية
+ready = threading.Event()
+warm_up_error: Optional[str] = None
+
+
+def get_deepface():
+    global deepface
+    if deepface is None:
+        from deepface import DeepFace
+        deepface = DeepFace
+    return deepface
+
+
+def get_model():
+    """تحميل نموذج الـ embedding مرة واحدة"""
+    global model, model_load_seconds
+    if model is None:
+        with _model_lock:
+            if model is None:
+                started = time.perf_counter()
+                if INFERENCE_BACKEND == 'onnx':
+                    import onnx_backend
+                    model = onnx_backend.OnnxEmbedder(onnx_backend.model_path())
+                else:
+                    model = get_deepface().build_model(MODEL_NAME)
+                model_load_seconds = time.perf_counter() - started
+    return model
+
+
+def native_detector(detector_backend: str) -> bool:
+    """yunet مع محرك onnx يعمل عبر OpenCV مباشرة دون استيراد DeepFace"""
+    return INFERENCE_BACKEND == 'onnx' and detector_backend == 'yunet'
+
+
+def build_detector(detector_backend: str = DETECTOR_BACKEND):
+    """تحميل نموذج الاكتشاف (تحتفظ به DeepFace لكل الطلبات التالية)"""
+    if native_detector(detector_backend):
+        import onnx_backend
+        return onnx_backend.get_detector()
+    get_deepface()
+    from deepface.detectors import DetectorWrapper
+    return DetectorWrapper.build_model(detector_backend)
+
+
+def weight_files() -> List[str]:
+    """ملفات أوزان النموذج والكاشف على القرص، دون استيراد DeepFace أو TensorFlow"""
+    if INFERENCE_BACKEND == 'onnx':
+        import onnx_backend
+        files = [onnx_backend.model_path(), os.path.join(ONNX_MODEL_DIR, onnx_backend.YUNET_FILE)]
+    else:
+        # نفس مجلد DeepFace 0.0.89 للأوزان المنزّلة (folder_utils.get_deepface_home)
+        directory = os.path.join(os.getenv('DEEPFACE_HOME', os.path.expanduser('~')), '.deepface', 'weights')
+        files = [os.path.join(directory, name) for name in sorted(os.listdir(directory))] \
+            if os.path.isdir(directory) else []
+    return [path for path in files if os.path.isfile(path)]
+
+
+def preload_weights() -> Tuple[int, int]:
+    """قراءة ملفات الأوزان إلى ذاكرة نظام التشغيل المؤقتة، وإرجاع (عدد الملفات، البايتات)
+    
+    آمن قبل التفرع: لا يبني TensorFlow ولا جلسة ONNX Runtime (خيوطهما لا تنتقل للعملية
+    الابنة فتتوقف). كل عملية تبني النموذج بعد التفرع دون قراءة من القرص، لكنها تنسخ الأوزان
+    إلى ذاكرتها الخاصة (TensorFlow و ONNX Runtime لا يستخدمان صفحات الملف مباشرة).
+    """
+    files, size = 0, 0
+    for path in weight_files():
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 22):
+                size += len(chunk)
+        files += 1
+    return files, size
+
+
+def preload():
+    """استيراد DeepFace وتحميل أوزان النموذج والكاشف دون تشغيل استدلال (في العملية الحالية)"""
+    get_model()
+    build_detector()
+    if DETECTOR_FALLBACK:
+        build_detector(DETECTOR_FALLBACK)
+
+
+def warm_up():
+    """تمريرة تجريبية للاكتشاف والـ embedding ثم إعلان الجاهزية"""
+    global warm_up_error
+    try:
+        preload()
+        blank = np.zeros((160, 160, 3), dtype=np.uint8)
+        if native_detector(DETECTOR_BACKEND):
+            build_detector().detect(blank)
+        else:
+            get_deepface().extract_faces(
+                img_path=blank,
+                detector_backend=DETECTOR_BACKEND,
+                enforce_detection=False,
+                align=True
+            )
+        embed_faces([blank.astype(np.float32)])
+        warm_up_error = None
+        ready.set()
+    except Exception as e:
+        warm_up_error = str(e)
+
+
+def start_warm_up() -> threading.Thread:
+    """الإحماء في خيط خلفي حتى تبقى نقطة الجاهزية متاحة أثناءه"""
+    thread = threading.Thread(target=warm_up, name='model-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def detect_faces(image_bgr: np.ndarray, detector_backend: str = DETECTOR_BACKEND) -> List[dict]:
+    """اكتشاف الوجوه في الصورة وإرجاعها مقصوصة ومحاذاة (RGB بين 0 و 1)"""
+    if native_detector(detector_backend):
+        image_rgb = image_bgr[:, :, ::-1]
+        return [{**face, 'face': crop_aligned_face(image_rgb, face['facial_area'])}
+                for face in detect_native(image_bgr, detector_backend)]
+    return get_deepface().extract_faces(
+        img_path=image_bgr,
+        detector_backend=detector_backend,
+        enforce_detection=True,
+        align=True
+    )
+
+
+def locate_faces(image_bgr: np.ndarray, detector_backend: str = DETECTOR_BACKEND) -> List[dict]:
+    """اكتشاف مواقع الوجوه ونقاط العينين فقط (بدون محاذاة) على نسخة مصغرة"""
+    if native_detector(detector_backend):
+        return detect_native(image_bgr, detector_backend)
+    return get_deepface().extract_faces(
+        img_path=image_bgr,
+        detector_backend=detector_backend,
+        enforce_detection=True,
+        align=False
+    )
+
+
+def detect_native(image_bgr: np.ndarray, detector_backend: str) -> List[dict]:
+    """الاكتشاف دون DeepFace مع نفس رسالة الخطأ عند عدم وجود وجه"""
+    faces = build_detector(detector_backend).detect(image_bgr)
+    if not faces:
+        raise ValueError('Face could not be detected. Please confirm that the picture is a face photo.')
+    return faces
+
+
+def downscale(image_rgb: np.ndarray, max_side: int) -> Tuple[np.ndarray, float]:
+    """نسخة مصغرة للاكتشاف مع معامل التكبير للعودة إلى الصورة الكاملة"""
+    height, width = image_rgb.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image_rgb, 1.0
+
+    ratio = max_side / max(height, width)
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    small = Image.fromarray(image_rgb).resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(small), width / size[0]
+
+
+def scale_area(area: dict, scale: float) -> dict:
+    """تحويل موقع الوجه (والعينين) من النسخة المصغرة إلى الصورة الكاملة"""
+    scaled = {key: int(round(area[key] * scale)) for key in ('x', 'y', 'w', 'h')}
+    for eye in ('left_eye', 'right_eye'):
+        if area.get(eye) is not None:
+            scaled[eye] = tuple(int(round(v * scale)) for v in area[eye])
+    return scaled
+
+
+def crop_aligned_face(image_rgb: np.ndarray, area: dict) -> np.ndarray:
+    """قص الوجه من الصورة الكاملة وتدويره بزاوية العينين (RGB بين 0 و 1)
+
+    نفس زاوية المحاذاة في DeepFace لكن على منطقة الوجه مع هامش بدل الصورة كلها.
+    """
+    x, y, w, h = area['x'], area['y'], area['w'], area['h']
+    pad = int(0.3 * max(w, h))
+    # قص المنطقة فقط (مع تعبئة سوداء خارج حدود الصورة) بدل نسخ الصورة كلها إلى PIL
+    left, top = x - pad, y - pad
+    region = Image.new('RGB', (w + 2 * pad, h + 2 * pad))
+    inside = image_rgb[max(top, 0):y + h + pad, max(left, 0):x + w + pad]
+    region.paste(Image.fromarray(np.ascontiguousarray(inside)), (max(-left, 0), max(-top, 0)))
+
+    left_eye, right_eye = area.get('left_eye'), area.get('right_eye')
+    if left_eye is not None and right_eye is not None:
+        angle = math.degrees(math.atan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+        region = region.rotate(angle, resample=Image.BILINEAR, center=(pad + w / 2, pad + h / 2))
+
+    face = region.crop((pad, pad, pad + w, pad + h))
+    return np.asarray(face, dtype=np.float32) / 255.0
+
+
+def preprocess_face(face_rgb: np.ndarray) -> np.ndarray:
+    """تجهيز الوجه لمدخل النموذج بنفس خطوات DeepFace 0.0.89 (extract_faces ثم represent)
+
+    تصغير مع الحفاظ على النسبة ثم تعبئة سوداء في المنتصف حتى حجم المدخل، BGR بين 0 و 1،
+    والتطبيع base لا يغير القيم. بدون DeepFace ليعمل مع محرك onnx.
+    """
+    import cv2
+
+    width, height = get_model().input_shape
+    img = np.ascontiguousarray(face_rgb[:, :, ::-1], dtype=np.float32)  # RGB -> BGR
+    factor = min(height / img.shape[0], width / img.shape[1])
+    img = cv2.resize(img, (int(img.shape[1] * factor), int(img.shape[0] * factor)))
+    diff_0, diff_1 = height - img.shape[0], width - img.shape[1]
+    img = np.pad(img, ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)))
+    if img.shape[:2] != (height, width):
+        img = cv2.resize(img, (width, height))
+    return img[np.newaxis]
+
+
+def embed_faces(faces: List[np.ndarray]) -> List[List[float]]:
+    """استخراج embeddings لعدة وجوه في تمريرة أمامية واحدة"""
+    if not faces:
+        return []
+
+    face_model = get_model()
+    batch = np.concatenate([preprocess_face(face) for face in faces], axis=0)
+
+    if INFERENCE_BACKEND == 'onnx':
+        return face_model.predict(batch).tolist()
+
+    keras_model = getattr(face_model, 'model', None)
+    if hasattr(keras_model, 'predict_on_batch'):
+        return keras_model(batch, training=False).numpy().tolist()
+
+    # نماذج غير Keras لا تدعم الدفعات
+    return [face_model.find_embeddings(batch[i:i + 1]) for i in range(len(faces))]
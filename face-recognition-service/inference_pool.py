@@ -0,0 +1,250 @@
+"""
+مجمع عمليات الاستدلال - Multi-process inference pool
+N عمليات (spawn) لكل منها نسخة واحدة من النموذج ونصيب ثابت من أنوية المعالج،
+تستقبل الصور من طابور محدود. عند امتلاء الطابور يُرفض الطلب فوراً (PoolBusy)
+بدل الانتظار حتى انتهاء مهلة العميل.
+"""
+
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import List
+
+import numpy as np
+
+from timings import capture, record
+
+
+class PoolBusy(Exception):
+    """الطابور ممتلئ أو انتهت المهلة؛ retry_after بالثواني"""
+
+    def __init__(self, message: str, error_code: str = 'SERVER_BUSY', retry_after: int = 1):
+        super().__init__(message)
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+def split_cpus(processes: int) -> List[List[int]]:
+    """تقسيم الأنوية المتاحة إلى مجموعات متجاورة، مجموعة لكل عملية"""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    if processes >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(processes)]
+    bounds = np.linspace(0, len(cpus), processes + 1).astype(int)
+    return [cpus[bounds[i]:bounds[i + 1]] for i in range(processes)]
+
+
+def _worker_main(worker_id: int, cpus: List[int], tasks, results):
+    """حلقة عملية الاستدلال: تثبيت الأنوية، تحميل النموذج، ثم معالجة المهام"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    # قبل استيراد TensorFlow: خيوط داخلية بعدد الأنوية المخصصة فقط
+    threads = str(max(1, len(cpus)))
+    os.environ.setdefault('OMP_NUM_THREADS', threads)
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', threads)
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+
+    import inference
+    from face_pipeline import extract_embedding, extract_embeddings, processing_error
+
+    inference.warm_up()
+    results.put(('ready', worker_id, inference.warm_up_error, inference.model_load_seconds))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, image, max_faces, replay_check, enqueued_at = task
+        started = time.monotonic()
+        with capture() as stages:
+            try:
+                if max_faces:
+                    result = extract_embeddings(image, max_faces)
+                else:
+                    result = extract_embedding(image, replay_check=replay_check)
+            except Exception as e:
+                result = processing_error(e)
+        finished = time.monotonic()
+        results.put(('done', task_id, result, (started - enqueued_at) * 1000,
+                     (finished - started) * 1000, dict(stages)))
+
+
+class InferencePool:
+    """توزيع استخراج الـ embeddings على عمليات منفصلة مع طابور محدود"""
+
+    def __init__(self, processes: int, queue_size: int = 64, timeout: float = 30,
+                 pin_cpus: bool = True):
+        self.processes = processes
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.pin_cpus = pin_cpus
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = []
+        self._cpus = []
+        self._ready = set()
+        self._errors = {}
+        self._load_seconds = {}
+        self._pending = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopping = False
+
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._waits = deque(maxlen=1000)
+        self._computes = deque(maxlen=1000)
+
+    def start(self) -> None:
+        """تشغيل العمليات (مرة واحدة، في عملية الخادم بعد أي تفرع)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._tasks = self._context.Queue()
+            self._results = self._context.Queue()
+            self._cpus = split_cpus(self.processes) if self.pin_cpus else [[]] * self.processes
+            self._workers = [self._spawn(i) for i in range(self.processes)]
+        threading.Thread(target=self._collect, name='inference-pool-results', daemon=True).start()
+        threading.Thread(target=self._monitor, name='inference-pool-monitor', daemon=True).start()
+
+    def _spawn(self, worker_id: int):
+        process = self._context.Process(
+            target=_worker_main, name=f'inference-{worker_id}',
+            args=(worker_id, self._cpus[worker_id], self._tasks, self._results),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def _collect(self):
+        """توزيع النتائج القادمة من العمليات على الطلبات المنتظرة"""
+        while True:
+            message = self._results.get()
+            if message[0] == 'ready':
+                _, worker_id, error, load_seconds = message
+                with self._lock:
+                    if load_seconds is not None:
+                        self._load_seconds[worker_id] = load_seconds
+                    if error:
+                        self._errors[worker_id] = error
+                    else:
+                        self._ready.add(worker_id)
+                        self._errors.pop(worker_id, None)
+                continue
+
+            _, task_id, result, wait_ms, compute_ms, stages = message
+            with self._lock:
+                future = self._pending.pop(task_id, None)
+                self.completed += 1
+                self._waits.append(wait_ms)
+                self._computes.append(compute_ms)
+            if future is not None:
+                future.set_result((result, wait_ms, compute_ms, stages))
+
+    def _monitor(self):
+        """إعادة تشغيل العمليات المتوقفة (المهمة الجارية فيها تنتهي بالمهلة)"""
+        while not self._stopping:
+            time.sleep(1)
+            for worker_id, process in enumerate(self._workers):
+                if not process.is_alive() and not self._stopping:
+                    with self._lock:
+                        self._ready.discard(worker_id)
+                        self.restarts += 1
+                    self._workers[worker_id] = self._spawn(worker_id)
+
+    def retry_after(self) -> int:
+        """تقدير زمن تفريغ الطابور الحالي بالثواني"""
+        compute_ms = float(np.mean(self._computes)) if self._computes else 1000.0
+        return max(1, math.ceil(len(self._pending) * compute_ms / self.processes / 1000))
+
+    def run(self, image: np.ndarray, max_faces: int = 0, replay_check=None) -> dict:
+        """استخراج embedding في إحدى العمليات، أو PoolBusy إذا امتلأ الطابور
+        
+        max_faces > 0: كل الوجوه في الصورة حتى هذا العدد (extract_embeddings).
+        replay_check: فحص بصمة الوجه قبل الـ embedding، قابل للإرسال بين العمليات (ReplaySnapshot).
+        """
+        self.start()
+        with self._lock:
+            if len(self._pending) >= self.queue_size:
+                self.rejected += 1
+                raise PoolBusy('الخدمة مشغولة، أعد المحاولة لاحقاً', retry_after=self.retry_after())
+            task_id = next(self._ids)
+            future = Future()
+            self._pending[task_id] = future
+
+        self._tasks.put((task_id, image, max_faces, replay_check, time.monotonic()))
+        try:
+            result, wait_ms, compute_ms, stages = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._pending.pop(task_id, None)
+                self.timeouts += 1
+            raise PoolBusy('انتهت مهلة الاستدلال', 'INFERENCE_TIMEOUT', self.retry_after())
+
+        # انتظار الطابور منفصل عن زمن المعالجة الفعلي
+        record('queue_wait', wait_ms)
+        for name, ms in stages.items():
+            record(name, ms)
+        record('compute', compute_ms)
+        return result
+
+    @property
+    def ready(self) -> bool:
+        return self._started and len(self._ready) == self.processes
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def load_seconds(self):
+        """أطول زمن تحميل للنموذج بين العمليات"""
+        return max(self._load_seconds.values(), default=None)
+
+    @property
+    def error(self):
+        """خطأ تحميل النموذج في إحدى العمليات إن وجد"""
+        return next(iter(self._errors.values()), None)
+
+    def stop(self) -> None:
+        self._stopping = True
+        for _ in self._workers:
+            self._tasks.put(None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = np.array(self._waits) if self._waits else np.zeros(1)
+            computes = np.array(self._computes) if self._computes else np.zeros(1)
+            return {
+                'processes': self.processes,
+                'alive': sum(1 for p in self._workers if p.is_alive()),
+                'ready': len(self._ready),
+                'errors': {str(k): v for k, v in self._errors.items()},
+                'cpus': self._cpus,
+                'queue_size': self.queue_size,
+                'pending': len(self._pending),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'restarts': self.restarts,
+                'queue_wait_ms': {
+                    'mean': float(waits.mean()),
+                    'p50': float(np.percentile(waits, 50)),
+                    'p99': float(np.percentile(waits, 99)),
+                },
+                'compute_ms': {
+                    'mean': float(computes.mean()),
+                    'p50': float(np.percentile(computes, 50)),
+                    'p99': float(np.percentile(computes, 99)),
+                }
+            }
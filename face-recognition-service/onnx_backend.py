@@ -0,0 +1,165 @@
+"""
+محرك ONNX Runtime - ONNX Runtime inference backend
+نموذج الـ embedding بأوزان مُصدّرة من DeepFace (tf2onnx) والكاشف YuNet عبر
+cv2.FaceDetectorYN، دون استيراد TensorFlow في عملية الخادم.
+
+التصدير مرة واحدة على جهاز فيه TensorFlow و tf2onnx:
+
+    python onnx_backend.py export --model Facenet512 --output ./data/onnx
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import urllib.request
+from typing import List, Optional
+
+import numpy as np
+
+from config import MODEL_NAME, ONNX_MODEL_DIR, ONNX_THREADS
+
+YUNET_FILE = 'face_detection_yunet_2023mar.onnx'
+YUNET_URL = ('https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/'
+             + YUNET_FILE)
+# نفس إعدادات كاشف yunet في DeepFace
+YUNET_SCORE_THRESHOLD = float(os.getenv('yunet_score_threshold', '0.9'))
+YUNET_MAX_SIDE = 640
+
+
+def model_path(model_name: str = MODEL_NAME, directory: str = ONNX_MODEL_DIR) -> str:
+    return os.path.join(directory, f'{model_name}.onnx')
+
+
+def intra_op_threads() -> int:
+    """ONNX_THREADS، أو نصيب العملية من الأنوية في مجمع الاستدلال (OMP_NUM_THREADS)"""
+    return ONNX_THREADS or int(os.getenv('OMP_NUM_THREADS', '0'))
+
+
+class OnnxEmbedder:
+    """نموذج الـ embedding في جلسة ONNX Runtime (مدخل BGR بين 0 و 1 مثل DeepFace)"""
+
+    def __init__(self, path: str):
+        import onnxruntime
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f'{path} غير موجود؛ صدّر النموذج بـ: python onnx_backend.py export --model {MODEL_NAME}'
+            )
+        with open(os.path.splitext(path)[0] + '.json') as f:
+            metadata = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads()
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        # (العرض، الارتفاع) كما في input_shape لنماذج DeepFace
+        self.input_shape = tuple(metadata['input_shape'])
+        self.output_shape = metadata['output_shape']
+        self.model_name = metadata['model_name']
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+class YuNetDetector:
+    """كاشف YuNet بنفس منطق DeepFace (التصغير إلى 640 وعتبة الثقة 0.9)"""
+
+    def __init__(self, path: str):
+        import cv2
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'{path} غير موجود؛ شغّل: python onnx_backend.py export')
+        self.detector = cv2.FaceDetectorYN_create(path, '', (0, 0), YUNET_SCORE_THRESHOLD)
+        # setInputSize ثم detect على نفس الكائن: لا يصلح لعدة خيوط معاً
+        self._lock = threading.Lock()
+
+    def detect(self, image_bgr: np.ndarray) -> List[dict]:
+        import cv2
+
+        height, width = image_bgr.shape[:2]
+        ratio = 1.0
+        if max(height, width) > YUNET_MAX_SIDE:
+            ratio = YUNET_MAX_SIDE / max(height, width)
+            image_bgr = cv2.resize(image_bgr, (int(width * ratio), int(height * ratio)))
+        with self._lock:
+            self.detector.setInputSize((image_bgr.shape[1], image_bgr.shape[0]))
+            _, faces = self.detector.detect(image_bgr)
+
+        results = []
+        for face in faces if faces is not None else []:
+            x, y, w, h, x_re, y_re, x_le, y_le = (int(v / ratio) for v in face[:8])
+            results.append({
+                'facial_area': {
+                    'x': max(x, 0), 'y': max(y, 0), 'w': w, 'h': h,
+                    # نفس تسمية DeepFace للعينين
+                    'left_eye': (x_re, y_re), 'right_eye': (x_le, y_le)
+                },
+                'confidence': float(face[-1])
+            })
+        return results
+
+
+_detector: Optional[YuNetDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> YuNetDetector:
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = YuNetDetector(os.path.join(ONNX_MODEL_DIR, YUNET_FILE))
+    return _detector
+
+
+def export(model_name: str, output: str, opset: int) -> None:
+    """تصدير نموذج DeepFace (Keras) إلى ONNX ونسخ أوزان YuNet"""
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+
+    os.makedirs(output, exist_ok=True)
+    face_model = DeepFace.build_model(model_name)
+    keras_model = getattr(face_model, 'model', None)
+    if not hasattr(keras_model, 'predict_on_batch'):
+        raise SystemExit(f'{model_name} ليس نموذج Keras ولا يمكن تصديره')
+
+    width, height = face_model.input_shape
+    signature = (tf.TensorSpec((None, height, width, 3), tf.float32, name='input'),)
+    path = model_path(model_name, output)
+    tf2onnx.convert.from_keras(keras_model, input_signature=signature, opset=opset, output_path=path)
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump({
+            'model_name': model_name,
+            'input_shape': [width, height],
+            'output_shape': face_model.output_shape,
+            'opset': opset
+        }, f)
+    print(f'{model_name}: {path} ({os.path.getsize(path) / 2**20:.1f} MB)')
+
+    # أوزان YuNet من مجلد DeepFace إن وُجدت، وإلا من opencv_zoo
+    target = os.path.join(output, YUNET_FILE)
+    cached = os.path.join(os.getenv('DEEPFACE_HOME', os.path.expanduser('~')), '.deepface', 'weights', YUNET_FILE)
+    if os.path.exists(cached):
+        shutil.copyfile(cached, target)
+    else:
+        urllib.request.urlretrieve(YUNET_URL, target)
+    print(f'yunet: {target}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='تصدير أوزان ONNX')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export')
+    export_parser.add_argument('--model', default=MODEL_NAME)
+    export_parser.add_argument('--output', default=ONNX_MODEL_DIR)
+    export_parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+    export(args.model, args.output, args.opset)
+
+
+if __name__ == '__main__':
+    main()
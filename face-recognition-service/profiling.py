@@ -0,0 +1,243 @@
+"""
+التحليل عند الطلب - On-demand profiling
+يحلل نسبة عشوائية من الطلبات بـ cProfile (ملفات .prof) أو بمحلل عيّنات
+(مكدسات مطوية folded متوافقة مع flamegraph.pl و speedscope).
+حالة التشغيل في ملف control.json داخل المجلد لتشمل كل عمليات gunicorn؛
+عند الإيقاف تكلفة الطلب فحص متغير واحد (والملف يُقرأ مرة كل ثانية على الأكثر).
+"""
+
+import cProfile
+import functools
+import glob
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+MODES = ('cprofile', 'sampling')
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """خيط يأخذ عيّنة من مكدس الخيوط المسجلة كل interval ويعدّ المكدسات"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads.add(thread_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def unregister(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads.discard(thread_id)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                threads = list(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    with self._lock:
+                        self.stacks[';'.join(reversed(stack))] += 1
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.stacks)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stacks.clear()
+
+
+class Profiler:
+    """مفتاح التحليل وتجميع النتائج في مجلد محلي"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.mode = 'cprofile'
+        self.profiled = 0
+        self._control_mtime = None
+        self._checked_at = 0.0
+        self._cprofile_lock = threading.Lock()
+        self._sampler = SamplingProfiler()
+
+    @property
+    def control_path(self) -> str:
+        return os.path.join(self.directory, 'control.json')
+
+    def _refresh(self) -> None:
+        """قراءة control.json عند تغيره (مرة كل ثانية على الأكثر)"""
+        now = time.monotonic()
+        if now - self._checked_at < 1.0:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.control_path).st_mtime
+        except FileNotFoundError:
+            self.enabled = False
+            return
+        if mtime == self._control_mtime:
+            return
+        try:
+            with open(self.control_path) as f:
+                control = json.load(f)
+        except ValueError:
+            return
+        self._control_mtime = mtime
+        self.enabled = bool(control.get('enabled'))
+        self.sample_rate = float(control.get('sample_rate', 0.01))
+        self.mode = control.get('mode', 'cprofile')
+        self._sampler.interval = float(control.get('interval_ms', 5)) / 1000
+
+    def configure(self, enabled: bool, sample_rate: float = 0.01, mode: str = 'cprofile',
+                  interval_ms: float = 5) -> dict:
+        """تفعيل أو إيقاف التحليل لكل العمليات"""
+        if mode not in MODES:
+            raise ValueError(f'وضع غير مدعوم: {mode} (المدعوم: {", ".join(MODES)})')
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('sample_rate يجب أن يكون بين 0 و 1')
+        os.makedirs(self.directory, exist_ok=True)
+        control = {'enabled': enabled, 'sample_rate': sample_rate, 'mode': mode,
+                   'interval_ms': interval_ms, 'updated_at': time.time()}
+        tmp = self.control_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(control, f)
+        os.replace(tmp, self.control_path)
+        self._checked_at = 0.0
+        self._refresh()
+        return control
+
+    def profiled_call(self, func):
+        """مُزخرف: تحليل نسبة sample_rate من الاستدعاءات عند التفعيل"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self._refresh()
+            if not self.enabled or random.random() >= self.sample_rate:
+                return func(*args, **kwargs)
+            if self.mode == 'sampling':
+                return self._sample(func, args, kwargs)
+            return self._cprofile(func, args, kwargs)
+        return wrapper
+
+    def _cprofile(self, func, args, kwargs):
+        # محلل cProfile واحد في كل مرة داخل العملية
+        if not self._cprofile_lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        finally:
+            self._cprofile_lock.release()
+            self.profiled += 1
+            name = f'profile-{int(time.time() * 1000)}-{os.getpid()}-{self.profiled}.prof'
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, name))
+
+    def _sample(self, func, args, kwargs):
+        thread_id = threading.get_ident()
+        self._sampler.register(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._sampler.unregister(thread_id)
+            self.profiled += 1
+            self._write_stacks()
+
+    def _write_stacks(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'stacks-{os.getpid()}.folded')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for stack, count in self._sampler.snapshot().items():
+                f.write(f'{stack} {count}\n')
+        os.replace(tmp, path)
+
+    def aggregate_pstats(self) -> Optional[bytes]:
+        """دمج كل ملفات .prof في ملف pstats واحد"""
+        paths = sorted(glob.glob(os.path.join(self.directory, 'profile-*.prof')))
+        if not paths:
+            return None
+        stats = pstats.Stats(paths[0])
+        for path in paths[1:]:
+            stats.add(path)
+        return marshal.dumps(stats.stats)
+
+    def aggregate_text(self, limit: int = 50) -> Optional[str]:
+        """أعلى الدوال حسب الزمن التراكمي لكل ملفات .prof"""
+        paths = sorted(glob.glob(os.path.join(self.directory, 'profile-*.prof')))
+        if not paths:
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(*paths, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def aggregate_folded(self) -> Optional[str]:
+        """دمج المكدسات المطوية من كل العمليات"""
+        totals = Counter()
+        for path in glob.glob(os.path.join(self.directory, 'stacks-*.folded')):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack:
+                        totals[stack] += int(count)
+        if not totals:
+            return None
+        return ''.join(f'{stack} {count}\n' for stack, count in totals.most_common())
+
+    def clear(self) -> int:
+        """حذف ملفات النتائج (تبقى حالة التشغيل)"""
+        removed = 0
+        for pattern in ('profile-*.prof', 'stacks-*.folded'):
+            for path in glob.glob(os.path.join(self.directory, pattern)):
+                os.remove(path)
+                removed += 1
+        self._sampler.reset()
+        return removed
+
+    def status(self) -> dict:
+        self._refresh()
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'mode': self.mode,
+            'interval_ms': self._sampler.interval * 1000,
+            'directory': self.directory,
+            'profiled_in_process': self.profiled,
+            'profiles': len(glob.glob(os.path.join(self.directory, 'profile-*.prof'))),
+            'stack_files': len(glob.glob(os.path.join(self.directory, 'stacks-*.folded')))
+        }
@@ -0,0 +1,94 @@
+"""
+فحص جودة الصورة - Image quality gate
+فحص سريع بـ NumPy لمنطقة الوجه بعد الاكتشاف وقبل الـ embedding: الحدة (تباين
+Laplacian)، والإضاءة، ونسبة الوجه إلى الإطار. يرفض الصور الميؤوس منها برمز خطأ
+محدد، ويُرجع quality_score بين 0 و 1 يمكن حفظه مع بيانات الوجه (image_quality).
+"""
+
+import numpy as np
+from PIL import Image
+
+from config import (
+    QUALITY_GATE, QUALITY_MIN_SHARPNESS, QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS,
+    QUALITY_MIN_FACE_RATIO
+)
+
+# الحدة تُقاس على الوجه بحجم ثابت حتى لا تعتمد على دقة الكاميرا
+SAMPLE_SIDE = 112
+# قيم تُعتبر عندها كل درجة جزئية كاملة (1.0)
+SHARPNESS_REFERENCE = 150.0
+FACE_RATIO_REFERENCE = 0.1
+# أوزان الدرجات الجزئية في quality_score
+WEIGHTS = {'sharpness': 0.5, 'exposure': 0.25, 'face_ratio': 0.25}
+
+
+def face_gray(image: np.ndarray, area: dict) -> np.ndarray:
+    """منطقة الوجه من الصورة الأصلية (بدون محاذاة أو تعبئة) بتدرج رمادي وحجم SAMPLE_SIDE"""
+    x, y = max(area['x'], 0), max(area['y'], 0)
+    # تخطي صفوف وأعمدة للوجوه الكبيرة قبل النسخ (حتى ضعف حجم العينة تقريباً)
+    step = max(1, min(area['w'], area['h']) // (2 * SAMPLE_SIDE))
+    crop = np.ascontiguousarray(image[y:y + area['h']:step, x:x + area['w']:step])
+    gray = Image.fromarray(crop).convert('L').resize((SAMPLE_SIDE, SAMPLE_SIDE), Image.BILINEAR)
+    return np.asarray(gray, dtype=np.float32)
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """تباين Laplacian (نواة 4 جيران) بالإزاحة دون التفاف؛ منخفض = صورة ضبابية"""
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+           - 4 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+
+def assess(image: np.ndarray, area: dict) -> dict:
+    """قياسات الجودة ودرجتها لوجه واحد (مع error_code عند تجاوز أحد الحدود)"""
+    gray = face_gray(image, area)
+    sharpness = laplacian_variance(gray)
+    brightness = float(gray.mean())
+    face_ratio = area['w'] * area['h'] / float(image.shape[0] * image.shape[1])
+
+    scores = {
+        'sharpness': min(1.0, sharpness / SHARPNESS_REFERENCE),
+        'exposure': max(0.0, 1 - abs(brightness - 128) / 128),
+        'face_ratio': min(1.0, face_ratio / FACE_RATIO_REFERENCE)
+    }
+    quality = {
+        'quality_score': round(sum(WEIGHTS[name] * score for name, score in scores.items()), 3),
+        'quality': {
+            'sharpness': round(sharpness, 1),
+            'brightness': round(brightness, 1),
+            'face_ratio': round(face_ratio, 4)
+        }
+    }
+
+    # بالترتيب: الوجه الصغير أولاً لأنه يجعل القياسين الآخرين غير موثوقين
+    if face_ratio < QUALITY_MIN_FACE_RATIO:
+        quality['error_code'] = 'FACE_TOO_SMALL'
+    elif brightness < QUALITY_MIN_BRIGHTNESS:
+        quality['error_code'] = 'IMAGE_TOO_DARK'
+    elif brightness > QUALITY_MAX_BRIGHTNESS:
+        quality['error_code'] = 'IMAGE_TOO_BRIGHT'
+    elif sharpness < QUALITY_MIN_SHARPNESS:
+        quality['error_code'] = 'IMAGE_TOO_BLURRY'
+    return quality
+
+
+QUALITY_ERRORS = {
+    'FACE_TOO_SMALL': 'الوجه صغير جداً في الصورة. اقترب من الكاميرا.',
+    'IMAGE_TOO_DARK': 'الصورة مظلمة جداً. تأكد من الإضاءة الجيدة.',
+    'IMAGE_TOO_BRIGHT': 'الصورة ساطعة جداً. تجنب الإضاءة المباشرة خلفك أو على الكاميرا.',
+    'IMAGE_TOO_BLURRY': 'الصورة غير واضحة. ثبّت الجهاز وأعد المحاولة.'
+}
+
+
+def check_quality(image: np.ndarray, area: dict) -> dict:
+    """فحص الجودة: {'success': True, quality_score...} أو رد خطأ مع القياسات"""
+    quality = assess(image, area)
+    error_code = quality.pop('error_code', None)
+    if error_code is None or not QUALITY_GATE:
+        return {'success': True, **quality}
+    return {
+        'success': False,
+        'error': QUALITY_ERRORS[error_code],
+        'error_code': error_code,
+        **quality
+    }
@@ -0,0 +1,359 @@
+"""
+كشف إعادة استخدام صور التحقق - Perceptual-hash replay detection
+بصمة إدراكية (pHash بـ 64 بت) للوجه المقصوص والمحاذى في كل تحقق ناجح، في شجرة BK
+لكل مستخدم بمسافة Hamming، فتُكتشف إعادة إرسال صورة محفوظة (حتى بعد إعادة الضغط أو
+تغيير الحجم) في O(log n). الفحص بعد الاكتشاف والمحاذاة ويرفض الصورة قبل تشغيل نموذج
+الـ embedding. البصمات في سجل إلحاقي على القرص تتشاركه عمليات gunicorn ويبقى بعد
+إعادة التشغيل.
+"""
+
+import fcntl
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from caches import LRUCache
+
+HASH_SIDE = 32
+LOW_FREQUENCIES = 8
+
+
+def dct_matrix(n: int) -> np.ndarray:
+    """مصفوفة DCT-II المتعامدة بحجم n×n"""
+    k = np.arange(n)[:, np.newaxis]
+    matrix = np.cos(np.pi * (2 * np.arange(n) + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = dct_matrix(HASH_SIDE)
+
+
+def phash(image: np.ndarray) -> int:
+    """pHash: صورة رمادية 32×32، ثم أقل 8×8 ترددات DCT مقارنة بوسيطها (64 بت)"""
+    # تخطي صفوف وأعمدة الصور الكبيرة قبل النسخ (الترددات المنخفضة فقط تهم)
+    step = max(1, min(image.shape[:2]) // (4 * HASH_SIDE))
+    small = np.ascontiguousarray(image[::step, ::step])
+    gray = Image.fromarray(small).convert('L').resize((HASH_SIDE, HASH_SIDE), Image.BILINEAR, reducing_gap=2.0)
+    pixels = np.asarray(gray, dtype=np.float32)
+    coefficients = (_DCT @ pixels @ _DCT.T)[:LOW_FREQUENCIES, :LOW_FREQUENCIES].ravel()
+    # معامل DC (متوسط السطوع) لا يدخل في الوسيط
+    bits = coefficients > np.median(coefficients[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def face_hash(face: np.ndarray) -> int:
+    """pHash للوجه المحاذى (RGB بين 0 و 1): الخلفية الثابتة لكاميرا الكشك لا تدخل في البصمة"""
+    return phash((np.clip(face, 0, 1) * 255).astype(np.uint8))
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """شجرة BK بمسافة Hamming: كل عقدة [البصمة، بيانات مرافقة، {المسافة: عقدة}]"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value: int, payload) -> None:
+        if self.root is None:
+            self.root = [value, payload, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, payload, {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int, object]]:
+        """كل البصمات على مسافة ≤ radius: (المسافة، البصمة، البيانات المرافقة)
+
+        متباينة المثلث تحصر الفروع المفحوصة في المسافات [d - radius, d + radius].
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[0], node[1]))
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class ReplayIndex:
+    """بصمات مستخدم واحد خلال نافذة زمنية متحركة، بحد max_hashes
+
+    الشجرة لا تدعم الحذف: البصمات الخارجة من النافذة (رقم تسلسلها أقل من أقدم
+    بصمة حية) تُتجاهل في البحث، وتُعاد بناء الشجرة عندما يتجاوز عددها عدد البصمات
+    الحية (تكلفة موزعة ثابتة لكل إضافة).
+    """
+
+    def __init__(self, window: float, max_hashes: int):
+        self.window = window
+        self.max_hashes = max_hashes
+        self.tree = BKTree()
+        self.entries = deque()
+        self.sequence = 0
+        self.stale = 0
+
+    def find(self, value: int, radius: int, grace: float, now: float) -> Optional[Tuple[int, float]]:
+        """أقرب بصمة سابقة (المسافة، عمرها بالثواني)، متجاهلاً المنتهية والأحدث من grace"""
+        if not self.entries:
+            return None
+        first = self.entries[0][1]
+        oldest = now - self.window if self.window else float('-inf')
+        matches = [(distance, now - seen_at)
+                   for distance, _, (sequence, seen_at) in self.tree.search(value, radius)
+                   if sequence >= first and oldest <= seen_at <= now - grace]
+        return min(matches) if matches else None
+
+    def add(self, value: int, now: float) -> None:
+        entry = (value, self.sequence, now)
+        self.sequence += 1
+        self.entries.append(entry)
+        self.tree.add(value, entry[1:])
+        while self.entries and (len(self.entries) > self.max_hashes
+                                or (self.window and self.entries[0][2] < now - self.window)):
+            self.entries.popleft()
+            self.stale += 1
+        if self.stale > len(self.entries):
+            self.tree = BKTree()
+            for entry_value, sequence, seen_at in self.entries:
+                self.tree.add(entry_value, (sequence, seen_at))
+            self.stale = 0
+
+
+# البصمة، وقت التسجيل (ثوانٍ منذ epoch)، طول المفتاح، CRC32 للمحتوى
+RECORD = struct.Struct('<QdHI')
+# فاصل الشركة والمستخدم في مفتاح السجل
+SEPARATOR = '\x1f'
+
+
+def encode_record(key: Tuple[str, str], value: int, seen_at: float) -> bytes:
+    name = SEPARATOR.join(key).encode('utf-8')
+    body = struct.pack('<Qd', value, seen_at) + name
+    return RECORD.pack(value, seen_at, len(name), zlib.crc32(body)) + name
+
+
+def decode_records(buffer: bytes) -> Tuple[List[Tuple[Tuple[str, str], int, float]], int]:
+    """السجلات الكاملة السليمة من المخزن المؤقت مع عدد البايتات المقروءة"""
+    records, pos = [], 0
+    while pos + RECORD.size <= len(buffer):
+        value, seen_at, name_len, crc = RECORD.unpack_from(buffer, pos)
+        end = pos + RECORD.size + name_len
+        if end > len(buffer):
+            break  # سجل غير مكتمل (كتابة جارية)
+        name = buffer[pos + RECORD.size:end]
+        if zlib.crc32(buffer[pos:pos + 16] + name) != crc:
+            break  # سجل تالف: التوقف عند آخر سجل سليم
+        company_id, _, user_id = name.decode('utf-8').partition(SEPARATOR)
+        records.append(((company_id, user_id), value, seen_at))
+        pos = end
+    return records, pos
+
+
+class ReplayLog:
+    """سجل البصمات الإلحاقي على القرص، مثل WAL مخزن الـ embeddings
+    
+    كل عملية تقرأ ما أضافته العمليات الأخرى منذ آخر إزاحة. عند تجاوز compact_bytes
+    (وضعف حجم آخر ضغط) يُعاد كتابته بالبصمات داخل النافذة فقط، وتغيّر الـ inode يجعل
+    بقية العمليات تعيد القراءة من البداية.
+    """
+
+    def __init__(self, directory: str, compact_bytes: int = 64 * 2**20, fsync: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'replay.log')
+        self.lock_path = os.path.join(directory, 'LOCK')
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self.inode = None
+        self.offset = 0
+        self.live_bytes = 0
+    
+    @contextmanager
+    def locked(self):
+        """قفل بين عمليات gunicorn للكتابة والضغط"""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self) -> Tuple[bool, list]:
+        """(هل استُبدل السجل بعد ضغط؟، السجلات الجديدة منذ آخر قراءة)"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False, []
+        with f:
+            stat = os.fstat(f.fileno())
+            reset = stat.st_ino != self.inode
+            if reset:
+                self.inode, self.offset, self.live_bytes = stat.st_ino, 0, stat.st_size
+            if stat.st_size <= self.offset:
+                return reset, []
+            f.seek(self.offset)
+            records, consumed = decode_records(f.read())
+        self.offset += consumed
+        return reset, records
+
+    def append(self, record: bytes) -> None:
+        """إلحاق سجل (داخل locked وبعد read): قص أي سجل ممزق من عملية تعطلت أولاً"""
+        with open(self.path, 'ab') as f:
+            if f.tell() > self.offset:
+                f.truncate(self.offset)
+            f.write(record)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self.offset = f.tell()
+        if self.inode is None:
+            self.inode = os.stat(self.path).st_ino
+
+    def needs_compaction(self) -> bool:
+        return self.offset > max(self.compact_bytes, 2 * self.live_bytes)
+
+    def compact(self, oldest: float) -> int:
+        """إعادة كتابة السجل بالبصمات المسجلة بعد oldest (داخل locked وبعد read)"""
+        with open(self.path, 'rb') as f:
+            records, _ = decode_records(f.read())
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(encode_record(key, value, seen_at)
+                             for key, value, seen_at in records if seen_at >= oldest))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp, self.path)
+        self.inode = os.stat(self.path).st_ino
+        self.offset = self.live_bytes = size
+        return len(records)
+
+
+class ReplaySnapshot:
+    """نسخة من بصمات مستخدم واحد القابلة للمطابقة، تُرسل مع المهمة لعمليات مجمع الاستدلال
+    
+    بحد REPLAY_MAX_HASHES بصمة، فالمقارنة الخطية المتجهة أسرع من نقل شجرة BK.
+    """
+
+    def __init__(self, values: np.ndarray, seen_at: np.ndarray, now: float, max_distance: int):
+        self.values = values
+        self.seen_at = seen_at
+        self.now = now
+        self.max_distance = max_distance
+
+    def __call__(self, value: int) -> Optional[dict]:
+        """تفاصيل الصورة السابقة المطابقة تقريباً، أو None"""
+        if len(self.values) == 0:
+            return None
+        xor = self.values ^ np.uint64(value)
+        distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        candidates = np.flatnonzero(distances <= self.max_distance)
+        if len(candidates) == 0:
+            return None
+        best = min(candidates, key=lambda i: (distances[i], self.now - self.seen_at[i]))
+        return {'distance': int(distances[best]), 'seen_seconds_ago': round(self.now - float(self.seen_at[best]))}
+
+
+class ReplayDetector:
+    """فهارس البصمات لكل مستخدم في ذاكرة LRU، مع سجل مشترك على القرص (اختياري)
+    
+    بدون directory تبقى البصمات في ذاكرة العملية فقط. المفتاح (company_id, user_id).
+    """
+
+    def __init__(self, max_distance: int = 4, window: float = 30 * 86400, grace: float = 10,
+                 max_hashes: int = 500, max_users: int = 100000, directory: str = '',
+                 compact_bytes: int = 64 * 2**20, fsync: bool = False):
+        self.max_distance = max_distance
+        self.window = window
+        self.grace = grace
+        self.max_hashes = max_hashes
+        self._indexes = LRUCache(max_size=max_users)
+        self._lock = threading.Lock()
+        self.detected = 0
+        self.log = ReplayLog(directory, compact_bytes, fsync) if directory else None
+        if self.log is not None:
+            with self._lock:
+                self._sync()
+
+    def _sync(self) -> None:
+        """تطبيق بصمات العمليات الأخرى من السجل (داخل self._lock)"""
+        reset, records = self.log.read()
+        if reset:
+            self._indexes.invalidate()
+        for key, value, seen_at in records:
+            self._add(key, value, seen_at)
+
+    def _add(self, key: Tuple[str, str], value: int, seen_at: float) -> None:
+        index = self._indexes.get(key)
+        if index is None:
+            index = ReplayIndex(self.window, self.max_hashes)
+            self._indexes.put(key, index)
+        index.add(value, seen_at)
+
+    def check(self, key: Tuple[str, str], value: int) -> Optional[dict]:
+        """تفاصيل الصورة السابقة المطابقة تقريباً، أو None"""
+        with self._lock:
+            if self.log is not None:
+                self._sync()
+            index = self._indexes.get(key)
+            if index is None:
+                return None
+            match = index.find(value, self.max_distance, self.grace, time.time())
+        if match is None:
+            return None
+        return {'distance': match[0], 'seen_seconds_ago': round(match[1])}
+
+    def snapshot(self, key: Tuple[str, str]) -> ReplaySnapshot:
+        """بصمات المستخدم داخل النافذة وخارج المهلة، للفحص في عملية أخرى"""
+        now = time.time()
+        oldest = now - self.window if self.window else float('-inf')
+        with self._lock:
+            if self.log is not None:
+                self._sync()
+            index = self._indexes.get(key)
+            entries = [(value, seen_at) for value, _, seen_at in (index.entries if index is not None else ())
+                       if oldest <= seen_at <= now - self.grace]
+        values = np.array([value for value, _ in entries], dtype=np.uint64)
+        seen_at = np.array([seen_at for _, seen_at in entries], dtype=np.float64)
+        return ReplaySnapshot(values, seen_at, now, self.max_distance)
+
+    def count_detected(self) -> None:
+        with self._lock:
+            self.detected += 1
+
+    def record(self, key: Tuple[str, str], value: int) -> None:
+        now = time.time()
+        with self._lock:
+            if self.log is None:
+                self._add(key, value, now)
+                return
+            with self.log.locked():
+                self._sync()
+                self.log.append(encode_record(key, value, now))
+                self._add(key, value, now)
+                if self.log.needs_compaction():
+                    self.log.compact(now - self.window if self.window else float('-inf'))
+
+    def stats(self) -> dict:
+        stats = {'users': len(self._indexes), 'detected': self.detected}
+        if self.log is not None:
+            stats['log_bytes'] = self.log.offset
+        return stats
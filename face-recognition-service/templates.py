@@ -0,0 +1,142 @@
+"""
+قوالب التحقق المتعددة - Multi-template enrollment
+لكل مستخدم حتى K قالب: embedding التسجيل في فهرس الشركة، ومركز متحرك، وأمثلة
+مُتعلَّمة من عمليات التحقق عالية الثقة. التحقق ضرب مصفوفة القوالب الصغيرة في متجه
+واحد، والتحديث تدريجي في سجل WAL للمخزن بدل إعادة كتابة face_data في كل حضور.
+"""
+
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from face_index import FaceIndexRegistry, normalize
+
+# صفوف القوالب في فهرس القوالب: user_id + الفاصل + الخانة (c للمركز، 1..K-2 للأمثلة)
+SEPARATOR = '\x1f'
+CENTROID = 'c'
+
+
+def row_id(user_id: str, slot) -> str:
+    return f'{user_id}{SEPARATOR}{slot}'
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """نفس مقياس compare_faces لمتجهين مطبّعين: (الكوساين + 1) / 2"""
+    return (float(a @ b) + 1) / 2
+
+
+class TemplateBank:
+    """قوالب المستخدمين فوق FaceIndexRegistry (في الذاكرة أو على القرص مع المخزن)
+
+    max_templates: العدد الكلي K بما فيه التسجيل والمركز (الأمثلة المتعلمة K - 2). التحديث عند
+    تشابه ≥ update_threshold فقط، ويُضاف مثال جديد إذا لم يكن مكرراً لقالب موجود
+    (تشابه < duplicate_threshold)، وعند الامتلاء يحل محل أقرب مثال متعلم إليه.
+    المركز متوسط متحرك يبدأ من التسجيل بمعدل 1 / (عدد الأمثلة + 2)، أي متوسط فعلي حتى
+    امتلاء الأمثلة ثم متوسط لآخر K - 1 وجه تقريباً.
+    """
+
+    def __init__(self, registry: FaceIndexRegistry, max_templates: int = 5,
+                 update_threshold: float = 0.85, duplicate_threshold: float = 0.975):
+        self.registry = registry
+        self.max_templates = max_templates
+        self.update_threshold = update_threshold
+        self.duplicate_threshold = duplicate_threshold
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.exemplars_added = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_templates > 1
+
+    def _slots(self) -> range:
+        return range(1, self.max_templates - 1)
+
+    def learned(self, company_id: str, user_id: str) -> Tuple[Optional[np.ndarray], List[Tuple[int, np.ndarray]]]:
+        """المركز والأمثلة المتعلمة (الخانة، المتجه) للمستخدم"""
+        index = self.registry.get(company_id)
+        if index is None:
+            return None, []
+        centroid = index.get(row_id(user_id, CENTROID))
+        exemplars = []
+        for slot in self._slots():
+            vector = index.get(row_id(user_id, slot))
+            if vector is not None:
+                exemplars.append((slot, vector))
+        return centroid, exemplars
+
+    def matrix(self, company_id: str, user_id: str, enrollment: np.ndarray) -> np.ndarray:
+        """مصفوفة القوالب (التسجيل أولاً ثم المركز ثم الأمثلة) مطبّعة float32"""
+        if not self.enabled:
+            return enrollment[np.newaxis]
+        centroid, exemplars = self.learned(company_id, user_id)
+        rows = [enrollment] + ([centroid] if centroid is not None else []) + [v for _, v in exemplars]
+        return np.stack(rows).astype(np.float32, copy=False)
+
+    def update(self, company_id: str, user_id: str, enrollment: np.ndarray, embedding) -> Optional[str]:
+        """تحديث القوالب بوجه تحقق مقبول؛ يُرجع ما تغير (centroid أو exemplar) أو None"""
+        if not self.enabled:
+            return None
+        vector = normalize(embedding)
+        if similarity(enrollment, vector) < self.update_threshold:
+            return None
+
+        with self._lock:
+            centroid, exemplars = self.learned(company_id, user_id)
+            rate = 1 / (len(exemplars) + 2)
+            base = centroid if centroid is not None else enrollment
+            ids = [row_id(user_id, CENTROID)]
+            vectors = [normalize(base + rate * (vector - base))]
+
+            templates = [enrollment] + [v for _, v in exemplars]
+            nearest = max(similarity(t, vector) for t in templates)
+            if nearest < self.duplicate_threshold and self._slots():
+                used = {slot for slot, _ in exemplars}
+                free = [slot for slot in self._slots() if slot not in used]
+                if free:
+                    slot = free[0]
+                else:
+                    slot = max(exemplars, key=lambda e: similarity(e[1], vector))[0]
+                ids.append(row_id(user_id, slot))
+                vectors.append(vector)
+
+            self.registry.upsert_many(company_id, ids, np.stack(vectors))
+            self.updates += 1
+            self.exemplars_added += len(ids) - 1
+        return 'exemplar' if len(ids) > 1 else 'centroid'
+
+    def reset(self, company_id: str, user_id: str) -> int:
+        """حذف القوالب المتعلمة (مثلاً عند تحديث صورة التسجيل)، وإرجاع عددها"""
+        index = self.registry.get(company_id)
+        if index is None:
+            return 0
+        removed = 0
+        with self._lock:
+            for slot in [CENTROID, *self._slots()]:
+                if row_id(user_id, slot) in index:
+                    self.registry.remove(company_id, row_id(user_id, slot))
+                    removed += 1
+        return removed
+
+    def reset_company(self, company_id: str) -> int:
+        """حذف كل القوالب المتعلمة للشركة (مثلاً بعد إبطال مراجعها كاملة)"""
+        index = self.registry.get(company_id)
+        if index is None:
+            return 0
+        removed = 0
+        with self._lock:
+            for row in index.user_ids():
+                self.registry.remove(company_id, row)
+                removed += 1
+        return removed
+
+    def reset_all(self) -> int:
+        return sum(self.reset_company(company_id) for company_id in self.registry.companies())
+
+    def stats(self) -> dict:
+        return {
+            'max_templates': self.max_templates,
+            'updates': self.updates,
+            'exemplars_added': self.exemplars_added
+        }
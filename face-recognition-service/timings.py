@@ -0,0 +1,59 @@
+"""
+توقيت مراحل الطلب - Per-request stage timings
+يُجمع زمن كل مرحلة (فك الترميز، الاكتشاف، المحاذاة، الـ embedding) في flask.g
+ويُتجاهل خارج سياق الطلب (مثل خيوط الدفعات) إلا داخل capture()
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+_captured = threading.local()
+
+
+def start_request() -> None:
+    g.request_started = time.perf_counter()
+    g.timings = {}
+
+
+def record(name: str, ms: float) -> None:
+    """إضافة زمن مرحلة إلى توقيتات الطلب الحالي أو إلى capture() النشط"""
+    if has_request_context():
+        timings = g.setdefault('timings', {})
+    else:
+        timings = getattr(_captured, 'timings', None)
+        if timings is None:
+            return
+    timings[name] = timings.get(name, 0.0) + ms
+
+
+@contextmanager
+def stage(name: str):
+    """قياس مرحلة وإضافة زمنها (بالملي ثانية) إلى توقيتات الطلب الحالي"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+
+
+@contextmanager
+def capture():
+    """جمع توقيتات المراحل خارج سياق الطلب (مثل عمليات مجمع الاستدلال)"""
+    _captured.timings = {}
+    try:
+        yield _captured.timings
+    finally:
+        _captured.timings = None
+
+
+def collected() -> dict:
+    """توقيتات الطلب الحالي مع الزمن الكلي حتى الآن"""
+    if not has_request_context():
+        return {}
+    timings = {name: round(ms, 2) for name, ms in g.get('timings', {}).items()}
+    if 'request_started' in g:
+        timings['total'] = round((time.perf_counter() - g.request_started) * 1000, 2)
+    return timings
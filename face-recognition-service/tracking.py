@@ -0,0 +1,126 @@
+"""
+تتبع الوجوه عبر إطارات الفيديو - Face tracking across video frames
+ربط وجوه كل إطار بمسارات الإطار السابق بتداخل الصناديق (IoU)، بحيث يُحسب
+الـ embedding مرة عند ظهور المسار ثم فقط إذا تحسنت جودة الوجه ولم يُتعرف عليه بعد.
+"""
+
+from typing import List, Optional, Tuple
+
+
+def box_iou(a: dict, b: dict) -> float:
+    """نسبة التقاطع إلى الاتحاد بين صندوقين (x, y, w, h)"""
+    left, top = max(a['x'], b['x']), max(a['y'], b['y'])
+    right = min(a['x'] + a['w'], b['x'] + b['w'])
+    bottom = min(a['y'] + a['h'], b['y'] + b['h'])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = a['w'] * a['h'] + b['w'] * b['h'] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def face_quality(area: dict, confidence: Optional[float]) -> float:
+    """جودة تقريبية للوجه: المساحة بالبكسل × ثقة الكاشف"""
+    return area['w'] * area['h'] * (confidence or 1.0)
+
+
+class Track:
+    __slots__ = ('track_id', 'box', 'first_frame', 'last_frame', 'misses', 'frames',
+                 'embeddings', 'embedded_quality', 'user_id', 'similarity')
+
+    def __init__(self, track_id: int, box: dict, frame: int):
+        self.track_id = track_id
+        self.box = box
+        self.first_frame = frame
+        self.last_frame = frame
+        self.misses = 0
+        self.frames = 1
+        self.embeddings = 0
+        self.embedded_quality = 0.0
+        self.user_id = None
+        self.similarity = None
+
+
+class FaceTracker:
+    """مسارات الوجوه لبث واحد (غير آمن لعدة خيوط؛ كائن لكل اتصال)
+
+    iou_threshold: أدنى تداخل لاعتبار الوجه نفس المسار. max_misses: عدد الإطارات
+    المتتالية بدون الوجه قبل إنهاء المسار. quality_gain: نسبة التحسن في الجودة التي
+    تستدعي embedding جديداً لمسار لم يُتعرف عليه، بحد max_embeddings لكل مسار.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 10,
+                 quality_gain: float = 1.2, max_embeddings: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.quality_gain = quality_gain
+        self.max_embeddings = max_embeddings
+        self.tracks: List[Track] = []
+        self.frame = -1
+        self.started = 0
+        self.embeddings = 0
+        self.identified = 0
+
+    def update(self, boxes: List[dict], qualities: List[float]) -> Tuple[List[Tuple[Track, int]], List[Track]]:
+        """ربط صناديق الإطار التالي بالمسارات
+
+        يُرجع (المسارات التي تحتاج embedding مع رقم صندوقها في الإطار، المسارات المنتهية).
+        الربط جشع بالأعلى تداخلاً أولاً، وهو كافٍ لعدد الوجوه أمام كشك واحد.
+        """
+        self.frame += 1
+        pairs = sorted(
+            ((box_iou(track.box, box), t, b)
+             for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), {}
+        for overlap, t, b in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t not in matched_tracks and b not in matched_boxes:
+                matched_tracks.add(t)
+                matched_boxes[b] = self.tracks[t]
+
+        pending, ended, alive = [], [], []
+        for t, track in enumerate(self.tracks):
+            if t in matched_tracks:
+                alive.append(track)
+                continue
+            track.misses += 1
+            (ended if track.misses > self.max_misses else alive).append(track)
+
+        for b, box in enumerate(boxes):
+            track = matched_boxes.get(b)
+            if track is None:
+                self.started += 1
+                track = Track(self.started, box, self.frame)
+                alive.append(track)
+                pending.append((track, b))
+                continue
+
+            track.box = box
+            track.last_frame = self.frame
+            track.misses = 0
+            track.frames += 1
+            if (track.user_id is None and track.embeddings < self.max_embeddings
+                    and qualities[b] > track.embedded_quality * self.quality_gain):
+                pending.append((track, b))
+
+        self.tracks = alive
+        return pending, ended
+
+    def embedded(self, track: Track, quality: float, user_id: Optional[str], similarity: float) -> bool:
+        """تسجيل embedding جديد للمسار ونتيجة البحث؛ True عند أول تعرف عليه"""
+        track.embeddings += 1
+        track.embedded_quality = quality
+        self.embeddings += 1
+        if user_id is None:
+            track.similarity = max(similarity, track.similarity or 0.0)
+            return False
+        track.user_id = user_id
+        track.similarity = similarity
+        self.identified += 1
+        return True
+
+    def finish(self) -> List[Track]:
+        """إنهاء كل المسارات المتبقية عند نهاية البث"""
+        ended, self.tracks = self.tracks, []
+        return ended